@@ -0,0 +1,220 @@
+"""
+In-process Python API for the MOSbiusV2 subcircuits.
+
+The functions take already-parsed circuit and sizing dicts, share the chip
+configuration loaded once per process, and never print: the warnings of the
+generators are collected in `Netlist.warnings`.
+
+    from commandline import api
+
+    netlist = api.build_switch_matrix(circuit_data)
+    netlist.image.set_registers()    # PROBE registers set to VDD
+    netlist.elements[0]              # Element(name='VCC_N_G_CC_to_RBUS1', ...)
+    text = netlist.render()          # same text as generate_switch_matrix_probe_subckt
+    netlist.write("PK_set_SWMATRIX.cir")
+
+The element records are built on first access only, so callers that need
+just the text or the register image do not pay for them. They are read back
+from the lines the generator renders, so they list exactly the sources of the
+text: with tie_style="connect" the probes tied to VSS by `.connect` are not
+sources and have no record.
+"""
+
+import functools
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from commandline import profiling
+from commandline.chip_config import load_chip_config
+from commandline.dialects import dialect_options
+from commandline.generate_nodes_subckt import nodes_subckt_lines
+from commandline.generate_pins_to_RBUS_SBUS_subckt import pins_to_RBUS_SBUS_subckt_lines
+from commandline.generate_sizes_probe_subckt import sizes_probe_subckt_lines
+from commandline.generate_switch_matrix_probe_subckt import switch_matrix_probe_subckt_lines
+from commandline.incremental import build_hash
+from commandline.netlist_writer import write_netlist
+from commandline.registers import RegisterImage
+from commandline.templates import (NODES_TEMPLATE, PINS_TO_RBUS_SBUS_TEMPLATE, SIZES_TEMPLATE,
+                                   SWITCH_MATRIX_TEMPLATE)
+
+DEFAULT_SOURCE = "commandline.api"
+
+# A zero-volt source as the spice dialect writes it: `name node_plus node_minus 0`
+_SOURCE_LINE = re.compile(r"^(V\S*) (\S+) (\S+) 0$")
+
+
+@dataclass(frozen=True)
+class Element:
+    """A zero-volt source `name node_plus node_minus 0`, with the comment describing it"""
+    name: str
+    node_plus: str
+    node_minus: str
+    comment: Optional[str] = None
+
+
+@dataclass
+class Netlist:
+    """
+    A generated subcircuit.
+
+    Attributes:
+        subckt (str): Name of the subcircuit, e.g. "PK_set_SWMATRIX".
+        source (str): Name of the input recorded in the header.
+        text (str): The netlist text.
+        warnings (list[str]): Warnings reported while generating the netlist.
+        image (RegisterImage): PROBE register values, for the switch matrix and sizes netlists.
+    """
+    subckt: str
+    source: str
+    text: str
+    warnings: List[str]
+    image: Optional[RegisterImage] = None
+    _element_factory: Callable = field(default=None, repr=False, compare=False)
+    _elements: Optional[List[Element]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def elements(self):
+        """list[Element]: The sources of the netlist, in netlist order."""
+        if self._elements is None:
+            # Rendering the netlist again is not counted as generating it
+            with profiling.paused():
+                self._elements = list(self._element_factory())
+        return self._elements
+
+    def render(self):
+        """Returns the netlist text."""
+        return self.text
+
+    def write(self, target):
+        """Writes the netlist to a path, "-" (stdout) or a file-like object."""
+        write_netlist(target, (self.text,))
+
+
+def _generate(lines_function, args, stamp_args, deterministic, dialect=None):
+    stamp = build_hash(*stamp_args) if deterministic else None
+    warnings = []
+    with profiling.stage("render"):
+        text = "".join(lines_function(*args, stamp=stamp, dialect=dialect, warn=warnings.append))
+    return text, warnings
+
+
+def _elements(lines_function, args, defaulted=()):
+    """
+    Yields the sources of a netlist, read from its lines rendered again in the spice dialect.
+
+    Each source gets the comment line above it, except the probes in `defaulted`, which the
+    switch matrix ties to VSS after the last connection without a comment of their own.
+    """
+    comment = None
+    for block in lines_function(*args, warn=[].append):
+        for line in block.splitlines():
+            if line.startswith("*"):
+                comment = line[1:].strip()
+                continue
+            match = _SOURCE_LINE.match(line)
+            if match:
+                name, node_plus, node_minus = match.groups()
+                yield Element(name, node_plus, node_minus, None if node_plus in defaulted else comment)
+
+
+def build_switch_matrix(circuit, source=DEFAULT_SOURCE, tie_style="vsource", deterministic=False, chip_config=None,
+                        dialect=None):
+    """
+    Builds the PK_set_SWMATRIX subcircuit of a circuit description.
+
+    Args:
+        circuit (dict): Parsed circuit JSON.
+        source (str): Name of the circuit recorded in the header.
+        tie_style (str): How probes at VSS are tied off, "vsource" or "connect".
+        deterministic (bool): Record a build hash instead of the creation time.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        dialect (str): Simulator dialect of the text (see commandline.dialects); default "spice".
+
+    Returns:
+        Netlist: The subcircuit, with the register image of the switch matrix.
+    """
+    chip_config = chip_config or load_chip_config()
+    image = RegisterImage.for_chip(chip_config)
+    text, warnings = _generate(
+        switch_matrix_probe_subckt_lines, (circuit, source, chip_config, image, tie_style),
+        (SWITCH_MATRIX_TEMPLATE, circuit, source, chip_config, (tie_style,) + dialect_options(dialect)), deterministic,
+        dialect,
+    )
+    defaulted = {f"PROBE<{probe}>" for probe in image.unassigned(1, chip_config.num_switch_matrix_probes)}
+    elements = functools.partial(_elements, switch_matrix_probe_subckt_lines,
+                                 (circuit, source, chip_config, None, tie_style), defaulted)
+    return Netlist("PK_set_SWMATRIX", source, text, warnings, image, elements)
+
+
+def build_sizes(sizes, source=DEFAULT_SOURCE, tie_style="vsource", deterministic=False, chip_config=None, dialect=None):
+    """
+    Builds the PK_set_sizes_2 subcircuit of a sizing description.
+
+    Args:
+        sizes (dict): Parsed sizing JSON.
+        source (str): Name of the sizing description recorded in the header.
+        tie_style (str): How bits at VSS are tied off, "vsource" or "connect".
+        deterministic (bool): Record a build hash instead of the creation time.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        dialect (str): Simulator dialect of the text (see commandline.dialects); default "spice".
+
+    Returns:
+        Netlist: The subcircuit, with the register image of the device sizes.
+    """
+    chip_config = chip_config or load_chip_config()
+    image = RegisterImage.for_chip(chip_config)
+    text, warnings = _generate(
+        sizes_probe_subckt_lines, (sizes, source, chip_config, image, tie_style),
+        (SIZES_TEMPLATE, sizes, source, chip_config, (tie_style,) + dialect_options(dialect)), deterministic,
+        dialect,
+    )
+    elements = functools.partial(_elements, sizes_probe_subckt_lines, (sizes, source, chip_config, None, tie_style))
+    return Netlist("PK_set_sizes_2", source, text, warnings, image, elements)
+
+
+def build_nodes(circuit, source=DEFAULT_SOURCE, deterministic=False, chip_config=None, dialect=None):
+    """
+    Builds the PK_NODE_external_connections subcircuit of a circuit description.
+
+    Args:
+        circuit (dict): Parsed circuit JSON.
+        source (str): Name of the circuit recorded in the header.
+        deterministic (bool): Record a build hash instead of the creation time.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        dialect (str): Simulator dialect of the text (see commandline.dialects); default "spice".
+
+    Returns:
+        Netlist: The subcircuit.
+    """
+    chip_config = chip_config or load_chip_config()
+    text, warnings = _generate(
+        nodes_subckt_lines, (circuit, source, chip_config),
+        (NODES_TEMPLATE, circuit, source, chip_config, dialect_options(dialect)), deterministic, dialect,
+    )
+    elements = functools.partial(_elements, nodes_subckt_lines, (circuit, source, chip_config))
+    return Netlist("PK_NODE_external_connections", source, text, warnings, None, elements)
+
+
+def build_pins_to_RBUS_SBUS(circuit, source=DEFAULT_SOURCE, deterministic=False, chip_config=None, dialect=None):
+    """
+    Builds the PK_pins_to_RBUS_SWBUS subcircuit of a circuit description.
+
+    Args:
+        circuit (dict): Parsed circuit JSON.
+        source (str): Name of the circuit recorded in the header.
+        deterministic (bool): Record a build hash instead of the creation time.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        dialect (str): Simulator dialect of the text (see commandline.dialects); default "spice".
+
+    Returns:
+        Netlist: The subcircuit.
+    """
+    chip_config = chip_config or load_chip_config()
+    text, warnings = _generate(
+        pins_to_RBUS_SBUS_subckt_lines, (circuit, source, chip_config),
+        (PINS_TO_RBUS_SBUS_TEMPLATE, circuit, source, chip_config, dialect_options(dialect)), deterministic,
+        dialect,
+    )
+    elements = functools.partial(_elements, pins_to_RBUS_SBUS_subckt_lines, (circuit, source, chip_config))
+    return Netlist("PK_pins_to_RBUS_SWBUS", source, text, warnings, None, elements)
@@ -0,0 +1,340 @@
+"""
+Batch generation of the MOSbiusV2 subcircuits for many designs in one process.
+
+The chip configuration and the subckt templates are loaded once and shared by
+all designs, so large design-space sweeps are not dominated by interpreter
+startup and config parsing. Each design gets its own output directory:
+
+    <output_dir>/<design name>/PK_set_SWMATRIX.cir
+    <output_dir>/<design name>/PK_pins_to_RBUS_SWBUS.cir
+    <output_dir>/<design name>/PK_NODE_external_connections.cir
+    <output_dir>/<design name>/PK_set_sizes_2.cir
+
+Designs come either from a manifest, a JSON list of entries such as
+
+    [
+        {"name": "inv5", "circuit": "INV_string_5_RBUS.json", "sizes": "INV_string_5_growing_sizes.json"}
+    ]
+
+(paths are relative to the manifest), or from circuit/sizing JSON files given
+directly or as glob patterns. A sizing file given as a design produces only the
+sizes subcircuit. Optionally the packed register state of each design is
+written next to the netlists as `registers.<bin|hex|json>`.
+
+With `incremental`, netlists whose build hash (see `commandline.incremental`)
+matches the current inputs are left untouched, so re-running a batch only
+rewrites the designs that changed. With a `store` (see `commandline.store`),
+designs equivalent to one generated before, in this batch or an earlier one,
+are copied from the store instead of being generated; the netlist headers
+then name the design that was generated first. The store key of every design
+is written to `store_key.txt`, for attaching simulation results to it.
+"""
+
+import glob
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from commandline import profiling
+from commandline.bitstream import DUMP_FORMATS, write_register_dump
+from commandline.chip_config import load_chip_config
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.generate_nodes_subckt import write_nodes_subckt
+from commandline.generate_pins_to_RBUS_SBUS_subckt import write_pins_to_RBUS_SBUS_subckt
+from commandline.generate_sizes_probe_subckt import validated_device_sizes, write_sizes_probe_subckt
+from commandline.generate_switch_matrix_probe_subckt import write_switch_matrix_probe_subckt
+from commandline.incremental import build_hash, is_up_to_date
+from commandline.netlist_writer import TIE_STYLES
+from commandline.registers import RegisterImage, enable_numpy, map_sizes, map_switch_matrix
+from commandline.store import KEY_FILE, ConfigStore, config_digest
+from commandline.templates import (NODES_TEMPLATE, PINS_TO_RBUS_SBUS_TEMPLATE, SIZES_TEMPLATE,
+                                   SWITCH_MATRIX_TEMPLATE)
+
+
+def _map_sizes(sizes, chip_config, image):
+    map_sizes(validated_device_sizes(sizes, chip_config), chip_config, image)
+
+
+# (file name, writer, template, function filling the register image or None)
+CIRCUIT_OUTPUTS = (
+    ("PK_set_SWMATRIX.cir", write_switch_matrix_probe_subckt, SWITCH_MATRIX_TEMPLATE, map_switch_matrix),
+    ("PK_pins_to_RBUS_SWBUS.cir", write_pins_to_RBUS_SBUS_subckt, PINS_TO_RBUS_SBUS_TEMPLATE, None),
+    ("PK_NODE_external_connections.cir", write_nodes_subckt, NODES_TEMPLATE, None),
+)
+SIZES_OUTPUT = ("PK_set_sizes_2.cir", write_sizes_probe_subckt, SIZES_TEMPLATE, _map_sizes)
+REGISTER_DUMP_NAME = "registers"
+
+# Manifest names become directory names under the output directory
+_DESIGN_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+@dataclass
+class Design:
+    """One design of a batch: a circuit JSON and/or a sizing JSON"""
+    name: str
+    circuit: Optional[str] = None
+    sizes: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    """Summary of a batch run"""
+    designs: int
+    files: int
+    failed: List[str]
+    elapsed: float
+
+
+def is_sizing_data(data, chip_config=None):
+    """Returns True if a parsed JSON is a sizing description rather than a circuit description."""
+    devices = (chip_config or load_chip_config()).sizing_registers
+    return bool(data) and all(key in devices for key in data)
+
+
+def _unique_name(base_name, names):
+    """Returns `base_name`, or `base_name` with the first free suffix _2, _3, ... if it is in `names`; adds it."""
+    name = base_name
+    suffix = 1
+    while name in names:
+        suffix += 1
+        name = f"{base_name}_{suffix}"
+    names.add(name)
+    return name
+
+
+def load_manifest(manifest_path):
+    """
+    Reads a batch manifest.
+
+    Entries without a "name" are named after their circuit (or sizing) file, with a
+    suffix _2, _3, ... where that name is already taken.
+
+    Args:
+        manifest_path (str): Path to a JSON list of {"name", "circuit", "sizes"} entries.
+
+    Returns:
+        list[Design]: The designs, with paths resolved relative to the manifest.
+
+    Raises:
+        ValueError: If an entry has no file, a "name" that is not made of letters, digits and
+            '_', or the same "name" as another entry.
+    """
+    with open(manifest_path, "r") as f:
+        entries = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    designs = []
+    names = set()
+    for number, entry in enumerate(entries, start=1):
+        paths = {key: os.path.join(base_dir, entry[key]) if entry.get(key) else None
+                 for key in ("circuit", "sizes")}
+        if paths["circuit"] is None and paths["sizes"] is None:
+            raise ValueError(f"Manifest entry {number} has neither a 'circuit' nor a 'sizes' file")
+        name = entry.get("name")
+        if name:
+            # Each design writes into the directory of its name
+            if not isinstance(name, str) or not _DESIGN_NAME.match(name):
+                raise ValueError(f"Manifest entry {number} has an invalid name {name!r}: use letters, digits and '_'")
+            if name in names:
+                raise ValueError(f"Manifest entry {number} reuses the name '{name}'")
+            names.add(name)
+        else:
+            name = _unique_name(os.path.splitext(os.path.basename(paths["circuit"] or paths["sizes"]))[0], names)
+        designs.append(Design(name, paths["circuit"], paths["sizes"]))
+    return designs
+
+
+def designs_from_files(patterns, sizes=None, taken=()):
+    """
+    Builds one design per JSON file.
+
+    Args:
+        patterns (list[str]): JSON files or glob patterns.
+        sizes (str): Optional sizing JSON applied to every circuit design.
+        taken (iterable[str]): Names already used by other designs, e.g. of a manifest.
+
+    Returns:
+        list[Design]: The designs, named after the JSON files (with a suffix _2, _3, ...
+            where that name is already taken).
+    """
+    designs = []
+    names = set(taken)
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            name = _unique_name(os.path.splitext(os.path.basename(path))[0], names)
+            designs.append(Design(name, circuit=path, sizes=sizes))
+    return designs
+
+
+def generate_design(design, output_dir, chip_config=None, json_cache=None, dump_format=None, tie_style="vsource",
+                    deterministic=False, incremental=False, dialect=None, store=None):
+    """
+    Writes all subcircuits of one design into `output_dir/<design name>/`.
+
+    Args:
+        design (Design): The design to generate.
+        output_dir (str): Root output directory of the batch.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        json_cache (dict): Optional path -> parsed JSON cache shared across designs.
+        dump_format (str): Also write the register state in this format ("bin", "hex" or "json").
+        tie_style (str): How PROBE registers at VSS are tied off, "vsource" or "connect".
+        deterministic (bool): Record build hashes instead of creation times.
+        incremental (bool): Skip netlists that were already built from the same inputs.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+        store (ConfigStore): Copy the files of an equivalent design from this store if it has
+            them, else store the files written.
+
+    Returns:
+        list[str]: Paths of the files written.
+    """
+    chip_config = chip_config or load_chip_config()
+    json_cache = {} if json_cache is None else json_cache
+
+    def load_json(path):
+        if path not in json_cache:
+            with open(path, "r") as f, profiling.stage("parse"):
+                json_cache[path] = json.load(f)
+        return json_cache[path]
+
+    jobs = []
+    sizes_path = design.sizes
+    if design.circuit is not None:
+        circuit_data = load_json(design.circuit)
+        if is_sizing_data(circuit_data, chip_config):
+            sizes_path = design.circuit
+        else:
+            jobs.extend((output, circuit_data, design.circuit) for output in CIRCUIT_OUTPUTS)
+    if sizes_path is not None:
+        jobs.append((SIZES_OUTPUT, load_json(sizes_path), sizes_path))
+
+    design_dir = os.path.join(output_dir, design.name)
+    os.makedirs(design_dir, exist_ok=True)
+
+    if store is not None:
+        circuit_data = next((data for output, data, _ in jobs if output is not SIZES_OUTPUT), None)
+        sizes_data = next((data for output, data, _ in jobs if output is SIZES_OUTPUT), None)
+        digest = config_digest(circuit_data, sizes_data, chip_config)
+        store_options = (tie_style, get_dialect(dialect).name, dump_format, bool(deterministic or incremental))
+        key = store.key(digest, store_options)
+        with open(os.path.join(design_dir, KEY_FILE), "w") as f:
+            f.write(key + "\n")
+        if store.get(key) is not None:
+            profiling.count("store_hits")
+            return store.export(key, design_dir)
+
+    image = RegisterImage.for_chip(chip_config)
+    written = []
+    for (file_name, writer, template, map_image), data, source in jobs:
+        output_path = os.path.join(design_dir, file_name)
+        options = ((tie_style,) if map_image else ()) + dialect_options(dialect)
+        stamp = build_hash(template, data, source, chip_config, options) if deterministic or incremental else None
+        if incremental and is_up_to_date(output_path, stamp):
+            if map_image and dump_format:
+                map_image(data, chip_config, image)
+            continue
+        if map_image:
+            writer(data, output_path, source, chip_config, image, tie_style, stamp, dialect=dialect)
+        else:
+            writer(data, output_path, source, chip_config, stamp, dialect=dialect)
+        written.append(output_path)
+
+    if dump_format:
+        dump_path = os.path.join(design_dir, f"{REGISTER_DUMP_NAME}.{dump_format}")
+        write_register_dump(image, dump_path, dump_format)
+        written.append(dump_path)
+
+    if store is not None:
+        # Store every output, including the netlists an incremental build left untouched
+        outputs = [os.path.join(design_dir, output[0]) for output, _, _ in jobs]
+        store.put(key, outputs + ([dump_path] if dump_format else []), digest, store_options)
+    return written
+
+
+def run_batch(designs, output_dir, chip_config=None, dump_format=None, tie_style="vsource",
+              deterministic=False, incremental=False, dialect=None, store=None):
+    """
+    Generates the subcircuits for all designs.
+
+    A failing design is reported and skipped; it does not stop the batch.
+
+    Returns:
+        BatchResult: Counts, failed design names and elapsed time.
+    """
+    chip_config = chip_config or load_chip_config()
+    enable_numpy()
+    json_cache = {}
+    failed = []
+    files = 0
+
+    start = time.perf_counter()
+    for design in designs:
+        profiling.count("designs")
+        try:
+            files += len(generate_design(design, output_dir, chip_config, json_cache, dump_format, tie_style,
+                                         deterministic, incremental, dialect, store))
+        except Exception as e:
+            print(f"Error: Design '{design.name}' failed: {type(e).__name__}: {e}")
+            profiling.count("failed_designs")
+            failed.append(design.name)
+        # Circuit files are rarely shared between designs; keep only the shared sizing files
+        if design.circuit is not None and design.circuit != design.sizes:
+            json_cache.pop(design.circuit, None)
+    elapsed = time.perf_counter() - start
+
+    return BatchResult(designs=len(designs), files=files, failed=failed, elapsed=elapsed)
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate the SPICE subcircuits for many designs in one process."
+    )
+    parser.add_argument("inputs", nargs="*", help="Circuit or sizing JSON files, or glob patterns (e.g. 'examples/*.json').")
+    parser.add_argument("-m", "--manifest", help="JSON manifest listing the designs.")
+    parser.add_argument("-s", "--sizes", help="Sizing JSON used for every circuit given in 'inputs'.")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory receiving one sub-directory per design.")
+    parser.add_argument("--register-dump", choices=DUMP_FORMATS, help="Also write the packed register state of each design.")
+    parser.add_argument("--tie-style", choices=TIE_STYLES, default="vsource",
+                        help="Tie PROBE registers at VSS off with zero-volt sources (default) or with .connect node aliases.")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlists (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record build hashes instead of creation times, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip netlists that were already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--store", help="Configuration store: copy equivalent designs from it instead of generating "
+                                        "them, and add the designs generated (see 'mosbius store').")
+
+    args = parser.parse_args(argv)
+    try:
+        get_dialect(args.dialect).check_tie_style(args.tie_style)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        designs = load_manifest(args.manifest) if args.manifest else []
+    except ValueError as e:
+        parser.error(str(e))
+    designs += designs_from_files(args.inputs, sizes=args.sizes, taken=[design.name for design in designs])
+    if not designs:
+        parser.error("no designs given; pass JSON files/patterns or --manifest")
+
+    store = ConfigStore(args.store) if args.store else None
+    result = run_batch(designs, args.output_dir, dump_format=args.register_dump, tie_style=args.tie_style,
+                       deterministic=args.deterministic, incremental=args.incremental, dialect=args.dialect,
+                       store=store)
+
+    rate = result.designs / result.elapsed if result.elapsed > 0 else float("inf")
+    print(f"Generated {result.files} files for {result.designs - len(result.failed)}/{result.designs} designs "
+          f"in {result.elapsed:.2f} s ({rate:.1f} designs/s) into {args.output_dir}")
+    return 1 if result.failed else 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
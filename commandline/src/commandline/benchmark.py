@@ -0,0 +1,302 @@
+"""
+Performance benchmarks of the netlist generators: `mosbius bench`.
+
+The benchmarks run on synthetic stress inputs rather than on the small
+example circuits:
+
+    circuit: every switch-matrix pin on all 8 RBUSes and all 6 SBUSes
+             (cycling through ON/PHI1/PHI2), and every pin on one of the
+             20 NODEs
+    sizes:   a zip sweep over all devices with `sweep_points` points
+
+and measure
+
+    cold_start.<entry point>   wall time (s) and peak RSS (MiB) of a fresh process
+    latency.<netlist>          median and 95th percentile in-process latency (ms)
+    memory.<netlist>           peak Python allocations while building (MiB)
+    batch                      designs per second of `run_batch`
+    sweep                      points per second of `run_sweep` (.alter output)
+
+Each run is appended as one JSON line to a history file and compared with the
+previous run there, so regressions are visible at a glance.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from commandline import api
+from commandline.chip_config import RBUSES, SBUSES, load_chip_config
+from commandline.incremental import tool_version
+from commandline.registers import enable_numpy
+
+BENCHMARKS = ("cold_start", "latency", "batch", "sweep")
+DEFAULT_HISTORY = "mosbius_benchmarks.jsonl"
+NUM_NODES = 20
+SBUS_CONNECTIONS = ("ON", "PHI1", "PHI2")
+
+# Entry point -> (module, stress input it reads)
+COLD_START_ENTRY_POINTS = {
+    "generate_switch_matrix_probe_subckt": ("commandline.generate_switch_matrix_probe_subckt", "circuit"),
+    "generate_sizes_probe_subckt": ("commandline.generate_sizes_probe_subckt", "sizes"),
+    "generate_nodes_subckt": ("commandline.generate_nodes_subckt", "circuit"),
+    "generate_pins_to_RBUS_SBUS_subckt": ("commandline.generate_pins_to_RBUS_SBUS_subckt", "circuit"),
+}
+LATENCY_BUILDERS = {
+    "switch_matrix": (api.build_switch_matrix, "circuit"),
+    "sizes": (api.build_sizes, "sizes"),
+    "nodes": (api.build_nodes, "circuit"),
+    "rbus": (api.build_pins_to_RBUS_SBUS, "circuit"),
+}
+
+
+def stress_circuit(chip_config=None):
+    """Returns a circuit description using every RBUS, SBUS and NODE with all switch-matrix pins."""
+    chip_config = chip_config or load_chip_config()
+    pins = [pin for pin in chip_config.pin_number if chip_config.sw_matrix_pin(pin) is not None]
+
+    circuit = {}
+    for bus in RBUSES:
+        circuit[bus] = list(pins)
+    for bus in SBUSES:
+        circuit[bus] = [{"terminal": pin, "connection": SBUS_CONNECTIONS[index % len(SBUS_CONNECTIONS)]}
+                        for index, pin in enumerate(pins)]
+    for node in range(1, NUM_NODES + 1):
+        circuit[f"NODE<{node}>"] = pins[node - 1::NUM_NODES]
+    return circuit
+
+
+def stress_sizes(num_points=1, chip_config=None):
+    """Returns a sizing description with `num_points` sizes per device (a zip sweep of that length)."""
+    devices = (chip_config or load_chip_config()).sizing_devices
+    return {device: [(point * 7 + offset) % 32 for point in range(num_points)]
+            for offset, device in enumerate(devices)}
+
+
+def _run_process(command):
+    """Runs `command` and returns (wall time in s, peak RSS in MiB or None)."""
+    start = time.perf_counter()
+    # Make this copy of the package importable, also when running from a source tree
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        process.returncode = status  # Reaped here; any non-zero wait status is a failure
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    else:
+        process.wait()
+        elapsed = time.perf_counter() - start
+        peak = None
+    if process.returncode != 0:
+        raise RuntimeError(f"'{' '.join(command)}' failed with status {process.returncode}")
+    return elapsed, peak
+
+
+def bench_cold_start(inputs, work_dir, repeat):
+    """Measures a fresh process per entry point; the best of `repeat` runs is kept."""
+    results = {}
+    for name, (module, input_kind) in COLD_START_ENTRY_POINTS.items():
+        command = [sys.executable, "-m", module, inputs[input_kind], os.path.join(work_dir, f"{name}.cir")]
+        runs = [_run_process(command) for _ in range(repeat)]
+        results[f"cold_start.{name}.s"] = min(elapsed for elapsed, _ in runs)
+        peaks = [peak for _, peak in runs if peak is not None]
+        if peaks:
+            results[f"cold_start.{name}.peak_rss_mib"] = max(peaks)
+    return results
+
+
+def bench_latency(data, chip_config, repeat):
+    """Measures the in-process build time and peak allocations of every netlist."""
+    import tracemalloc
+
+    results = {}
+    for name, (builder, input_kind) in LATENCY_BUILDERS.items():
+        builder(data[input_kind], chip_config=chip_config)  # Warm up
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            builder(data[input_kind], chip_config=chip_config)
+            times.append((time.perf_counter() - start) * 1e3)
+        times.sort()
+        results[f"latency.{name}.median_ms"] = statistics.median(times)
+        results[f"latency.{name}.p95_ms"] = times[min(len(times) - 1, int(0.95 * len(times)))]
+
+        tracemalloc.start()
+        builder(data[input_kind], chip_config=chip_config).elements
+        results[f"memory.{name}.peak_mib"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return results
+
+
+def bench_batch(inputs, work_dir, num_designs, chip_config):
+    """Measures `run_batch` over `num_designs` copies of the stress design."""
+    import contextlib
+    import io
+
+    from commandline.batch import Design, run_batch
+
+    designs = [Design(f"design_{index}", inputs["circuit"], inputs["sizes"]) for index in range(num_designs)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_batch(designs, os.path.join(work_dir, "batch"), chip_config)
+    if result.failed:
+        raise RuntimeError(f"Batch benchmark failed for {', '.join(result.failed)}")
+    return {
+        "batch.designs_per_s": result.designs / result.elapsed,
+        "batch.files_per_s": result.files / result.elapsed,
+    }
+
+
+def bench_sweep(sweep_sizes, work_dir, workers):
+    """Measures a zip sweep over all points of `sweep_sizes` into one .alter netlist."""
+    from commandline.sweep import run_sweep
+
+    result = run_sweep(sweep_sizes, "benchmark", os.path.join(work_dir, "sweep.cir"), mode="zip",
+                       alter=True, workers=workers)
+    return {
+        "sweep.points": result.points,
+        "sweep.points_per_s": result.points / result.elapsed,
+    }
+
+
+def run_benchmarks(benchmarks=BENCHMARKS, repeat=20, cold_repeat=3, batch_designs=50, sweep_points=10000,
+                   workers=None):
+    """
+    Runs the selected benchmarks.
+
+    Args:
+        benchmarks (tuple): Names from `BENCHMARKS`.
+        repeat (int): Repetitions per latency measurement.
+        cold_repeat (int): Process launches per entry point.
+        batch_designs (int): Number of designs in the batch benchmark.
+        sweep_points (int): Number of points in the sweep benchmark.
+        workers (int): Worker processes of the sweep (default: all cores).
+
+    Returns:
+        dict: Metric name -> value.
+    """
+    chip_config = load_chip_config()
+    enable_numpy()
+    data = {"circuit": stress_circuit(chip_config), "sizes": stress_sizes(1, chip_config)}
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mosbius_bench_") as work_dir:
+        inputs = {}
+        for kind, content in data.items():
+            inputs[kind] = os.path.join(work_dir, f"stress_{kind}.json")
+            with open(inputs[kind], "w") as f:
+                json.dump(content, f)
+
+        if "cold_start" in benchmarks:
+            results.update(bench_cold_start(inputs, work_dir, cold_repeat))
+        if "latency" in benchmarks:
+            results.update(bench_latency(data, chip_config, repeat))
+        if "batch" in benchmarks:
+            results.update(bench_batch(inputs, work_dir, batch_designs, chip_config))
+        if "sweep" in benchmarks:
+            results.update(bench_sweep(stress_sizes(sweep_points, chip_config), work_dir, workers))
+    return results
+
+
+def _higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def load_history(path):
+    """Returns the runs recorded in a history file (oldest first)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path, results):
+    """Appends a run with its environment to the history file and returns the record."""
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "version": tool_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": enable_numpy(),
+        "results": results,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def compare_results(results, previous, threshold):
+    """
+    Compares a run with the previous one.
+
+    Returns:
+        list[tuple]: (metric, value, previous value or None, relative change or None,
+            True if the metric got worse by more than `threshold`).
+    """
+    rows = []
+    for metric, value in results.items():
+        old = previous.get(metric)
+        if not old:
+            rows.append((metric, value, None, None, False))
+            continue
+        change = (value - old) / old
+        worse = -change if _higher_is_better(metric) else change
+        rows.append((metric, value, old, change, not metric.endswith(".points") and worse > threshold))
+    return rows
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Benchmark the netlist generators on synthetic stress inputs."
+    )
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all).")
+    parser.add_argument("--history", default=DEFAULT_HISTORY,
+                        help=f"JSON lines file the results are appended to (default: {DEFAULT_HISTORY}).")
+    parser.add_argument("--no-history", action="store_true", help="Do not record the results.")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per latency measurement.")
+    parser.add_argument("--cold-repeat", type=int, default=3, help="Process launches per entry point.")
+    parser.add_argument("--batch-designs", type=int, default=50, help="Designs in the batch benchmark.")
+    parser.add_argument("--sweep-points", type=int, default=10000, help="Points in the sweep benchmark.")
+    parser.add_argument("-j", "--jobs", type=int, help="Worker processes of the sweep (default: all cores).")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default: 0.10).")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if any metric regressed by more than --threshold.")
+
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(tuple(args.only), repeat=args.repeat, cold_repeat=args.cold_repeat,
+                             batch_designs=args.batch_designs, sweep_points=args.sweep_points, workers=args.jobs)
+
+    history = [] if args.no_history else load_history(args.history)
+    previous = history[-1]["results"] if history else {}
+    rows = compare_results(results, previous, args.threshold)
+
+    width = max(len(metric) for metric, *_ in rows)
+    for metric, value, old, change, regressed in rows:
+        line = f"{metric:<{width}}  {value:12.4f}"
+        if change is not None:
+            line += f"  {change:+8.1%} vs {old:.4f}"
+            if regressed:
+                line += "  REGRESSION"
+        print(line)
+
+    if not args.no_history:
+        append_history(args.history, results)
+        print(f"Results appended to {args.history}")
+
+    return 1 if args.fail_on_regression and any(row[4] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Packed register dumps of the chip configuration.
+
+A `RegisterImage` can be stored in three formats:
+
+    bin:  raw bitstream, PROBE<r> is bit r-1, most significant bit first in
+          each byte (2008 registers -> 251 bytes)
+    hex:  the same bitstream as one line of hexadecimal text
+    json: {"format": "mosbius-registers", "version": 1,
+           "num_registers": 2008, "set": [<registers set to VDD>]}
+
+These are orders of magnitude smaller than the PROBE netlists, are cheap to
+compare, and can be fed to the hardware programmer directly.
+"""
+
+import json
+import os
+
+from commandline.registers import RegisterImage
+
+DUMP_FORMATS = ("bin", "hex", "json")
+JSON_FORMAT_NAME = "mosbius-registers"
+JSON_FORMAT_VERSION = 1
+
+
+def pack_registers(image):
+    """Returns the register values of `image` as a packed bitstream (bytes)."""
+    if image.numpy is not None:
+        return image.numpy.packbits(image.values[1:]).tobytes()
+    values = image.values
+    packed = bytearray((image.num_registers + 7) // 8)
+    for register in range(1, image.num_registers + 1):
+        if values[register]:
+            bit = register - 1
+            packed[bit >> 3] |= 0x80 >> (bit & 7)
+    return bytes(packed)
+
+
+def unpack_registers(data, num_registers):
+    """Returns a `RegisterImage` from a packed bitstream; every register counts as assigned."""
+    image = RegisterImage(num_registers)
+    np = image.numpy
+    if np is not None:
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=num_registers)
+        image.scatter(np.arange(1, num_registers + 1), bits)
+    else:
+        image.scatter(range(1, num_registers + 1),
+                      [(data[bit >> 3] >> (7 - (bit & 7))) & 1 for bit in range(num_registers)])
+    return image
+
+
+def format_register_dump(image, dump_format):
+    """Returns the register dump of `image` as bytes in `dump_format` ("bin", "hex" or "json")."""
+    if dump_format == "bin":
+        return pack_registers(image)
+    if dump_format == "hex":
+        return (pack_registers(image).hex() + "\n").encode()
+    if dump_format == "json":
+        return (json.dumps({
+            "format": JSON_FORMAT_NAME,
+            "version": JSON_FORMAT_VERSION,
+            "num_registers": image.num_registers,
+            "set": image.set_registers(),
+        }) + "\n").encode()
+    raise ValueError(f"Unknown register dump format '{dump_format}'; use one of {', '.join(DUMP_FORMATS)}")
+
+
+def dump_format_for_path(path, dump_format=None):
+    """Returns `dump_format`, or the format implied by the extension of `path` (default "bin")."""
+    if dump_format:
+        return dump_format
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in DUMP_FORMATS else "bin"
+
+
+def write_register_dump(image, path, dump_format=None):
+    """Writes the register dump of `image` to `path`; the format defaults to the file extension."""
+    data = format_register_dump(image, dump_format_for_path(path, dump_format))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def parse_register_dump(data, num_registers):
+    """
+    Returns a `RegisterImage` from dump bytes in any of the supported formats.
+
+    Args:
+        data (bytes): Contents of a bin, hex or json register dump.
+        num_registers (int): Number of registers of the chip (used for bin and hex dumps).
+    """
+    text = None
+    try:
+        text = data.decode("ascii").strip()
+    except UnicodeDecodeError:
+        pass
+
+    if text is not None and text.startswith("{"):
+        try:
+            content = json.loads(text)
+        except ValueError:
+            content = None  # A binary dump that happens to look like text
+        if isinstance(content, dict) and content.get("format") == JSON_FORMAT_NAME:
+            image = RegisterImage(content["num_registers"])
+            image.scatter(range(1, image.num_registers + 1), [0] * image.num_registers)
+            image.scatter(content["set"], [1] * len(content["set"]))
+            return image
+
+    packed_size = (num_registers + 7) // 8
+    if text is not None and len(text) == 2 * packed_size:
+        try:
+            return unpack_registers(bytes.fromhex(text), num_registers)
+        except ValueError:
+            pass
+    if len(data) != packed_size:
+        raise ValueError(f"Register dump has {len(data)} bytes, expected {packed_size}")
+    return unpack_registers(data, num_registers)
+
+
+def read_register_dump(path, num_registers):
+    """Reads a register dump file in any of the supported formats."""
+    with open(path, "rb") as f:
+        return parse_register_dump(f.read(), num_registers)
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    from commandline.chip_config import load_chip_config
+    from commandline.generate_sizes_probe_subckt import validated_device_sizes
+    from commandline.registers import build_register_image
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Write the packed register state of a circuit and/or sizing description."
+    )
+    parser.add_argument("output_file", help="Path to the register dump.")
+    parser.add_argument("-c", "--circuit", help="Path to the circuit JSON file.")
+    parser.add_argument("-s", "--sizes", help="Path to the JSON file containing device sizes.")
+    parser.add_argument("--format", choices=DUMP_FORMATS,
+                        help="Format of the register dump (default: from the file extension, else 'bin').")
+
+    args = parser.parse_args(argv)
+    if args.circuit is None and args.sizes is None:
+        parser.error("give --circuit and/or --sizes")
+
+    chip_config = load_chip_config()
+    circuit_data = device_sizes = None
+    if args.circuit:
+        with open(args.circuit, "r") as f:
+            circuit_data = json.load(f)
+    if args.sizes:
+        with open(args.sizes, "r") as f:
+            device_sizes = validated_device_sizes(json.load(f), chip_config)
+
+    image = build_register_image(circuit_data, device_sizes, chip_config)
+    write_register_dump(image, args.output_file, args.format)
+    print(f"Register dump saved to {args.output_file}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Shared access to the MOSbiusV2 chip configuration data.
+
+The JSON maps in `chip_config_data/` are parsed once into a `ChipConfig`
+object with normalized keys and flat, integer-indexed lookup tables:
+
+    pin name -> sw-matrix pin index -> bus index -> PROBE register
+
+The compiled object is memoized per process and persisted as a versioned
+`marshal` cache keyed on the mtime/size of the JSON files (with a content
+hash fallback), so a cold start does not need to parse any JSON at all.
+marshal only handles builtin types but loads faster than pickle and needs no
+extra imports, which matters for the startup time of the command-line tools.
+
+Several chip revisions can be installed side by side: `chip_config_data/`
+is the "current" revision, every `chip_config_data_<name>/` directory next to
+it is revision <name> (e.g. "20250505"). Each revision is compiled and cached
+on its own, and a process keeps every revision it used in memory, so
+switching between revisions costs a dictionary lookup.
+
+Environment variables:
+    MOSBIUS_CACHE_DIR: directory for the binary cache
+        (default: ~/.cache/mosbiusv2tools)
+    MOSBIUS_NO_CACHE: set to disable the on-disk cache
+    MOSBIUS_CHIP_REVISION: revision name or configuration directory used by
+        default (default: "current"); set by the --revision options
+"""
+
+import marshal
+import os
+import sys
+
+from commandline import profiling
+
+CHIP_CONFIG_DIR = os.path.join(os.path.dirname(__file__), "chip_config_data")
+CURRENT_REVISION = "current"
+REVISION_ENV = "MOSBIUS_CHIP_REVISION"
+
+CONFIG_FILES = (
+    "pin_name_to_number.json",
+    "pin_name_to_sw_matrix_pin_number.json",
+    "switch_matrix_register_map.json",
+    "device_name_to_sizing_registers.json",
+)
+
+# Bump whenever the layout of ChipConfig changes to invalidate old caches
+CACHE_VERSION = 3
+
+# Column order of the flat register table
+SBUSES = tuple(f"SBUS{n}" for n in range(1, 7))
+RBUSES = tuple(f"RBUS{n}" for n in range(1, 9))
+BUSES = tuple(f"{sbus}{half}" for sbus in SBUSES for half in "ab") + RBUSES
+BUS_INDEX = {bus: index for index, bus in enumerate(BUSES)}
+
+_loaded_configs = {}
+_revision_dirs = {}
+
+
+def normalize_sw_matrix_pin(sw_matrix_pin):
+    """
+    Returns the key used in `switch_matrix_register_map.json` for a sw-matrix pin.
+
+    The pin map stores numeric pins as numbers (e.g. 92 or 92.0) and the
+    internal buses as strings (e.g. "internal_A"); the register map is always
+    keyed by strings.
+    """
+    if isinstance(sw_matrix_pin, str):
+        return sw_matrix_pin
+    return str(int(sw_matrix_pin))
+
+
+def _register_number(value):
+    """Returns a register number from the register map; entries like "x" or "" mean no register (0)."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class ChipConfig:
+    """
+    Pre-indexed chip configuration data.
+
+    Attributes:
+        config_dir (str): Directory the data was loaded from.
+        pin_number (dict): Pin name -> package pin number.
+        pin_name (dict): Package pin number -> pin name.
+        sw_matrix_pins (tuple): Normalized sw-matrix pin keys, indexed by sw-matrix pin index.
+        sw_matrix_pin_index (dict): Normalized sw-matrix pin key -> sw-matrix pin index.
+        pin_sw_index (dict): Pin name -> sw-matrix pin index.
+        register_table (tuple): Per sw-matrix pin index, a tuple of PROBE registers
+            in `BUSES` order (0 where the bus has no register).
+        sizing_registers (dict): Device name -> tuple of (bit weight, register),
+            sorted by bit weight.
+        sizing_devices (tuple): Device names, sorted.
+        sizing_register_index (tuple): All sizing registers, grouped by device in
+            `sizing_devices` order and sorted by bit weight.
+        sizing_bit_weights (tuple): Bit weight of each entry of `sizing_register_index`.
+        sizing_register_device (tuple): Index into `sizing_devices` of each entry
+            of `sizing_register_index`.
+        num_switch_matrix_probes (int): Highest switch matrix PROBE register.
+        num_registers (int): Highest PROBE register of the chip.
+        digest (str): SHA-256 of the JSON files the data was loaded from.
+    """
+
+    def __init__(self, config_dir, pin_name_to_number, pin_name_to_sw_matrix_pin_number,
+                 switch_matrix_register_map, device_name_to_sizing_registers):
+        self.config_dir = config_dir
+        self.digest = ""
+
+        self.pin_number = {name: int(number) for name, number in pin_name_to_number.items()}
+        self.pin_name = {number: name for name, number in self.pin_number.items()}
+
+        self.sw_matrix_pins = tuple(switch_matrix_register_map)
+        self.sw_matrix_pin_index = {key: index for index, key in enumerate(self.sw_matrix_pins)}
+        self.register_table = tuple(
+            tuple(_register_number(switch_matrix_register_map[key].get(bus, 0)) for bus in BUSES)
+            for key in self.sw_matrix_pins
+        )
+
+        self.pin_sw_index = {}
+        for name, sw_matrix_pin in pin_name_to_sw_matrix_pin_number.items():
+            index = self.sw_matrix_pin_index.get(normalize_sw_matrix_pin(sw_matrix_pin))
+            if index is not None:
+                self.pin_sw_index[name] = index
+
+        self.sizing_registers = {
+            device: tuple(sorted((int(bit), int(register)) for bit, register in bit_to_register.items()))
+            for device, bit_to_register in device_name_to_sizing_registers.items()
+        }
+
+        self.sizing_devices = tuple(sorted(self.sizing_registers))
+        flat_sizing = [(device_index, bit, register)
+                       for device_index, device in enumerate(self.sizing_devices)
+                       for bit, register in self.sizing_registers[device]]
+        self.sizing_register_device = tuple(device_index for device_index, _, _ in flat_sizing)
+        self.sizing_bit_weights = tuple(bit for _, bit, _ in flat_sizing)
+        self.sizing_register_index = tuple(register for _, _, register in flat_sizing)
+
+        self.num_switch_matrix_probes = max(
+            (register for row in self.register_table for register in row), default=0
+        )
+        self.num_registers = max(self.num_switch_matrix_probes, max(self.sizing_register_index, default=0))
+
+    def sw_matrix_pin(self, pin):
+        """Returns the normalized sw-matrix pin key for a pin name, or None."""
+        index = self.pin_sw_index.get(pin)
+        return None if index is None else self.sw_matrix_pins[index]
+
+    def register(self, pin, bus):
+        """Returns the PROBE register connecting `pin` to `bus` (e.g. "RBUS1", "SBUS2a"), or None."""
+        index = self.pin_sw_index.get(pin)
+        column = BUS_INDEX.get(bus)
+        if index is None or column is None:
+            return None
+        return self.register_table[index][column] or None
+
+
+def _default_cache_dir():
+    return os.environ.get("MOSBIUS_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "mosbiusv2tools")
+
+
+def _cache_path(config_dir):
+    import zlib
+
+    tag = f"{zlib.crc32(os.path.abspath(config_dir).encode()):08x}"
+    return os.path.join(_default_cache_dir(), f"chip_config_{tag}.cache")
+
+
+def _stat_signature(config_dir):
+    signature = []
+    for name in CONFIG_FILES:
+        stat = os.stat(os.path.join(config_dir, name))
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _read_cache(path):
+    try:
+        with open(path, "rb") as f:
+            cached = marshal.load(f)
+    except Exception:
+        return None
+    # The marshal format is only stable within a Python version
+    if (not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION
+            or cached.get("python") != sys.version_info[:2]):
+        return None
+    return cached
+
+
+def _config_from_cache(cached, config_dir):
+    config = ChipConfig.__new__(ChipConfig)
+    config.__dict__.update(cached["config"])
+    config.config_dir = config_dir
+    config.digest = cached["digest"]
+    return config
+
+
+def _write_cache(path, signature, digest, config):
+    # Write to a temporary file first so concurrent readers never see a partial cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            marshal.dump({"version": CACHE_VERSION, "python": sys.version_info[:2], "stat": signature,
+                          "digest": digest, "config": vars(config)}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is an optimization only; e.g. a read-only home directory is fine
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _parse_config(config_dir, raw_files):
+    import json
+
+    data = {name: json.loads(raw) for name, raw in raw_files.items()}
+    return ChipConfig(
+        config_dir,
+        pin_name_to_number=data["pin_name_to_number.json"],
+        pin_name_to_sw_matrix_pin_number=data["pin_name_to_sw_matrix_pin_number.json"],
+        switch_matrix_register_map=data["switch_matrix_register_map.json"],
+        device_name_to_sizing_registers=data["device_name_to_sizing_registers.json"],
+    )
+
+
+@profiling.timed("load")
+def _load_chip_config(config_dir):
+    use_cache = not os.environ.get("MOSBIUS_NO_CACHE")
+    signature = _stat_signature(config_dir)
+
+    cache_path = _cache_path(config_dir)
+    cached = _read_cache(cache_path) if use_cache else None
+    if cached is not None and cached["stat"] == signature:
+        return _config_from_cache(cached, config_dir)
+
+    import hashlib
+
+    raw_files = {}
+    for name in CONFIG_FILES:
+        with open(os.path.join(config_dir, name), "rb") as f:
+            raw_files[name] = f.read()
+    digest = hashlib.sha256(b"".join(raw_files[name] for name in CONFIG_FILES)).hexdigest()
+
+    if cached is not None and cached["digest"] == digest:
+        # Files were touched but not changed; refresh the stat signature only
+        config = _config_from_cache(cached, config_dir)
+    else:
+        config = _parse_config(config_dir, raw_files)
+    config.digest = digest
+
+    if use_cache:
+        _write_cache(cache_path, signature, digest, config)
+    return config
+
+
+def chip_config_revisions():
+    """
+    Returns the installed chip revisions.
+
+    Returns:
+        dict: Revision name -> configuration directory, "current" first.
+    """
+    revisions = {CURRENT_REVISION: CHIP_CONFIG_DIR}
+    package_dir = os.path.dirname(CHIP_CONFIG_DIR)
+    prefix = os.path.basename(CHIP_CONFIG_DIR) + "_"
+    for name in sorted(os.listdir(package_dir)):
+        path = os.path.join(package_dir, name)
+        if name.startswith(prefix) and all(os.path.isfile(os.path.join(path, file)) for file in CONFIG_FILES):
+            revisions[name[len(prefix):]] = path
+    return revisions
+
+
+def revision_dir(revision=None):
+    """
+    Returns the configuration directory of a chip revision.
+
+    Args:
+        revision (str): Revision name (see `chip_config_revisions`) or path to a directory with the
+            configuration JSON files; defaults to $MOSBIUS_CHIP_REVISION, else "current".
+
+    Raises:
+        ValueError: If the revision is neither installed nor a directory.
+    """
+    revision = revision or os.environ.get(REVISION_ENV) or CURRENT_REVISION
+    if revision == CURRENT_REVISION:
+        return CHIP_CONFIG_DIR
+    if revision in _revision_dirs:
+        return _revision_dirs[revision]
+    revisions = chip_config_revisions()
+    if revision in revisions:
+        _revision_dirs[revision] = revisions[revision]
+        return revisions[revision]
+    if os.path.isdir(revision):
+        _revision_dirs[revision] = revision
+        return revision
+    raise ValueError(f"Unknown chip revision '{revision}'; use one of {', '.join(revisions)} "
+                     f"or a configuration directory")
+
+
+def set_default_revision(revision):
+    """
+    Makes `revision` the default of `load_chip_config` for this process and the processes it starts.
+
+    Raises:
+        ValueError: If the revision is neither installed nor a directory.
+    """
+    revision_dir(revision)
+    os.environ[REVISION_ENV] = revision
+
+
+def load_chip_config(config_dir=None, revision=None):
+    """
+    Returns the `ChipConfig` for `config_dir`, or else for a chip `revision` (default: the
+    revision set with `set_default_revision`, else the packaged chip_config_data).
+
+    The result is memoized for the lifetime of the process.
+    """
+    config_dir = os.path.abspath(config_dir or revision_dir(revision))
+    config = _loaded_configs.get(config_dir)
+    if config is None:
+        config = _loaded_configs[config_dir] = _load_chip_config(config_dir)
+    return config
@@ -0,0 +1,103 @@
+"""
+The `mosbius` command, a single entry point for the MOSbiusV2 tools.
+
+    mosbius [--revision <chip revision>] [--profile[=<summary.json>]] <subcommand> [options]
+
+--revision selects the chip configuration of every subcommand (see
+commandline.chip_config). --profile prints the time spent per generator stage
+and the counters of the run to stderr, and with a path also writes them as
+JSON (see commandline.profiling); MOSBIUS_CPROFILE=<path> dumps cProfile
+statistics of the run. Only the module of the requested subcommand is imported, so the cost of a
+call does not grow with the number of subcommands.
+"""
+
+import sys
+
+# Subcommand -> (module implementing main(argv, prog), one-line description)
+SUBCOMMANDS = {
+    "switch-matrix": ("commandline.generate_switch_matrix_probe_subckt", "Generate the PK_set_SWMATRIX subcircuit of a circuit."),
+    "sizes": ("commandline.generate_sizes_probe_subckt", "Generate the PK_set_sizes_2 subcircuit of a sizing file."),
+    "nodes": ("commandline.generate_nodes_subckt", "Generate the PK_NODE_external_connections subcircuit."),
+    "rbus": ("commandline.generate_pins_to_RBUS_SBUS_subckt", "Generate the PK_pins_to_RBUS_SWBUS subcircuit."),
+    "multichip": ("commandline.multichip", "Generate one NODE and RBUS netlist for many chips of a board."),
+    "validate": ("commandline.validate", "Check circuit or sizing files without generating netlists."),
+    "nets": ("commandline.connectivity", "List the nets a circuit connects in each clock phase."),
+    "batch": ("commandline.batch", "Generate the subcircuits for many designs in one process."),
+    "sweep": ("commandline.sweep", "Generate sizing subcircuits for every combination of size lists."),
+    "diff": ("commandline.diff", "Write one netlist with an .alter block per configuration variant."),
+    "registers": ("commandline.bitstream", "Write the packed register state of a circuit and sizing."),
+    "serve": ("commandline.server", "Serve netlist requests from memory over a local socket."),
+    "bench": ("commandline.benchmark", "Benchmark the generators on synthetic stress inputs."),
+    "fuzz": ("commandline.fuzz", "Generate seeded random circuit and sizing JSONs for stress tests."),
+    "compile-config": ("commandline.compile_config", "Compile the chip spreadsheet CSVs into the configuration maps."),
+    "decode": ("commandline.decode", "Decode PROBE netlists or register dumps back into circuit and sizing JSON."),
+    "store": ("commandline.store", "List, export or attach simulation artifacts to configuration store entries."),
+}
+
+
+def print_usage(file=sys.stdout):
+    from commandline.chip_config import chip_config_revisions
+
+    print("usage: mosbius [--revision <chip revision>] [--profile[=<summary.json>]] <subcommand> [options]\n",
+          file=file)
+    print("subcommands:", file=file)
+    width = max(len(name) for name in SUBCOMMANDS)
+    for name, (_, description) in SUBCOMMANDS.items():
+        print(f"  {name:<{width}}  {description}", file=file)
+    print(f"\nchip revisions: {', '.join(chip_config_revisions())} (default: current)", file=file)
+    print("\nRun 'mosbius <subcommand> --help' for the options of a subcommand.", file=file)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    profile_path = None  # "" for --profile without a summary file
+    while argv and argv[0].partition("=")[0] in ("--revision", "--profile"):
+        if argv[0].startswith("--profile"):
+            # The summary path can only be given with '=', the next argument is the subcommand
+            profile_path = argv.pop(0).partition("=")[2]
+            continue
+
+        from commandline.chip_config import set_default_revision
+
+        revision = argv[0].partition("=")[2] if "=" in argv[0] else (argv[1] if len(argv) > 1 else "")
+        argv = argv[1:] if "=" in argv[0] else argv[2:]
+        try:
+            if not revision:
+                raise ValueError("--revision needs a chip revision name or configuration directory")
+            set_default_revision(revision)
+        except ValueError as e:
+            print(f"mosbius: {e}", file=sys.stderr)
+            return 2
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        return 0
+
+    subcommand = argv[0]
+    if subcommand not in SUBCOMMANDS:
+        print(f"mosbius: unknown subcommand '{subcommand}'\n", file=sys.stderr)
+        print_usage(file=sys.stderr)
+        return 2
+
+    import importlib
+
+    from commandline import profiling
+
+    module_name, _ = SUBCOMMANDS[subcommand]
+    with profiling.cprofiled():
+        module = importlib.import_module(module_name)
+        if profile_path is None:
+            return module.main(argv[1:], prog=f"mosbius {subcommand}")
+        profile = profiling.Profile()
+        try:
+            with profiling.profiled(profile):
+                return module.main(argv[1:], prog=f"mosbius {subcommand}")
+        finally:
+            print(profile.report(), file=sys.stderr)
+            if profile_path:
+                profiling.write_summary(profile, profile_path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+Compilation of the chip spreadsheets into chip configuration data: `mosbius compile-config`.
+
+The chip configuration JSON maps are derived from three CSV exports of the
+MOSbiusV2 spreadsheets (see `chip_config_data/csv_sources/`):
+
+    pin list        pin_number,sw_matrix_pin_number,pin_name
+    analog sizing   Reg Names,Reg Numbers            (e.g. OTA_P_1,1889)
+    swmatrix        two header rows (SBUS/RBUS, then 1a..6b and 1..8),
+                    one row per sw-matrix pin or internal bus
+
+This module replaces the csv_to_dictionaries notebook. Each CSV is read once,
+row by row, and the maps are checked for consistency before anything is
+written:
+
+    - every sw-matrix pin has all 12 SBUSa/b and 8 RBUS registers, every
+      internal bus all 12 SBUSa/b registers
+    - every register number is used once, and the switch-matrix registers
+      cover 1..<highest register> without gaps
+    - every sizing register is a bit 1, 2, 4, 8 or 16 of a device
+    - pin names and numbers map one-to-one, and the sw-matrix pins of the
+      pin list exist in the swmatrix CSV
+
+The JSON maps are then written together with the binary cache of the
+compiled `ChipConfig`, so the first tool run on the new data starts warm.
+A manifest with the SHA-256 of the CSVs is stored next to the maps; when the
+CSVs have not changed, compiling again does nothing.
+"""
+
+import csv
+import hashlib
+import json
+import os
+
+from commandline.chip_config import BUSES, CONFIG_FILES, RBUSES, load_chip_config
+from commandline.incremental import tool_version
+
+MANIFEST_FILE = "csv_sources.json"
+INTERNAL_PIN_PREFIX = "internal_"
+SWMATRIX_PIN = "swmatrix_pin"
+SWMATRIX_INTERNAL_PIN = "swmatrix_int_pin"
+SIZING_BIT_WEIGHTS = (1, 2, 4, 8, 16)
+
+OUTPUT_FILES = CONFIG_FILES + ("pin_number_to_name.json",)
+
+# Buses every sw-matrix pin (all) and every internal bus (SBUS only) must connect to
+SW_MATRIX_PIN_BUSES = BUSES
+INTERNAL_PIN_BUSES = tuple(bus for bus in BUSES if bus not in RBUSES)
+
+
+class ConfigCompileError(ValueError):
+    """Raised when the CSVs are malformed or inconsistent; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("\n".join(self.errors))
+
+
+def _rows(path):
+    # utf-8-sig drops the byte-order mark some spreadsheet exports start with
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        for line_number, row in enumerate(csv.reader(f), start=1):
+            row = [cell.strip() for cell in row]
+            if any(row):
+                yield line_number, row
+
+
+def _number(value):
+    """Returns a spreadsheet cell as an int (e.g. "92" or "92.0"), or None if it is not a whole number."""
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def read_pin_list(path, errors):
+    """
+    Reads the pin list CSV.
+
+    Returns:
+        tuple: pin name -> package pin number, and pin name -> sw-matrix pin number (int).
+    """
+    pin_name_to_number = {}
+    pin_name_to_sw_matrix_pin_number = {}
+    number_to_name = {}
+    rows = _rows(path)
+    _, header = next(rows, (0, []))
+    try:
+        columns = [header.index(name) for name in ("pin_number", "sw_matrix_pin_number", "pin_name")]
+    except ValueError:
+        errors.append(f"{path}: the header must have pin_number, sw_matrix_pin_number and pin_name columns")
+        return pin_name_to_number, pin_name_to_sw_matrix_pin_number
+
+    for line_number, row in rows:
+        row += [""] * (len(header) - len(row))
+        number, sw_matrix_pin, name = (row[column] for column in columns)
+        if not name or not number:
+            continue  # Rows without a package pin, like the notebook's dropna
+        where = f"{path}:{line_number}"
+        pin_number = _number(number)
+        if pin_number is None:
+            errors.append(f"{where}: pin number '{number}' of {name} is not a number")
+            continue
+        if pin_name_to_number.setdefault(name, pin_number) != pin_number:
+            errors.append(f"{where}: {name} is on pins {pin_name_to_number[name]} and {pin_number}")
+        if number_to_name.setdefault(pin_number, name) != name:
+            errors.append(f"{where}: pin {pin_number} is named both {number_to_name[pin_number]} and {name}")
+        if sw_matrix_pin:
+            sw_matrix_pin_number = _number(sw_matrix_pin)
+            if sw_matrix_pin_number is None:
+                errors.append(f"{where}: sw-matrix pin '{sw_matrix_pin}' of {name} is not a number")
+            elif pin_name_to_sw_matrix_pin_number.setdefault(name, sw_matrix_pin_number) != sw_matrix_pin_number:
+                errors.append(f"{where}: {name} is on sw-matrix pins "
+                              f"{pin_name_to_sw_matrix_pin_number[name]} and {sw_matrix_pin_number}")
+    return pin_name_to_number, pin_name_to_sw_matrix_pin_number
+
+
+def read_sizing(path, errors):
+    """
+    Reads the analog sizing CSV.
+
+    Returns:
+        dict: Device name -> {bit weight: register}, sorted by bit weight.
+    """
+    devices = {}
+    rows = _rows(path)
+    _, header = next(rows, (0, []))
+    try:
+        name_column, register_column = header.index("Reg Names"), header.index("Reg Numbers")
+    except ValueError:
+        errors.append(f"{path}: the header must have Reg Names and Reg Numbers columns")
+        return devices
+
+    for line_number, row in rows:
+        where = f"{path}:{line_number}"
+        row += [""] * (len(header) - len(row))
+        reg_name, register = row[name_column], _number(row[register_column])
+        device, _, bit = reg_name.rpartition("_")
+        weight = _number(bit) if device else None
+        if weight not in SIZING_BIT_WEIGHTS:
+            errors.append(f"{where}: '{reg_name}' is not <device>_<bit weight 1, 2, 4, 8 or 16>")
+            continue
+        if register is None:
+            errors.append(f"{where}: register '{row[register_column]}' of {reg_name} is not a number")
+            continue
+        if weight in devices.setdefault(device, {}):
+            errors.append(f"{where}: {reg_name} is listed more than once")
+        devices[device][weight] = register
+
+    for device, bits in devices.items():
+        missing = [str(weight) for weight in SIZING_BIT_WEIGHTS if weight not in bits]
+        if missing:
+            errors.append(f"{path}: {device} has no register for bit weight {', '.join(missing)}")
+    return {device: dict(sorted(bits.items())) for device, bits in devices.items()}
+
+
+def read_swmatrix(path, errors):
+    """
+    Reads the swmatrix CSV.
+
+    Internal buses (the swmatrix_int_pin rows "A".."D") are keyed "internal_A".."internal_D", as in the
+    pin map. Cells with "x" mean the pin has no switch to that bus.
+
+    Returns:
+        dict: sw-matrix pin key -> {bus: register (str), "display_name": pin name}.
+    """
+    register_map = {}
+    rows = _rows(path)
+    _, bus_types = next(rows, (0, []))
+    _, column_ids = next(rows, (0, []))
+
+    # Combine the two header rows into bus names; the first two columns are the pin, the last the pin name
+    columns = {}
+    bus_type = ""
+    for column in range(2, len(column_ids) - 1):
+        bus_type = (bus_types[column] if column < len(bus_types) else "") or bus_type
+        if bus_type and column_ids[column]:
+            columns[column] = f"{bus_type}{column_ids[column]}"
+    unknown = [bus for bus in columns.values() if bus not in SW_MATRIX_PIN_BUSES]
+    if unknown or not columns:
+        errors.append(f"{path}: the header rows must name the SBUS1a..SBUS6b and RBUS1..RBUS8 columns"
+                      + (f", not {', '.join(unknown)}" if unknown else ""))
+        return register_map
+
+    for line_number, row in rows:
+        where = f"{path}:{line_number}"
+        pin_type, pin = row[0], row[1] if len(row) > 1 else ""
+        if pin_type == SWMATRIX_PIN:
+            if _number(pin) is None:
+                errors.append(f"{where}: sw-matrix pin '{pin}' is not a number")
+                continue
+            key, required = str(_number(pin)), SW_MATRIX_PIN_BUSES
+        elif pin_type == SWMATRIX_INTERNAL_PIN:
+            key, required = f"{INTERNAL_PIN_PREFIX}{pin}", INTERNAL_PIN_BUSES
+        else:
+            errors.append(f"{where}: unknown row type '{pin_type}'; use {SWMATRIX_PIN} or {SWMATRIX_INTERNAL_PIN}")
+            continue
+        if key in register_map:
+            errors.append(f"{where}: sw-matrix pin {key} is listed more than once")
+            continue
+
+        entry = register_map[key] = {}
+        for column, bus in columns.items():
+            value = row[column] if column < len(row) else ""
+            if not value or value.lower() == "x":
+                continue
+            register = _number(value)
+            if register is None:
+                errors.append(f"{where}: register '{value}' of {key} on {bus} is not a number")
+                continue
+            entry[bus] = str(register)
+        missing = [bus for bus in required if bus not in entry]
+        if missing:
+            errors.append(f"{where}: sw-matrix pin {key} has no register for {', '.join(missing)}")
+        if len(row) > len(column_ids) - 1 and row[len(column_ids) - 1]:
+            entry["display_name"] = row[len(column_ids) - 1]
+    return register_map
+
+
+def check_registers(switch_matrix_register_map, device_name_to_sizing_registers, errors):
+    """Checks that every register is used once and that the switch-matrix registers have no gaps."""
+    owners = {}
+
+    def claim(register, owner):
+        if register in owners:
+            errors.append(f"Register {register} is used by both {owners[register]} and {owner}")
+        else:
+            owners[register] = owner
+
+    for key, entry in switch_matrix_register_map.items():
+        for bus, register in entry.items():
+            if bus != "display_name":
+                claim(int(register), f"sw-matrix pin {key} on {bus}")
+    num_switch_matrix_probes = max(owners, default=0)
+    missing = [register for register in range(1, num_switch_matrix_probes + 1) if register not in owners]
+    if missing:
+        shown = ", ".join(str(register) for register in missing[:10])
+        errors.append(f"Switch-matrix registers 1..{num_switch_matrix_probes} do not cover {shown}"
+                      + (f" and {len(missing) - 10} more" if len(missing) > 10 else ""))
+
+    for device, bits in device_name_to_sizing_registers.items():
+        for weight, register in bits.items():
+            if register < 1:
+                errors.append(f"Register {register} of {device} bit {weight} is not a PROBE register")
+            claim(register, f"{device} bit {weight}")
+
+
+def compile_config(pin_list_csv, sizing_csv, swmatrix_csv):
+    """
+    Reads and checks the three CSVs.
+
+    Args:
+        pin_list_csv (str): Path to the pin list CSV.
+        sizing_csv (str): Path to the analog sizing CSV.
+        swmatrix_csv (str): Path to the swmatrix CSV.
+
+    Returns:
+        dict: JSON file name -> map, for every file in `OUTPUT_FILES`.
+
+    Raises:
+        ConfigCompileError: If the CSVs are malformed or inconsistent.
+    """
+    errors = []
+    pin_name_to_number, pin_sw_matrix_numbers = read_pin_list(pin_list_csv, errors)
+    device_name_to_sizing_registers = read_sizing(sizing_csv, errors)
+    switch_matrix_register_map = read_swmatrix(swmatrix_csv, errors)
+
+    # Internal buses have no package pin; they map to their own sw-matrix key
+    pin_name_to_sw_matrix_pin_number = {key: key for key in switch_matrix_register_map
+                                        if key.startswith(INTERNAL_PIN_PREFIX)}
+    for name, sw_matrix_pin in pin_sw_matrix_numbers.items():
+        if str(sw_matrix_pin) not in switch_matrix_register_map:
+            errors.append(f"{pin_list_csv}: sw-matrix pin {sw_matrix_pin} of {name} is not in {swmatrix_csv}")
+        pin_name_to_sw_matrix_pin_number[name] = sw_matrix_pin
+
+    check_registers(switch_matrix_register_map, device_name_to_sizing_registers, errors)
+    if errors:
+        raise ConfigCompileError(errors)
+
+    return {
+        "pin_name_to_number.json": pin_name_to_number,
+        "pin_number_to_name.json": {number: name for name, number in pin_name_to_number.items()},
+        "pin_name_to_sw_matrix_pin_number.json": pin_name_to_sw_matrix_pin_number,
+        "switch_matrix_register_map.json": switch_matrix_register_map,
+        "device_name_to_sizing_registers.json": device_name_to_sizing_registers,
+    }
+
+
+def source_hashes(paths):
+    """Returns {file name: "sha256:<hex digest>"} of the CSVs at `paths`."""
+    hashes = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        hashes[os.path.basename(path)] = f"sha256:{digest.hexdigest()}"
+    return hashes
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_up_to_date(output_dir, manifest):
+    """Returns True if `output_dir` has every map and was compiled from the sources in `manifest`."""
+    return (_read_manifest(output_dir) == manifest
+            and all(os.path.isfile(os.path.join(output_dir, name)) for name in OUTPUT_FILES))
+
+
+def write_config(pin_list_csv, sizing_csv, swmatrix_csv, output_dir, force=False):
+    """
+    Compiles the CSVs into the chip configuration JSON maps in `output_dir` and warms the binary cache.
+
+    Args:
+        pin_list_csv (str): Path to the pin list CSV.
+        sizing_csv (str): Path to the analog sizing CSV.
+        swmatrix_csv (str): Path to the swmatrix CSV.
+        output_dir (str): Directory for the JSON maps; created if needed.
+        force (bool): Compile even if the CSVs did not change since the last run.
+
+    Returns:
+        bool: True if the maps were written, False if they were up to date.
+
+    Raises:
+        ConfigCompileError: If the CSVs are malformed or inconsistent; nothing is written then.
+    """
+    sources = (pin_list_csv, sizing_csv, swmatrix_csv)
+    manifest = {"version": tool_version(), "sources": source_hashes(sources)}
+    if not force and is_up_to_date(output_dir, manifest):
+        return False
+
+    maps = compile_config(*sources)
+    os.makedirs(output_dir, exist_ok=True)
+    for name in OUTPUT_FILES:
+        with open(os.path.join(output_dir, name), "w") as f:
+            json.dump(maps[name], f, indent=4)
+    # Build the ChipConfig once so its binary cache is written now, not on the first tool run
+    load_chip_config(output_dir)
+    # The manifest goes last, so an interrupted run is redone
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=4)
+    return True
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Compile the pin list, analog sizing and swmatrix CSVs into the chip configuration JSON maps."
+    )
+    parser.add_argument("pin_list_csv", help="Path to the pin list CSV (pin_number,sw_matrix_pin_number,pin_name).")
+    parser.add_argument("sizing_csv", help="Path to the analog sizing CSV (Reg Names,Reg Numbers).")
+    parser.add_argument("swmatrix_csv", help="Path to the swmatrix CSV.")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="Directory for the JSON maps (default: the current directory).")
+    parser.add_argument("--force", action="store_true", help="Compile even if the CSVs did not change.")
+    parser.add_argument("--check", action="store_true", help="Only check the CSVs; do not write anything.")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            maps = compile_config(args.pin_list_csv, args.sizing_csv, args.swmatrix_csv)
+            print(f"CSVs are consistent: {len(maps['pin_name_to_number.json'])} pins, "
+                  f"{len(maps['switch_matrix_register_map.json'])} sw-matrix pins, "
+                  f"{len(maps['device_name_to_sizing_registers.json'])} sizing devices")
+            return 0
+        written = write_config(args.pin_list_csv, args.sizing_csv, args.swmatrix_csv, args.output_dir, args.force)
+    except ConfigCompileError as e:
+        for error in e.errors:
+            print(f"Error: {error}")
+        return 1
+
+    if written:
+        print(f"Chip configuration compiled to {args.output_dir}")
+    else:
+        print(f"Chip configuration in {args.output_dir} is up to date")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Electrical connectivity of a circuit description: `mosbius nets`.
+
+The four generators each render one part of a circuit JSON (switch matrix,
+sizes, external NODEs, RBUS/SBUS pins). `Connectivity` models what the
+circuit actually connects, across all of them:
+
+    static      RBUS members, NODE<n> members, pins shorted to VDD/VSS, and
+                every SBUS to its package pin (SBUS1..5, DATA_SBUS6)
+    switched    SBUS terminals, closed in PHI1, PHI2 or both ("ON")
+
+Nets are resolved with union-find for each view of the clock:
+
+    "ON"    connections that are closed in both phases
+    "PHI1"  connections closed while PHI1 is high
+    "PHI2"  connections closed while PHI2 is high
+
+After construction every pin maps to its net with a single table lookup, so
+queries like "which pins share a net in PHI1" take constant time:
+
+    from commandline.connectivity import Connectivity
+
+    nets = Connectivity(circuit)
+    nets.connected("OTA_N_INN", "internal_A", "PHI1")
+    nets.net("OTA_N_OUT")           # frozenset of the pins on the same net
+
+Entries the netlists ignore (unknown pins, pins without a switch to their
+bus, unknown SBUS connections) do not connect anything; use
+commandline.validate to report them.
+"""
+
+import json
+
+from commandline.chip_config import load_chip_config
+from commandline.registers import SBUS_CONNECTION_VALUES
+
+PHASES = ("ON", "PHI1", "PHI2")
+
+# SBUS -> package pin it is brought out on (see PK_pins_to_RBUS_SWBUS)
+SBUS_PINS = {f"SBUS{n}": "DATA_SBUS6" if n == 6 else f"SBUS{n}" for n in range(1, 7)}
+
+
+def _find(parent, element):
+    # Path halving keeps the trees flat without recursion
+    while parent[element] != element:
+        parent[element] = parent[parent[element]]
+        element = parent[element]
+    return element
+
+
+def _resolve(num_elements, edge_lists):
+    """Returns the root of every element after merging all edges of `edge_lists`."""
+    parent = list(range(num_elements))
+    size = [1] * num_elements
+    for edges in edge_lists:
+        for a, b in edges:
+            root_a, root_b = _find(parent, a), _find(parent, b)
+            if root_a == root_b:
+                continue
+            if size[root_a] < size[root_b]:
+                root_a, root_b = root_b, root_a
+            parent[root_b] = root_a
+            size[root_a] += size[root_b]
+    return tuple(_find(parent, element) for element in range(num_elements))
+
+
+class Connectivity:
+    """
+    Nets of a circuit description, per clock phase.
+
+    Args:
+        circuit (dict): Parsed circuit JSON.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Attributes:
+        names (tuple): Pin and bus names, indexed by element number.
+        index (dict): Name -> element number.
+        roots (dict): Phase -> tuple with the net (root element) of every element.
+    """
+
+    def __init__(self, circuit, chip_config=None):
+        chip_config = chip_config or load_chip_config()
+        pin_number = chip_config.pin_number
+        pin_sw_index = chip_config.pin_sw_index
+
+        # Every pin of the chip is an element, so queries on unused pins work too
+        names = list(pin_number)
+        names += [pin for pin in pin_sw_index if pin not in pin_number]
+        self._pins = frozenset(names)
+        index = {name: element for element, name in enumerate(names)}
+
+        def element(name):
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+            return index[name]
+
+        static = [(element(bus), element(pin)) for bus, pin in SBUS_PINS.items()]
+        switched = {"PHI1": [], "PHI2": []}
+        for bus, entries in circuit.items():
+            if not isinstance(entries, list):
+                continue
+            if bus.startswith("RBUS"):
+                static += [(element(bus), index[pin]) for pin in entries
+                           if isinstance(pin, str) and chip_config.register(pin, bus) is not None]
+            elif bus.startswith("SBUS"):
+                for entry in entries:
+                    if not isinstance(entry, dict):
+                        continue
+                    terminal = entry.get("terminal")
+                    phi1, phi2 = SBUS_CONNECTION_VALUES.get(entry.get("connection"), (0, 0))
+                    if (chip_config.register(terminal, f"{bus}a") is None
+                            or chip_config.register(terminal, f"{bus}b") is None):
+                        continue
+                    edge = (element(bus), index[terminal])
+                    if phi1 and phi2:
+                        static.append(edge)  # Closed in both phases
+                    elif phi1:
+                        switched["PHI1"].append(edge)
+                    elif phi2:
+                        switched["PHI2"].append(edge)
+            else:
+                # VDD/VSS shorts go to the supply pins of the same name, NODE<n> to the external node
+                if bus in ("VDD", "VSS"):
+                    net = bus
+                else:
+                    try:
+                        net = f"NODE<{int(bus.replace('NODE', '').strip('<>'))}>"
+                    except ValueError:
+                        continue
+                static += [(element(net), index[pin]) for pin in entries if isinstance(pin, str) and pin in pin_number]
+
+        self.names = tuple(names)
+        self.index = index
+        self.roots = {
+            "ON": _resolve(len(names), (static,)),
+            "PHI1": _resolve(len(names), (static, switched["PHI1"])),
+            "PHI2": _resolve(len(names), (static, switched["PHI2"])),
+        }
+        self._members = {}
+        self._labels = {}
+
+    def _root(self, pin, phase):
+        roots = self.roots.get(phase)
+        if roots is None:
+            raise ValueError(f"Unknown phase '{phase}'; use one of {', '.join(PHASES)}")
+        element = self.index.get(pin)
+        if element is None:
+            raise KeyError(f"Unknown pin or bus '{pin}'")
+        return roots[element]
+
+    def _net_members(self, phase):
+        members = self._members.get(phase)
+        if members is None:
+            groups = {}
+            for element, root in enumerate(self.roots[phase]):
+                name = self.names[element]
+                if name in self._pins:
+                    groups.setdefault(root, []).append(name)
+            members = self._members[phase] = {root: frozenset(pins) for root, pins in groups.items()}
+        return members
+
+    def connected(self, a, b, phase="ON"):
+        """Returns True if the pins (or buses) `a` and `b` are on the same net in `phase`."""
+        try:
+            roots = self.roots[phase]
+            return roots[self.index[a]] == roots[self.index[b]]
+        except KeyError:
+            # Raise the descriptive error for the bad phase or name
+            return self._root(a, phase) == self._root(b, phase)
+
+    def net(self, pin, phase="ON"):
+        """Returns the pins on the same net as the pin (or bus) `pin` in `phase`, including itself."""
+        return self._net_members(phase).get(self._root(pin, phase), frozenset())
+
+    def nets(self, phase="ON"):
+        """Returns the nets of `phase` that connect two or more pins, each as a sorted tuple of pins."""
+        self._root(self.names[0], phase)  # Validates the phase
+        return sorted(tuple(sorted(pins)) for pins in self._net_members(phase).values() if len(pins) > 1)
+
+    def net_name(self, pin, phase="ON"):
+        """
+        Returns a name for the net of `pin` in `phase`: the supply, NODE, RBUS or SBUS on it, else the
+        first pin name.
+        """
+        root = self._root(pin, phase)
+        labels = self._labels.get(phase)
+        if labels is None:
+            labels = self._labels[phase] = {}
+            ranked = sorted(range(len(self.names)), key=lambda element: _label_rank(self.names[element]))
+            for element in ranked:
+                labels.setdefault(self.roots[phase][element], self.names[element])
+        return labels[root]
+
+
+def _label_rank(name):
+    for rank, prefix in enumerate(("VDD", "VSS", "NODE", "RBUS", "SBUS")):
+        if name.startswith(prefix):
+            return rank, name
+    return 5, name
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="List the nets a circuit JSON connects, per clock phase.")
+    parser.add_argument("circuit_json_path", help="Path to the circuit JSON file.")
+    parser.add_argument("--phase", choices=PHASES, nargs="+", default=list(PHASES),
+                        help="Phases to list (default: all).")
+    parser.add_argument("--json", action="store_true", help="Print {phase: [[pins of a net], ...]} as JSON.")
+
+    args = parser.parse_args(argv)
+
+    with open(args.circuit_json_path, "r") as f:
+        connectivity = Connectivity(json.load(f))
+
+    if args.json:
+        print(json.dumps({phase: connectivity.nets(phase) for phase in args.phase}, indent=2))
+        return 0
+    for phase in args.phase:
+        print(f"{phase}:")
+        for pins in connectivity.nets(phase):
+            print(f"  {connectivity.net_name(pins[0], phase)}: {' '.join(pins)}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
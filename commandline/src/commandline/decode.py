@@ -0,0 +1,452 @@
+"""
+Decoding of PROBE netlists and register dumps back into JSON: `mosbius decode`.
+
+The PK_set_SWMATRIX and PK_set_sizes_2 netlists (and the register dumps of
+commandline.bitstream) fix the level of every PROBE register. The decoder
+reads a netlist line by line, collects the register levels, and maps the
+registers set to VDD back with an inverted index of the chip configuration:
+
+    switch matrix register -> (sw-matrix pin, bus)    RBUS pins, SBUS phases
+    sizing register        -> (device, bit weight)    device sizes
+
+    from commandline.decode import decode_file
+
+    for config in decode_file("PK_set_SWMATRIX.cir"):
+        config.kind         # "circuit"
+        config.data         # {"RBUS1": [...], "SBUS2": [{"terminal": ..., "connection": "PHI1"}]}
+
+All netlist dialects (commandline.dialects) and tie styles are understood. In
+compact netlists the parameter defaults (`.param probe_<n>=0|1`,
+`.param size_<device>=<size>`) give the levels of the parameter-driven
+registers, and every `.alter` block of a diff or sweep netlist is decoded as
+a variant of its own. A register dump holds the whole chip and decodes into a
+circuit and a sizing description.
+
+The decoded circuit only contains what the PROBE registers set: the RBUS pins
+and the SBUS connections. NODEs and supplies are part of the
+PK_NODE_external_connections netlist and are not decoded. Pins whose SBUS
+registers are both at VSS are left out.
+
+`decode_files` decodes whole directories on a process pool, and
+`write_archive` writes every distinct configuration once, named after its
+digest, with an index mapping each file to its configuration:
+
+    mosbius decode archive/ -o decoded -j 8
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from commandline.bitstream import DUMP_FORMATS, read_register_dump
+from commandline.chip_config import BUSES, load_chip_config
+from commandline.generate_sizes_probe_subckt import size_param
+from commandline.registers import SBUS_CONNECTION_VALUES
+
+NETLIST_EXTENSIONS = (".cir", ".sp", ".spi", ".spice", ".scs", ".net")
+DUMP_EXTENSIONS = tuple(f".{dump_format}" for dump_format in DUMP_FORMATS)
+INDEX_NAME = "index.jsonl"
+
+SWITCH_MATRIX_SUBCKT = "PK_set_SWMATRIX"
+SIZES_SUBCKT = "PK_set_sizes"
+
+# A PROBE node (escaped in Spectre) followed by the node it is tied to
+_PROBE_LEVEL = re.compile(r"PROBE\\?<(\d+)\\?>\s+(VDD|VSS)\b")
+_PROBE_NODE = re.compile(r"PROBE\\?<(\d+)\\?>")
+_PARAM = re.compile(r"([A-Za-z_]\w*)\s*=\s*([^\s=]+)")
+_IDENTIFIER = re.compile(r"^[A-Za-z_]\w*$")
+
+# (a, b) register values -> SBUS connection
+_SBUS_CONNECTIONS = {values: connection for connection, values in SBUS_CONNECTION_VALUES.items()}
+
+_inverted_maps = {}
+
+
+@dataclass
+class DecodedConfig:
+    """A circuit or sizing description decoded from a netlist or register dump"""
+    path: str
+    kind: str                       # "circuit" or "sizes"
+    data: dict
+    variant: Optional[str] = None   # Name of the .alter block, None for the netlist itself
+    source: Optional[str] = None    # Input recorded in the netlist header
+    unresolved: List[int] = field(default_factory=list)  # Registers driven by expressions of unknown parameters
+
+    @property
+    def digest(self):
+        """str: SHA-256 of the decoded description, independent of key order and formatting."""
+        text = json.dumps([self.kind, self.data], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+@dataclass
+class DecodeResult:
+    """The configurations decoded from one file, or the error that stopped it"""
+    path: str
+    configs: List[DecodedConfig]
+    error: Optional[str] = None
+
+
+def inverted_register_map(chip_config=None):
+    """
+    Returns the owners of the PROBE registers, built once per chip configuration.
+
+    Returns:
+        tuple: (switch, sizing), both indexed by register: `switch[r]` is the
+            (sw-matrix pin index, `BUSES` column) of a switch matrix register and
+            `sizing[r]` the (index into `sizing_devices`, bit weight) of a sizing
+            register; None for registers of the other kind.
+    """
+    chip_config = chip_config or load_chip_config()
+    inverted = _inverted_maps.get(id(chip_config))
+    if inverted is None:
+        switch = [None] * (chip_config.num_registers + 1)
+        for index, row in enumerate(chip_config.register_table):
+            for column, register in enumerate(row):
+                if register:
+                    switch[register] = (index, column)
+        sizing = [None] * (chip_config.num_registers + 1)
+        for register, device, weight in zip(chip_config.sizing_register_index, chip_config.sizing_register_device,
+                                            chip_config.sizing_bit_weights):
+            sizing[register] = (device, weight)
+        inverted = _inverted_maps[id(chip_config)] = (tuple(switch), tuple(sizing))
+    return inverted
+
+
+def circuit_from_registers(values, chip_config=None):
+    """
+    Returns the circuit description (RBUS and SBUS connections) of a register image.
+
+    Args:
+        values: Register values indexed by register (index 0 unused), e.g. `RegisterImage.values`.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+    """
+    chip_config = chip_config or load_chip_config()
+    switch, _ = inverted_register_map(chip_config)
+    pin_names = {index: pin for pin, index in chip_config.pin_sw_index.items()}
+
+    # sw-matrix pin index -> registers set, per bus column
+    columns = {}
+    for register in range(1, chip_config.num_switch_matrix_probes + 1):
+        if values[register] and switch[register] is not None:
+            index, column = switch[register]
+            columns.setdefault(column, []).append(index)
+
+    circuit = {}
+    for column, bus in enumerate(BUSES):
+        if bus.startswith("RBUS") and column in columns:
+            circuit[bus] = [pin_names[index] for index in sorted(columns[column]) if index in pin_names]
+    for column in range(0, len(BUSES), 2):
+        bus = BUSES[column][:-1]
+        if not bus.startswith("SBUS"):
+            continue
+        phase_a, phase_b = set(columns.get(column, ())), set(columns.get(column + 1, ()))
+        entries = [{"terminal": pin_names[index],
+                    "connection": _SBUS_CONNECTIONS[(int(index in phase_a), int(index in phase_b))]}
+                   for index in sorted(phase_a | phase_b) if index in pin_names]
+        if entries:
+            circuit[bus] = entries
+    return circuit
+
+
+def sizes_from_registers(values, chip_config=None):
+    """Returns the sizing description ({device: [size]}, every device) of a register image."""
+    chip_config = chip_config or load_chip_config()
+    _, sizing = inverted_register_map(chip_config)
+    sizes = [0] * len(chip_config.sizing_devices)
+    for register in chip_config.sizing_register_index:
+        if values[register]:
+            device, weight = sizing[register]
+            sizes[device] += weight
+    return {device: [size] for device, size in zip(chip_config.sizing_devices, sizes)}
+
+
+class _Block:
+    """Register levels and parameters of a netlist or of one of its .alter blocks"""
+
+    def __init__(self, name=None, base=None):
+        self.name = name
+        self.source = None
+        self.levels = dict(base.levels) if base else {}
+        self.expressions = dict(base.expressions) if base else {}
+        self.params = dict(base.params) if base else {}
+
+
+def read_netlist(lines):
+    """
+    Collects the PROBE register levels of a netlist.
+
+    Args:
+        lines: Iterable of netlist lines, e.g. an open file.
+
+    Returns:
+        tuple: (subcircuit name or None, list of blocks), the netlist itself first and then
+            one block per `.alter` section; each block has the `levels` (register -> 0/1) of
+            the tied registers, the `expressions` (register -> expression) of the
+            parameter-driven ones, and the parameter defaults (`params`).
+    """
+    subckt = None
+    base = block = _Block()
+    blocks = [base]
+    for line in lines:
+        # The subcircuit header lists the PROBE ports, so it is checked first
+        if "PROBE" in line and not line[:7].lower().startswith((".subckt", "subckt")):
+            first = line[:1]
+            if first in "Vv" or line[:8].lower() == ".connect":
+                match = _PROBE_LEVEL.search(line)
+                if match:
+                    block.levels[int(match.group(1))] = 1 if match.group(2) == "VDD" else 0
+            elif first in "Ee":
+                match = _PROBE_NODE.search(line)
+                if match:
+                    words = line.split()
+                    expression = words[-1]
+                    if expression.startswith("gain="):
+                        expression = expression[5:]
+                    block.expressions[int(match.group(1))] = expression.strip("{}'\"")
+            continue
+
+        start = line[:10].lower()
+        if start.startswith((".param", "parameters")):
+            block.params.update(_PARAM.findall(line))
+        elif start.startswith(".alter"):
+            words = line.split()
+            block = _Block(words[1] if len(words) > 1 else f"alter_{len(blocks)}", base)
+            blocks.append(block)
+        elif start.startswith((".subckt", "subckt")) and subckt is None:
+            words = line.split()
+            subckt = words[1] if len(words) > 1 else None
+        elif line.startswith("* From ") and block.source is None:
+            block.source = line[7:].rstrip("\n")
+    return subckt, blocks
+
+
+def _block_values(block, chip_config, unresolved):
+    values = bytearray(chip_config.num_registers + 1)
+    for register, level in block.levels.items():
+        if register <= chip_config.num_registers:
+            values[register] = level
+    _, sizing = inverted_register_map(chip_config)
+    for register, expression in block.expressions.items():
+        if register > chip_config.num_registers:
+            continue
+        value = None
+        if _IDENTIFIER.match(expression):
+            value = block.params.get(expression)
+        elif sizing[register] is not None:
+            # A size bit of a parameterized sizing netlist follows the size of its device
+            device, weight = sizing[register]
+            size = block.params.get(size_param(chip_config.sizing_devices[device]))
+            if size is not None:
+                value = int(float(size)) & weight
+        if value is None:
+            unresolved.append(register)
+        else:
+            values[register] = 1 if float(value) else 0
+    return values
+
+
+def decode_netlist(path, chip_config=None):
+    """
+    Decodes a PK_set_SWMATRIX or PK_set_sizes_2 netlist, streaming it line by line.
+
+    Returns:
+        list[DecodedConfig]: The configuration of the netlist, then one per `.alter` block; empty
+            for netlists that set no PROBE register (e.g. PK_NODE_external_connections).
+    """
+    chip_config = chip_config or load_chip_config()
+    with open(path, "r") as f:
+        subckt, blocks = read_netlist(f)
+
+    registers = set(blocks[0].levels) | set(blocks[0].expressions)
+    if not registers:
+        return []
+    if subckt is not None and subckt.startswith(SWITCH_MATRIX_SUBCKT):
+        kind = "circuit"
+    elif subckt is not None and subckt.startswith(SIZES_SUBCKT):
+        kind = "sizes"
+    else:
+        kind = "circuit" if min(registers) <= chip_config.num_switch_matrix_probes else "sizes"
+
+    configs = []
+    for block in blocks:
+        unresolved = []
+        values = _block_values(block, chip_config, unresolved)
+        data = circuit_from_registers(values, chip_config) if kind == "circuit" else sizes_from_registers(values, chip_config)
+        configs.append(DecodedConfig(path, kind, data, block.name, block.source or blocks[0].source, unresolved))
+    return configs
+
+
+def decode_register_dump(path, chip_config=None):
+    """
+    Decodes a register dump (bin, hex or json) of the whole chip.
+
+    Returns:
+        list[DecodedConfig]: The circuit and the sizing description.
+    """
+    chip_config = chip_config or load_chip_config()
+    values = bytes(read_register_dump(path, chip_config.num_registers).values)
+    return [DecodedConfig(path, "circuit", circuit_from_registers(values, chip_config)),
+            DecodedConfig(path, "sizes", sizes_from_registers(values, chip_config))]
+
+
+def decode_file(path, chip_config=None):
+    """Decodes a netlist or, by its extension (.bin, .hex, .json), a register dump."""
+    if os.path.splitext(path)[1].lower() in DUMP_EXTENSIONS:
+        return decode_register_dump(path, chip_config)
+    return decode_netlist(path, chip_config)
+
+
+def find_inputs(patterns):
+    """
+    Expands files, glob patterns and directories into the files to decode.
+
+    Directories are searched recursively for netlists (NETLIST_EXTENSIONS) and for the
+    `registers.<bin|hex|json>` dumps of `mosbius batch`.
+
+    Returns:
+        list[str]: The files, sorted within every pattern or directory.
+    """
+    from commandline.batch import REGISTER_DUMP_NAME
+
+    dump_names = {f"{REGISTER_DUMP_NAME}{extension}" for extension in DUMP_EXTENSIONS}
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = []
+            for directory, _, names in os.walk(pattern):
+                found += [os.path.join(directory, name) for name in names
+                          if name in dump_names or os.path.splitext(name)[1].lower() in NETLIST_EXTENSIONS]
+            paths += sorted(found)
+        elif glob.has_magic(pattern):
+            paths += sorted(glob.glob(pattern))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def _decode_chunk(paths):
+    chip_config = load_chip_config()
+    results = []
+    for path in paths:
+        try:
+            results.append(DecodeResult(path, decode_file(path, chip_config)))
+        except Exception as e:
+            results.append(DecodeResult(path, [], f"{type(e).__name__}: {e}"))
+    return results
+
+
+def decode_files(paths, workers=None, chunk_size=None):
+    """
+    Decodes many files, on a process pool.
+
+    A file that cannot be decoded is reported in its result and does not stop the others.
+
+    Args:
+        paths (list[str]): Netlists and register dumps.
+        workers (int): Number of worker processes (default: all cores); 1 decodes in-process.
+        chunk_size (int): Files per worker task (default: about 4 tasks per worker).
+
+    Returns:
+        list[DecodeResult]: One result per file, in the order of `paths`.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunk_size = max(1, chunk_size or -(-len(paths) // (workers * 4)))
+    chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+    workers = min(workers, len(chunks))
+    if workers <= 1:
+        return [result for chunk in chunks for result in _decode_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [result for results in executor.map(_decode_chunk, chunks) for result in results]
+
+
+def write_archive(results, output_dir):
+    """
+    Writes every distinct decoded configuration once, plus an index of all files.
+
+    The configurations are written as `<kind>_<first 16 digits of the digest>.json`. Every
+    line of `index.jsonl` records one decoded configuration: its "file", "variant", "kind",
+    "source", "digest", "config" file name, and whether it "duplicate"s an earlier one; files
+    that could not be decoded get an "error" line instead.
+
+    Returns:
+        tuple: (number of configurations, number of distinct configurations).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    seen = set()
+    total = 0
+    with open(os.path.join(output_dir, INDEX_NAME), "w") as index:
+        for result in results:
+            if result.error is not None:
+                index.write(json.dumps({"file": result.path, "error": result.error}) + "\n")
+                continue
+            for config in result.configs:
+                digest = config.digest
+                name = f"{config.kind}_{digest[:16]}.json"
+                duplicate = digest in seen
+                if not duplicate:
+                    seen.add(digest)
+                    with open(os.path.join(output_dir, name), "w") as f:
+                        json.dump(config.data, f, indent=4)
+                        f.write("\n")
+                total += 1
+                index.write(json.dumps({"file": config.path, "variant": config.variant, "kind": config.kind,
+                                        "source": config.source, "digest": digest, "config": name,
+                                        "duplicate": duplicate}) + "\n")
+    return total, len(seen)
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Decode PK_set_SWMATRIX / PK_set_sizes_2 netlists or register dumps back into circuit and sizing JSON."
+    )
+    parser.add_argument("inputs", nargs="+", help="Netlists, register dumps, directories or glob patterns.")
+    parser.add_argument("-o", "--output-dir",
+                        help="Write every distinct configuration once, with an index.jsonl of all files, into this "
+                             "directory (default: print one JSON line per configuration).")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: all cores).")
+    parser.add_argument("--chunk-size", type=int, help="Number of files per worker task.")
+
+    args = parser.parse_args(argv)
+
+    paths = find_inputs(args.inputs)
+    if not paths:
+        parser.error("no netlists or register dumps found")
+    results = decode_files(paths, workers=args.jobs, chunk_size=args.chunk_size)
+
+    # Keep stdout to the JSON lines when there is no output directory
+    log = sys.stdout if args.output_dir else sys.stderr
+    failed = skipped = 0
+    for result in results:
+        if result.error is not None:
+            failed += 1
+            print(f"Error: {result.path}: {result.error}", file=log)
+        elif not result.configs:
+            skipped += 1
+        for config in result.configs:
+            if config.unresolved:
+                print(f"Warning: {config.path}{f' ({config.variant})' if config.variant else ''}: "
+                      f"{len(config.unresolved)} registers follow unknown parameters and were decoded as VSS", file=log)
+
+    if args.output_dir:
+        total, distinct = write_archive(results, args.output_dir)
+        print(f"Decoded {total} configurations ({distinct} distinct) from {len(paths) - failed - skipped} files "
+              f"into {args.output_dir}; {skipped} files without PROBE registers, {failed} failed")
+    else:
+        for result in results:
+            for config in result.configs:
+                print(json.dumps({"file": config.path, "variant": config.variant, "kind": config.kind,
+                                  "source": config.source, "data": config.data}))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Simulator dialects of the generated netlists.
+
+The four generators describe their subcircuits with a handful of constructs:
+the subcircuit header and footer, zero-volt shorts between two nodes, PROBE
+levels (a short to VDD or VSS, or a controlled source following a
+parameter), parameter defaults and, in multi-chip netlists, subcircuit
+instances. A `Dialect` renders these constructs in the native syntax of a
+simulator:
+
+    spice    generic SPICE inside `simulator lang=spice` (default; the
+             packaged templates as they are, for Spectre and HSPICE)
+    spectre  native Spectre: escaped bus nodes (PROBE\\<1\\>), `iprobe`
+             shorts, `vcvs` sources and `parameters`
+    ngspice  SPICE without the Spectre-only `simulator lang` line, with
+             parameter expressions in braces
+    xyce     as ngspice, plus `.PREPROCESS REMOVEUNUSED V`, so shorts whose
+             two terminals end up on the same node are dropped instead of
+             making the matrix singular
+
+Each generator takes a `dialect` name; `register_dialect` adds further
+dialects without editing the package.
+"""
+
+import re
+
+from commandline.netlist_writer import TIE_STYLES, probe_line
+
+DEFAULT_DIALECT = "spice"
+
+_SIMULATOR_LANG = re.compile(r"^\s*simulator\s+lang\s*=", re.IGNORECASE)
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class Dialect:
+    """
+    Generic SPICE, as written inside a `simulator lang=spice` section.
+
+    Subclasses override the constructs their simulator writes differently.
+
+    Attributes:
+        name (str): Name used to select the dialect.
+        tie_styles (tuple): Tie styles (see netlist_writer.TIE_STYLES) the dialect supports.
+        line_width (int): Column at which long statements are continued on the next line.
+    """
+
+    name = "spice"
+    tie_styles = TIE_STYLES
+    line_width = 80
+
+    def check_tie_style(self, tie_style):
+        """Raises ValueError if the dialect cannot tie probes off with `tie_style`."""
+        if tie_style not in self.tie_styles:
+            raise ValueError(f"Tie style '{tie_style}' is not supported by the {self.name} dialect; "
+                             f"use {', '.join(self.tie_styles)}")
+
+    def header(self, template):
+        """Returns the text that opens the subcircuit of a `SubcktTemplate`."""
+        return template.header
+
+    def footer(self, template):
+        """Returns the text that closes the subcircuit of a `SubcktTemplate`."""
+        return template.footer
+
+    def expression(self, expression):
+        """Returns a parameter expression as written in an element value."""
+        return expression if _IDENTIFIER.match(expression) else f"'{expression}'"
+
+    def short(self, name, node_a, node_b):
+        """Returns the line of a zero-volt short between two nodes."""
+        return f"{name} {node_a} {node_b} 0\n"
+
+    def probe(self, name, probe, level, tie_style="vsource", expression=None):
+        """
+        Returns the line setting `PROBE<probe>` to `level` ("VDD" or "VSS").
+
+        With an `expression` (of parameters, evaluating to 0 or 1) the probe follows it,
+        at VSS + expression * (VDD - VSS).
+        """
+        return probe_line(name, probe, level, tie_style, None if expression is None else self.expression(expression))
+
+    def instance(self, name, nodes, subckt):
+        """Returns the lines instantiating the subcircuit `subckt` as `name`, connected to `nodes`."""
+        return self._wrap(f"X{name}", list(nodes) + [subckt], "+", "")
+
+    def _wrap(self, line, words, continuation, line_end):
+        """Returns `line` followed by `words`, broken into continuation lines of at most `line_width` columns."""
+        lines = []
+        for word in words:
+            if len(line) + len(word) + 3 > self.line_width:
+                lines.append(line + line_end + "\n")
+                line = continuation
+            line += f" {word}"
+        lines.append(line + "\n")
+        return "".join(lines)
+
+    def params(self, values):
+        """Returns the statements setting the default of every parameter in `values` (name -> value)."""
+        return "".join([f".param {name}={value}\n" for name, value in values.items()])
+
+
+class NgspiceDialect(Dialect):
+    """SPICE for ngspice: no `simulator lang` line, parameter expressions in braces."""
+
+    name = "ngspice"
+    tie_styles = ("vsource",)
+
+    def header(self, template):
+        return "".join(line for line in template.header.splitlines(keepends=True)
+                       if not _SIMULATOR_LANG.match(line))
+
+    def expression(self, expression):
+        return f"{{{expression}}}"
+
+
+class XyceDialect(NgspiceDialect):
+    """SPICE for Xyce: as ngspice, removing the shorts between a node and itself at parse time."""
+
+    name = "xyce"
+
+    def header(self, template):
+        return ".PREPROCESS REMOVEUNUSED V\n" + super().header(template)
+
+
+class SpectreDialect(Dialect):
+    """Native Spectre syntax."""
+
+    name = "spectre"
+    tie_styles = ("vsource",)
+
+    @staticmethod
+    def node(node):
+        """Returns a node name with the bus brackets escaped, e.g. PROBE\\<1\\>."""
+        return node.replace("<", "\\<").replace(">", "\\>")
+
+    def header(self, template):
+        preamble = "".join(line for line in template.preamble.splitlines(keepends=True)
+                           if not _SIMULATOR_LANG.match(line))
+        ports = [self.node(port) for port in template.ports]
+        return preamble + "simulator lang=spectre\n\n" + self._wrap(f"subckt {template.subckt}", ports, "   ", " \\")
+
+    def footer(self, template):
+        return f"ends {template.subckt}\n"
+
+    def expression(self, expression):
+        return expression
+
+    def short(self, name, node_a, node_b):
+        return f"{name} ({self.node(node_a)} {self.node(node_b)}) iprobe\n"
+
+    def probe(self, name, probe, level, tie_style="vsource", expression=None):
+        node = self.node(f"PROBE<{probe}>")
+        if expression is not None:
+            return f"E{name[1:]} ({node} VSS VDD VSS) vcvs gain={expression}\n"
+        return f"{name} ({node} {level}) iprobe\n"
+
+    def instance(self, name, nodes, subckt):
+        nodes = [self.node(node) for node in nodes]
+        nodes[0] = f"({nodes[0]}"
+        nodes[-1] += ")"
+        return self._wrap(name, nodes + [subckt], "   ", " \\")
+
+    def params(self, values):
+        return "".join([f"parameters {name}={value}\n" for name, value in values.items()])
+
+
+DIALECTS = {dialect.name: dialect for dialect in (Dialect(), SpectreDialect(), NgspiceDialect(), XyceDialect())}
+
+
+def register_dialect(dialect):
+    """Makes a `Dialect` instance available under its name, replacing a dialect of the same name."""
+    DIALECTS[dialect.name] = dialect
+
+
+def get_dialect(dialect=None):
+    """
+    Returns the `Dialect` named `dialect` (default: "spice"); a `Dialect` instance is returned as is.
+
+    Raises:
+        ValueError: If no dialect of that name is registered.
+    """
+    if isinstance(dialect, Dialect):
+        return dialect
+    try:
+        return DIALECTS[dialect or DEFAULT_DIALECT]
+    except KeyError:
+        raise ValueError(f"Unknown dialect '{dialect}'; use one of {', '.join(DIALECTS)}") from None
+
+
+def dialect_options(dialect=None):
+    """Returns the build hash options (see commandline.incremental) recording a non-default dialect."""
+    name = get_dialect(dialect).name
+    return () if name == DEFAULT_DIALECT else (f"dialect={name}",)
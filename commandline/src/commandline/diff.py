@@ -0,0 +1,229 @@
+"""
+Register-level diffs between configurations: `mosbius diff`.
+
+Configurations in a sweep (e.g. the INV_string_* or sw_cap_OTA_* designs)
+usually differ in a handful of switches or size bits. Instead of one full
+netlist per configuration, the diff netlist contains the subcircuit of the
+base configuration once, with every PROBE register that any variant changes
+driven by a parameter:
+
+    E_DCC1_N_R_1969 PROBE<1969> VSS VDD VSS probe_1969
+
+followed by the base levels of those parameters and one `.alter` block per
+variant that only sets the parameters:
+
+    .param probe_1969=0
+
+    .alter variant_1
+    * From DCC1_N_R_5_sizes.json: 1 register changed
+    .param probe_1969=1
+
+The simulator parses the netlist once and runs every variant. Each `.alter`
+block sets all parameters, so the result does not depend on whether the
+simulator applies the alterations cumulatively.
+
+Only the PK_set_SWMATRIX (circuits) and PK_set_sizes_2 (sizings) registers
+are diffed; variants that change the NODE or RBUS pin connections need their
+own PK_NODE_external_connections / PK_pins_to_RBUS_SWBUS netlists.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import List
+
+from commandline import profiling
+from commandline.chip_config import load_chip_config
+from commandline.generate_sizes_probe_subckt import sizes_probe_subckt_lines, validated_device_sizes
+from commandline.generate_switch_matrix_probe_subckt import switch_matrix_probe_subckt_lines
+from commandline.incremental import build_hash
+from commandline.netlist_writer import TIE_STYLES, log_redirect, write_netlist
+from commandline.registers import RegisterImage, map_sizes, map_switch_matrix
+from commandline.templates import SIZES_TEMPLATE, SWITCH_MATRIX_TEMPLATE
+
+# Kind of configuration -> (template, lines function of the PROBE subcircuit)
+KINDS = {
+    "circuit": (SWITCH_MATRIX_TEMPLATE, switch_matrix_probe_subckt_lines),
+    "sizes": (SIZES_TEMPLATE, sizes_probe_subckt_lines),
+}
+
+
+@dataclass
+class DiffResult:
+    """Summary of a diff netlist"""
+    variants: int
+    registers: List[int]  # Registers driven by a parameter
+    changed: List[int]    # Number of registers each variant changes
+
+
+def probe_param(register):
+    """Returns the parameter name selecting the level of `register`."""
+    return f"probe_{register}"
+
+
+def map_config(data, kind, chip_config=None):
+    """Returns the register image of a parsed circuit ("circuit") or sizing ("sizes") JSON."""
+    chip_config = chip_config or load_chip_config()
+    image = RegisterImage.for_chip(chip_config)
+    if kind == "circuit":
+        map_switch_matrix(data, chip_config, image)
+    elif kind == "sizes":
+        map_sizes(validated_device_sizes(data, chip_config), chip_config, image)
+    else:
+        raise ValueError(f"Unknown configuration kind '{kind}'; use one of {', '.join(KINDS)}")
+    return image
+
+
+def register_delta(base_image, image):
+    """Returns the (register, value) pairs of `image` that differ from `base_image`."""
+    return [(register, image.value(register)) for register in base_image.diff(image)]
+
+
+def _registers_changed(count):
+    return f"{count} register{'' if count == 1 else 's'} changed"
+
+
+def _external_connections(circuit):
+    """Returns the parts of a circuit that are not set by PROBE registers: NODEs, supplies and RBUS pins."""
+    connections = {}
+    for key, entries in circuit.items():
+        if key.startswith("RBUS"):
+            connections[key] = entries[:1]
+        elif not key.startswith("SBUS"):
+            connections[key] = entries
+    return connections
+
+
+def diff_configs(base, variants, kind, chip_config=None):
+    """
+    Computes the register deltas of variants against a base configuration.
+
+    Args:
+        base (dict): Parsed JSON of the base configuration.
+        variants (list[tuple[str, dict]]): (name, parsed JSON) of every variant.
+        kind (str): "circuit" or "sizes".
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Returns:
+        tuple: The base image and, per variant, the list of (register, value) pairs it changes.
+    """
+    chip_config = chip_config or load_chip_config()
+    base_image = map_config(base, kind, chip_config)
+    deltas = []
+    for name, data in variants:
+        if kind == "circuit" and _external_connections(data) != _external_connections(base):
+            print(f"Warning: {name} changes NODE or RBUS pin connections, which are not part of the PROBE diff")
+            profiling.count("warnings")
+        deltas.append(register_delta(base_image, map_config(data, kind, chip_config)))
+    return base_image, deltas
+
+
+def diff_netlist_lines(base, variants, kind, source, chip_config=None, tie_style="vsource", stamp=None, result=None):
+    """
+    Generates the lines of a diff netlist.
+
+    Args:
+        base (dict): Parsed JSON of the base configuration.
+        variants (list[tuple[str, dict]]): (name, parsed JSON) of every variant.
+        kind (str): "circuit" or "sizes".
+        source (str): Name of the base configuration, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        tie_style (str): How registers at VSS that no variant changes are tied off.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        result (DiffResult): Optional object receiving the summary.
+
+    Yields:
+        str: Netlist text, a line or a block of lines at a time.
+    """
+    chip_config = chip_config or load_chip_config()
+    _, lines_function = KINDS[kind]
+    base_image, deltas = diff_configs(base, variants, kind, chip_config)
+
+    registers = sorted({register for delta in deltas for register, _ in delta})
+    probe_params = {register: probe_param(register) for register in registers}
+    if result is not None:
+        result.variants = len(deltas)
+        result.registers = registers
+        result.changed = [len(delta) for delta in deltas]
+
+    yield from lines_function(base, source, chip_config, None, tie_style, stamp, probe_params)
+
+    if registers:
+        yield "\n* Base levels of the PROBE registers changed by the variants\n"
+        yield "".join([f".param {probe_params[register]}={base_image.value(register)}\n" for register in registers])
+
+    for index, ((name, _), delta) in enumerate(zip(variants, deltas), start=1):
+        values = dict(delta)
+        yield f"\n.alter variant_{index}\n"
+        yield f"* From {name}: {_registers_changed(len(delta))}\n"
+        yield "".join([f".param {probe_params[register]}={values.get(register, base_image.value(register))}\n"
+                       for register in registers])
+
+
+def write_diff_netlist(base, variants, kind, output_file, source, chip_config=None, tie_style="vsource",
+                       deterministic=False):
+    """
+    Writes a diff netlist: the base PROBE subcircuit with one `.alter` block per variant.
+
+    Args:
+        base (dict): Parsed JSON of the base configuration.
+        variants (list[tuple[str, dict]]): (name, parsed JSON) of every variant.
+        kind (str): "circuit" or "sizes".
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        source (str): Name of the base configuration, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        tie_style (str): How registers at VSS that no variant changes are tied off.
+        deterministic (bool): Record a build hash instead of the creation time.
+
+    Returns:
+        DiffResult: Number of variants and the registers they change.
+    """
+    chip_config = chip_config or load_chip_config()
+    template, _ = KINDS[kind]
+    stamp = None
+    if deterministic:
+        stamp = build_hash(template, {"base": base, "variants": variants}, source, chip_config, ("diff", tie_style))
+
+    result = DiffResult(0, [], [])
+    write_netlist(output_file, diff_netlist_lines(base, variants, kind, source, chip_config, tie_style, stamp, result))
+    return result
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Write one netlist with the base PROBE subcircuit and an .alter block per variant "
+                    "that only sets the registers the variants change."
+    )
+    parser.add_argument("base", help="Path to the JSON file of the base configuration.")
+    parser.add_argument("variants", nargs="+", help="Paths to the JSON files of the variants.")
+    parser.add_argument("-o", "--output", default="-", help="Path to the output SPICE file (default: stdout).")
+    parser.add_argument("--kind", choices=KINDS, default="circuit",
+                        help="Diff circuit descriptions (PK_set_SWMATRIX, default) or sizings (PK_set_sizes_2).")
+    parser.add_argument("--tie-style", choices=TIE_STYLES, default="vsource",
+                        help="Tie unchanged probes at VSS off with zero-volt sources (default) or with .connect.")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+
+    args = parser.parse_args(argv)
+
+    with log_redirect(args.output):
+        with open(args.base, "r") as f:
+            base = json.load(f)
+        variants = []
+        for path in args.variants:
+            with open(path, "r") as f:
+                variants.append((path, json.load(f)))
+
+        result = write_diff_netlist(base, variants, args.kind, args.output, args.base, tie_style=args.tie_style,
+                                    deterministic=args.deterministic)
+        for (path, _), changed in zip(variants, result.changed):
+            print(f"{path}: {_registers_changed(changed)}")
+        print(f"Diff netlist with {result.variants} variants and {len(result.registers)} parameters "
+              f"saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
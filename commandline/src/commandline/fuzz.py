@@ -0,0 +1,450 @@
+"""
+Seeded random circuit and sizing candidates: `mosbius fuzz`.
+
+Stress tests, throughput benchmarks and design-space searches need large
+numbers of configurations that the generators accept. The candidates are
+drawn from the switches the chip configuration actually has, so every
+candidate passes `commandline.validate` without errors:
+
+    RBUS1-8     package pins with a switch to the RBUS (the first is brought
+                out by PK_pins_to_RBUS_SWBUS)
+    SBUS1-6     pins or internal buses with both switches to the SBUS, each
+                ON, PHI1 or PHI2 (or OFF, if allowed)
+    NODE<n>     package pins, each on at most one RBUS, NODE or supply
+    VDD, VSS    package pins other than the supply pins
+    sizes       the devices matching the device patterns, with sizes drawn
+                from a range
+
+`Constraints` bound how much of the chip a candidate uses: the density (the
+share of the package pins with a switch that are connected), the number of
+RBUSes, SBUSes and NODEs, and the pins per bus. Candidate i of seed s is
+drawn from its own generator, so it is the same in every run, in any slice
+of the stream:
+
+    from commandline.fuzz import Constraints, candidates
+
+    for candidate in candidates(1000, seed=7, constraints=Constraints(density=0.5, max_rbuses=4)):
+        candidate.circuit, candidate.sizes
+
+`mosbius fuzz` prints the candidates as JSON lines, or writes them as files
+with a `mosbius batch` manifest. `--validate` runs the validator on every
+candidate, to measure the validation throughput.
+"""
+
+import fnmatch
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from commandline.chip_config import RBUSES, SBUSES, load_chip_config
+from commandline.registers import SBUS_CONNECTION_VALUES
+
+KINDS = ("circuit", "sizes", "both")
+SUPPLIES = ("VDD", "VSS")
+SBUS_CONNECTIONS = tuple(SBUS_CONNECTION_VALUES) + ("OFF",)
+NUM_NODES = 20
+NODES = tuple(f"NODE<{node}>" for node in range(1, NUM_NODES + 1))
+# Order of the buses in the circuit JSONs
+BUS_ORDER = {bus: index for index, bus in enumerate(RBUSES + SBUSES + NODES + SUPPLIES)}
+# Candidate i of seed s is drawn from random.Random(s * SEED_STRIDE + i)
+SEED_STRIDE = 1 << 40
+DEFAULT_CHUNK_SIZE = 2000
+# Rejected draws before a pin is picked among the allowed ones directly
+MAX_MISSES = 8
+
+_bus_pins = {}
+_device_sets = {}
+
+
+@dataclass(frozen=True)
+class Constraints:
+    """Bounds of the random candidates"""
+    density: float = 0.25                 # Share of the package pins with a switch that are connected
+    max_rbuses: int = len(RBUSES)
+    max_sbuses: int = len(SBUSES)
+    max_nodes: int = NUM_NODES
+    max_pins_per_bus: int = 6
+    connections: Tuple[str, ...] = tuple(SBUS_CONNECTION_VALUES)  # SBUS connections drawn from
+    devices: Tuple[str, ...] = ("*",)     # fnmatch patterns of the devices to size
+    min_size: int = 0
+    max_size: int = 31
+    size_points: int = 1                  # Sizes per device (a zip sweep of that length)
+
+    def check(self):
+        """Raises ValueError if the constraints are inconsistent."""
+        if not 0.0 <= self.density <= 1.0:
+            raise ValueError(f"The density must be between 0 and 1, not {self.density}")
+        for name, limit in (("max_rbuses", len(RBUSES)), ("max_sbuses", len(SBUSES)), ("max_nodes", NUM_NODES)):
+            if not 0 <= getattr(self, name) <= limit:
+                raise ValueError(f"{name} must be between 0 and {limit}")
+        if self.max_pins_per_bus < 1:
+            raise ValueError("max_pins_per_bus must be at least 1")
+        unknown = [connection for connection in self.connections if connection not in SBUS_CONNECTIONS]
+        if unknown or not self.connections:
+            raise ValueError(f"SBUS connections must be some of {', '.join(SBUS_CONNECTIONS)}")
+        if not 0 <= self.min_size <= self.max_size <= 31:
+            raise ValueError("Sizes must satisfy 0 <= min_size <= max_size <= 31")
+        if self.size_points < 1:
+            raise ValueError("size_points must be at least 1")
+
+
+@dataclass
+class Candidate:
+    """One random configuration; `circuit` or `sizes` is None if it was not drawn"""
+    index: int
+    circuit: Optional[dict] = None
+    sizes: Optional[dict] = None
+
+    @property
+    def name(self):
+        return f"candidate_{self.index}"
+
+
+def bus_pins(chip_config=None):
+    """
+    Returns the pins every bus of the circuit JSON can connect, memoized per chip configuration.
+
+    Returns:
+        dict: "package" -> the package pins with a switch except the supply pins (the pins of
+            NODEs and supplies), RBUS name -> frozenset of those with a switch to the RBUS, and
+            SBUS name -> tuple of all pins, internal buses included, with both switches to the SBUS.
+    """
+    chip_config = chip_config or load_chip_config()
+    pins = _bus_pins.get(id(chip_config))
+    if pins is None:
+        package = tuple(pin for pin in chip_config.pin_sw_index
+                        if pin in chip_config.pin_number and pin not in SUPPLIES)
+        pins = {"package": package}
+        for bus in RBUSES:
+            pins[bus] = frozenset(pin for pin in package if chip_config.register(pin, bus))
+        for bus in SBUSES:
+            pins[bus] = tuple(pin for pin in chip_config.pin_sw_index
+                              if chip_config.register(pin, f"{bus}a") and chip_config.register(pin, f"{bus}b"))
+        _bus_pins[id(chip_config)] = pins
+    return pins
+
+
+def matching_devices(patterns, chip_config=None):
+    """Returns the sizing devices matching any of the fnmatch `patterns`, memoized per chip configuration."""
+    chip_config = chip_config or load_chip_config()
+    key = (id(chip_config), tuple(patterns))
+    devices = _device_sets.get(key)
+    if devices is None:
+        devices = _device_sets[key] = tuple(device for device in chip_config.sizing_devices
+                                            if any(fnmatch.fnmatchcase(device, pattern) for pattern in patterns))
+    return devices
+
+
+def _take(rng, free, count, allowed=None):
+    """Removes and returns up to `count` random pins of `free`, only pins in `allowed` if given."""
+    taken = []
+    misses = 0
+    while free and len(taken) < count:
+        index = int(rng.random() * len(free))
+        if allowed is not None and free[index] not in allowed:
+            misses += 1
+            if misses < MAX_MISSES:
+                continue
+            # Few pins of `free` are allowed: pick among them directly
+            allowed_indexes = [index for index, pin in enumerate(free) if pin in allowed]
+            if not allowed_indexes:
+                break
+            index = rng.choice(allowed_indexes)
+        # Swap with the last pin so the removal is O(1)
+        taken.append(free[index])
+        free[index] = free[-1]
+        free.pop()
+    return taken
+
+
+def random_circuit(rng, constraints=Constraints(), chip_config=None):
+    """
+    Returns a random circuit description within `constraints`.
+
+    Args:
+        rng (random.Random): Source of randomness.
+        constraints (Constraints): Bounds of the candidate.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Returns:
+        dict: Circuit JSON with the RBUSes, SBUSes, NODEs and supplies in that order.
+    """
+    pins = bus_pins(chip_config)
+    budget = round(constraints.density * len(pins["package"]))
+    max_pins = constraints.max_pins_per_bus
+
+    buses = rng.sample(RBUSES, rng.randint(min(1, constraints.max_rbuses), constraints.max_rbuses))
+    buses += rng.sample(SBUSES, rng.randint(0, constraints.max_sbuses))
+    buses += rng.sample(NODES, rng.randint(0, constraints.max_nodes))
+    buses += [supply for supply in SUPPLIES if rng.random() < 0.5]
+    rng.shuffle(buses)  # Share the pin budget fairly between the kinds of buses
+
+    # Package pins not on a static net (RBUS, NODE or supply) yet
+    free = list(pins["package"])
+    connected = {}
+    for bus in buses:
+        count = min(rng.randint(1, max_pins), budget)
+        if count <= 0:
+            break
+        if bus in SBUSES:
+            terminals = rng.sample(pins[bus], min(count, len(pins[bus])))
+            connections = rng.choices(constraints.connections, k=len(terminals))
+            drawn = [{"terminal": pin, "connection": connection} for pin, connection in zip(terminals, connections)]
+        else:
+            # RBUSes only take pins with a switch to them; NODEs and supplies any package pin
+            drawn = _take(rng, free, count, pins.get(bus))
+        if drawn:
+            connected[bus] = drawn
+            budget -= len(drawn)
+
+    return {bus: connected[bus] for bus in sorted(connected, key=BUS_ORDER.get)}
+
+
+def random_sizes(rng, constraints=Constraints(), chip_config=None):
+    """Returns a random sizing description of the devices matching `constraints.devices`."""
+    devices = matching_devices(constraints.devices, chip_config)
+    points = constraints.size_points
+    sizes = rng.choices(range(constraints.min_size, constraints.max_size + 1), k=len(devices) * points)
+    return {device: sizes[index * points:(index + 1) * points] for index, device in enumerate(devices)}
+
+
+def candidates(count=None, seed=0, constraints=Constraints(), kind="both", start=0, chip_config=None):
+    """
+    Yields random candidates.
+
+    Args:
+        count (int): Number of candidates; None for an endless stream.
+        seed (int): Seed of the stream.
+        constraints (Constraints): Bounds of the candidates.
+        kind (str): Draw a "circuit", "sizes" or "both".
+        start (int): Index of the first candidate, e.g. to split a stream over processes.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Yields:
+        Candidate: Candidates `start`, `start + 1`, ... of the stream of `seed`.
+
+    Raises:
+        ValueError: If the constraints or the kind are invalid.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind '{kind}'; use one of {', '.join(KINDS)}")
+    constraints.check()
+    chip_config = chip_config or load_chip_config()
+
+    index = start
+    while count is None or index < start + count:
+        rng = random.Random(seed * SEED_STRIDE + index)
+        candidate = Candidate(index)
+        if kind != "sizes":
+            candidate.circuit = random_circuit(rng, constraints, chip_config)
+        if kind != "circuit":
+            candidate.sizes = random_sizes(rng, constraints, chip_config)
+        yield candidate
+        index += 1
+
+
+def fails_validation(candidate, chip_config=None):
+    """Returns True if the circuit or the sizing of a candidate has validation errors."""
+    from commandline.validate import has_errors, validate_circuit, validate_sizes
+
+    diagnostics = []
+    if candidate.circuit is not None:
+        diagnostics += validate_circuit(candidate.circuit, chip_config)
+    if candidate.sizes is not None:
+        diagnostics += validate_sizes(candidate.sizes, chip_config)
+    return has_errors(diagnostics)
+
+
+def candidate_line(candidate):
+    """Returns a candidate as one JSON line: {"name", "circuit", "sizes"}, without the parts not drawn."""
+    record = {"name": candidate.name}
+    for key, data in (("circuit", candidate.circuit), ("sizes", candidate.sizes)):
+        if data is not None:
+            record[key] = data
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _render_chunk(seed, constraints, kind, start, stop, validate):
+    """Returns the JSON lines of the candidates [start, stop) and the names of those that do not validate."""
+    chip_config = load_chip_config()
+    lines = []
+    invalid = []
+    for candidate in candidates(stop - start, seed, constraints, kind, start, chip_config):
+        if validate and fails_validation(candidate, chip_config):
+            invalid.append(candidate.name)
+        lines.append(candidate_line(candidate))
+    return "".join(lines), invalid
+
+
+def stream_candidates(output, count=None, seed=0, constraints=Constraints(), kind="both", start=0, validate=False,
+                      workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes candidates as JSON lines to a text stream, rendered in chunks on a process pool.
+
+    The chunks are written in index order, so the output does not depend on the number of workers.
+
+    Args:
+        output: Writable text stream.
+        count (int): Number of candidates; None for an endless stream.
+        seed, constraints, kind, start: As for `candidates`.
+        validate (bool): Validate every candidate.
+        workers (int): Number of worker processes; 1 renders in-process.
+        chunk_size (int): Candidates per chunk.
+
+    Returns:
+        tuple: (number of candidates written, names of the candidates that do not validate).
+    """
+    import collections
+    import itertools
+
+    constraints.check()
+    stop = None if count is None else start + count
+    chunks = itertools.count(start, chunk_size) if stop is None else range(start, stop, chunk_size)
+    args = ((seed, constraints, kind, first, first + chunk_size if stop is None else min(first + chunk_size, stop),
+             validate) for first in chunks)
+
+    written = 0
+    invalid = []
+
+    def write(result, num_candidates):
+        nonlocal written
+        output.write(result[0])
+        invalid.extend(result[1])
+        written += num_candidates
+
+    if workers == 1:
+        for chunk_args in args:
+            write(_render_chunk(*chunk_args), chunk_args[4] - chunk_args[3])
+        return written, invalid
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # A bounded window of chunks in flight, so endless streams do not queue up
+        pending = collections.deque()
+        for chunk_args in args:
+            pending.append((executor.submit(_render_chunk, *chunk_args), chunk_args[4] - chunk_args[3]))
+            if len(pending) >= 2 * workers:
+                future, num_candidates = pending.popleft()
+                write(future.result(), num_candidates)
+        while pending:
+            future, num_candidates = pending.popleft()
+            write(future.result(), num_candidates)
+    return written, invalid
+
+
+def write_candidates(stream, output_dir):
+    """
+    Writes every candidate as `<name>_circuit.json` and/or `<name>_sizes.json`, with a
+    `manifest.json` for `mosbius batch --manifest`.
+
+    Returns:
+        int: Number of candidates written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = []
+    for candidate in stream:
+        entry = {"name": candidate.name}
+        for key, data in (("circuit", candidate.circuit), ("sizes", candidate.sizes)):
+            if data is not None:
+                entry[key] = f"{candidate.name}_{key}.json"
+                with open(os.path.join(output_dir, entry[key]), "w") as f:
+                    json.dump(data, f, indent=4)
+        manifest.append(entry)
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return len(manifest)
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate seeded random circuit and sizing JSONs that pass validation."
+    )
+    parser.add_argument("-n", "--count", type=int, default=100, help="Number of candidates (0: endless stream).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed; candidate i of a seed is the same in every run.")
+    parser.add_argument("--start", type=int, default=0, help="Index of the first candidate (default: 0).")
+    parser.add_argument("--kind", choices=KINDS, default="both", help="Draw circuits, sizings or both (default).")
+    parser.add_argument("-o", "--output-dir",
+                        help="Write JSON files and a 'mosbius batch' manifest here (default: print JSON lines).")
+    parser.add_argument("--density", type=float, default=Constraints.density,
+                        help=f"Share of the switchable package pins to connect (default: {Constraints.density}).")
+    parser.add_argument("--max-rbuses", type=int, default=len(RBUSES), help="Most RBUSes used per circuit.")
+    parser.add_argument("--max-sbuses", type=int, default=len(SBUSES), help="Most SBUSes used per circuit.")
+    parser.add_argument("--max-nodes", type=int, default=NUM_NODES, help="Most NODEs used per circuit.")
+    parser.add_argument("--max-pins-per-bus", type=int, default=Constraints.max_pins_per_bus,
+                        help=f"Most pins on one bus (default: {Constraints.max_pins_per_bus}).")
+    parser.add_argument("--connections", default=",".join(Constraints.connections),
+                        help=f"Comma-separated SBUS connections to draw from, of {', '.join(SBUS_CONNECTIONS)} "
+                             f"(default: {','.join(Constraints.connections)}).")
+    parser.add_argument("--devices", nargs="+", default=["*"], metavar="PATTERN",
+                        help="Devices to size, as glob patterns (e.g. 'DCC*' 'CC_N'; default: all).")
+    parser.add_argument("--size-range", nargs=2, type=int, default=[0, 31], metavar=("MIN", "MAX"),
+                        help="Range of the sizes drawn (default: 0 31).")
+    parser.add_argument("--size-points", type=int, default=1, help="Sizes per device (default: 1).")
+    parser.add_argument("--validate", action="store_true",
+                        help="Validate every candidate and report the ones with errors.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Worker processes rendering the JSON lines (default: all cores).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Candidates per worker task (default: {DEFAULT_CHUNK_SIZE}).")
+
+    args = parser.parse_args(argv)
+    constraints = Constraints(density=args.density, max_rbuses=args.max_rbuses, max_sbuses=args.max_sbuses,
+                              max_nodes=args.max_nodes, max_pins_per_bus=args.max_pins_per_bus,
+                              connections=tuple(filter(None, args.connections.split(","))),
+                              devices=tuple(args.devices), min_size=args.size_range[0],
+                              max_size=args.size_range[1], size_points=args.size_points)
+    try:
+        constraints.check()
+    except ValueError as e:
+        parser.error(str(e))
+    if args.count < 0:
+        parser.error("-n must be 0 (endless stream) or a positive number of candidates")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.output_dir and not args.count:
+        parser.error("--output-dir needs a number of candidates (-n)")
+
+    start = time.perf_counter()
+    if args.output_dir:
+        log = sys.stdout
+        invalid = []
+
+        def validated(stream):
+            for candidate in stream:
+                if args.validate and fails_validation(candidate):
+                    invalid.append(candidate.name)
+                yield candidate
+
+        written = write_candidates(validated(candidates(args.count or None, args.seed, constraints, args.kind,
+                                                        args.start)), args.output_dir)
+    else:
+        log = sys.stderr
+        workers = max(1, args.jobs or os.cpu_count() or 1)
+        try:
+            written, invalid = stream_candidates(sys.stdout, args.count or None, args.seed, constraints, args.kind,
+                                                 args.start, args.validate, workers, args.chunk_size)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # Endless streams end when the reader does, e.g. `mosbius fuzz -n 0 | head`
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 0
+    elapsed = time.perf_counter() - start
+
+    for name in invalid:
+        print(f"Error: {name} does not validate", file=log)
+    rate = written / elapsed if elapsed > 0 else float("inf")
+    print(f"Generated {written} candidates in {elapsed:.2f} s ({rate:.0f} candidates/s)"
+          + (f", {len(invalid)} failed validation" if args.validate else "")
+          + (f" into {args.output_dir}" if args.output_dir else ""), file=log)
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,57 +1,49 @@
 import json
-import os
-from datetime import datetime
 
-def generate_nodes_subckt(circuit_file, output_spice_file):
+from commandline import profiling
+from commandline.chip_config import load_chip_config, set_default_revision
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.incremental import build_hash, header_line, is_up_to_date
+from commandline.netlist_writer import log_redirect, warning, write_netlist
+from commandline.templates import NODES_TEMPLATE, subckt_template, template_path
+
+def node_connection_lines(circuit_data, pin_name_to_number, dialect, prefix="", warn=None):
     """
-    Generates a SPICE subcircuit file connecting chip pins to NODE nodes.
+    Generates the shorts connecting pins to VDD, VSS and the NODE nodes, without the subcircuit around them.
 
     Args:
-        circuit_file (str): Path to the circuit JSON file.
-        output_spice_file (str): Path to the output SPICE netlist file.
+        circuit_data (dict): Parsed circuit JSON.
+        pin_name_to_number (dict): Pin name -> package pin number of the chip configuration.
+        dialect (Dialect): Simulator dialect.
+        prefix (str): Prefix of the element and node names, e.g. "U1_" for one chip of a board.
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, line by line.
     """
-    # Define the paths to the necessary support files
-    chip_config_dir = os.path.join(os.path.dirname(__file__), "chip_config_data")
-    pin_mapping_file = os.path.join(chip_config_dir, "pin_name_to_number.json")
-    subckt_template_file = os.path.join(os.path.dirname(__file__), "subckt_templates", "PK_NODE_external_connections_template.cir")
-
-    print(f"Looking for pin mapping file at: {pin_mapping_file}")
-    print(f"Looking for template file at: {subckt_template_file}")
-
-    # Load the circuit JSON file
-    with open(circuit_file, "r") as f:
-        circuit_data = json.load(f)
-
-    # Load the pin mapping JSON file
-    with open(pin_mapping_file, "r") as f:
-        pin_name_to_number = json.load(f)
-
-    # Start building the SPICE subcircuit
-    spice_subcircuit = f"* File created on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    spice_subcircuit += f"* From {circuit_file}\n\n"
-
-    # Read the SPICE template
-    with open(subckt_template_file, "r") as f:
-        spice_template = f.read()
-    spice_subcircuit += spice_template + "\n"
+    elements = 0
 
     # Handle VDD connections (pin 13)
     for pin_name in circuit_data.get('VDD', []):
         pin_number = pin_name_to_number.get(pin_name)
         if pin_number is not None:
-            spice_subcircuit += f"* {pin_name} connected to VDD\n"
-            spice_subcircuit += f"Vshort_VDD_{pin_name} pin<{int(pin_number)}> pin<13> 0\n"
+            yield f"* {pin_name} connected to VDD\n"
+            yield dialect.short(f"V{prefix}short_VDD_{pin_name}", f"{prefix}pin<{int(pin_number)}>",
+                                f"{prefix}pin<13>")
+            elements += 1
         else:
-            print(f"Warning: Pin name '{pin_name}' not found in pin mapping")
+            warning(f"Pin name '{pin_name}' not found in pin mapping", warn)
 
     # Handle VSS connections (pin 1)
     for pin_name in circuit_data.get('VSS', []):
         pin_number = pin_name_to_number.get(pin_name)
         if pin_number is not None:
-            spice_subcircuit += f"* {pin_name} connected to VSS\n"
-            spice_subcircuit += f"Vshort_VSS_{pin_name} pin<{int(pin_number)}> pin<1> 0\n"
+            yield f"* {pin_name} connected to VSS\n"
+            yield dialect.short(f"V{prefix}short_VSS_{pin_name}", f"{prefix}pin<{int(pin_number)}>",
+                                f"{prefix}pin<1>")
+            elements += 1
         else:
-            print(f"Warning: Pin name '{pin_name}' not found in pin mapping")
+            warning(f"Pin name '{pin_name}' not found in pin mapping", warn)
 
     # Handle other nodes
     for node, pin_names in circuit_data.items():
@@ -62,39 +54,128 @@ def generate_nodes_subckt(circuit_file, output_spice_file):
         try:
             node_number = int(node.replace("NODE", "").strip("<>"))
         except ValueError:
-            print(f"Warning: Ignoring '{node}'")
+            warning(f"Ignoring '{node}'", warn)
             continue
 
         # Iterate through the pin names connected to this node
         for pin_name in pin_names:
             pin_number = pin_name_to_number.get(pin_name)
             if pin_number is not None:
-                spice_subcircuit += f"* {pin_name} connected to NODE<{node_number}>\n"
-                spice_subcircuit += f"Vshort_NODE_{node_number}_{pin_name} NODE<{node_number}> pin<{int(pin_number)}> 0\n"
+                yield f"* {pin_name} connected to NODE<{node_number}>\n"
+                yield dialect.short(f"V{prefix}short_NODE_{node_number}_{pin_name}", f"{prefix}NODE<{node_number}>",
+                                    f"{prefix}pin<{int(pin_number)}>")
+                elements += 1
             else:
-                print(f"Warning: Pin name '{pin_name}' not found in pin mapping")
+                warning(f"Pin name '{pin_name}' not found in pin mapping", warn)
+    profiling.count("elements", elements)
+
+def nodes_subckt_lines(circuit_data, source, chip_config=None, stamp=None, dialect=None, warn=None):
+    """
+    Generates the lines of the PK_NODE_external_connections subcircuit for a circuit description.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, line by line.
+    """
+    pin_name_to_number = (chip_config or load_chip_config()).pin_number
+    dialect = get_dialect(dialect)
+
+    # Start the SPICE subcircuit
+    yield header_line(stamp)
+    yield f"* From {source}\n\n"
+
+    # Add the SPICE template
+    template = subckt_template(NODES_TEMPLATE)
+    yield dialect.header(template)
+
+    yield from node_connection_lines(circuit_data, pin_name_to_number, dialect, warn=warn)
 
     # Close the subcircuit
-    spice_subcircuit += ".ENDS\n"
+    yield dialect.footer(template)
 
-    # Write the generated SPICE subcircuit to the output file
-    with open(output_spice_file, "w") as f:
-        f.write(spice_subcircuit)
+def write_nodes_subckt(circuit_data, output_file, source, chip_config=None, stamp=None, dialect=None):
+    """
+    Writes the PK_NODE_external_connections subcircuit for a circuit description.
 
-    print(f"SPICE subcircuit saved to {output_spice_file}")
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    write_netlist(output_file, nodes_subckt_lines(circuit_data, source, chip_config, stamp, dialect))
+
+def generate_nodes_subckt(circuit_file, output_spice_file, deterministic=False, incremental=False, dialect=None):
+    """
+    Generates a SPICE subcircuit file connecting chip pins to NODE nodes.
 
-def main():
+    Args:
+        circuit_file (str): Path to the circuit JSON file.
+        output_spice_file (str): Path to the output SPICE netlist file.
+        deterministic (bool): Record a build hash instead of the creation time.
+        incremental (bool): Skip the netlist if it was already built from the same inputs.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    with log_redirect(output_spice_file):
+        # Load the shared, pre-indexed chip configuration
+        chip_config = load_chip_config()
+
+        print(f"Using chip config data in: {chip_config.config_dir}")
+        print(f"Looking for template file at: {template_path(NODES_TEMPLATE)}")
+
+        # Load the circuit JSON file
+        with open(circuit_file, "r") as f, profiling.stage("parse"):
+            circuit_data = json.load(f)
+
+        # Replace the timestamp by the build hash for reproducible output
+        stamp = None
+        if deterministic or incremental:
+            stamp = build_hash(NODES_TEMPLATE, circuit_data, circuit_file, chip_config, dialect_options(dialect))
+
+        if incremental and is_up_to_date(output_spice_file, stamp):
+            print(f"SPICE subcircuit {output_spice_file} is up to date")
+        else:
+            # Stream the generated SPICE subcircuit to the output file
+            write_nodes_subckt(circuit_data, output_spice_file, circuit_file, chip_config, stamp, dialect)
+            print(f"SPICE subcircuit saved to {output_spice_file}")
+
+def main(argv=None, prog=None):
     import argparse
 
-    parser = argparse.ArgumentParser(description="Generate a SPICE subcircuit connecting pins to NODEs.")
+    parser = argparse.ArgumentParser(prog=prog, description="Generate a SPICE subcircuit connecting pins to NODEs.")
     parser.add_argument("circuit_file", help="Path to the circuit JSON file.")
-    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file.")
-
-    args = parser.parse_args()
+    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file ('-' for stdout).")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlist (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the netlist if it was already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--revision",
+                        help="Chip revision (e.g. 20250505) or chip configuration directory (default: current).")
+
+    args = parser.parse_args(argv)
+    if args.revision:
+        try:
+            set_default_revision(args.revision)
+        except ValueError as e:
+            parser.error(str(e))
 
     generate_nodes_subckt(
         circuit_file=args.circuit_file,
-        output_spice_file=args.output_spice_file
+        output_spice_file=args.output_spice_file,
+        deterministic=args.deterministic,
+        incremental=args.incremental,
+        dialect=args.dialect
     )
 
 if __name__ == "__main__":
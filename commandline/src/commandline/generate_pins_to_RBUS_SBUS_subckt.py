@@ -1,62 +1,69 @@
 import json
-import os
-from datetime import datetime
 
-def generate_pins_to_RBUS_SBUS_subckt(circuit_file, output_spice_file):
+from commandline import profiling
+from commandline.chip_config import load_chip_config, set_default_revision
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.incremental import build_hash, header_line, is_up_to_date
+from commandline.netlist_writer import log_redirect, warning, write_netlist
+from commandline.templates import PINS_TO_RBUS_SBUS_TEMPLATE, subckt_template, template_path
+
+def rbus_connection_lines(circuit_data, pin_mapping, dialect, prefix="", warn=None):
     """
-    Generates a SPICE subcircuit file connecting chip pins to RBUS and SBUS nodes.
+    Generates the shorts connecting every RBUS to the first of its package pins.
 
     Args:
-        circuit_file (str): Path to the circuit JSON file.
-        output_spice_file (str): Path to the output SPICE netlist file.
+        circuit_data (dict): Parsed circuit JSON.
+        pin_mapping (dict): Pin name -> package pin number of the chip configuration.
+        dialect (Dialect): Simulator dialect.
+        prefix (str): Prefix of the element and node names, e.g. "U1_" for one chip of a board.
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, line by line.
     """
-    # Define the paths to the necessary support files
-    chip_config_dir = os.path.join(os.path.dirname(__file__), "chip_config_data")
-    pin_mapping_file = os.path.join(chip_config_dir, "pin_name_to_number.json")
-    subckt_template_file = os.path.join(os.path.dirname(__file__), "subckt_templates/PK_pins_to_RBUS_SWBUS_template.cir")
-
-    print(f"Looking for pin mapping file at: {pin_mapping_file}")
-    print(f"Looking for template file at: {subckt_template_file}")
-
-    # Load the circuit JSON file
-    with open(circuit_file, "r") as f:
-        circuit_data = json.load(f)
-
-    # Load the pin mapping JSON file
-    with open(pin_mapping_file, "r") as f:
-        pin_mapping = json.load(f)
-
-    # Read the SPICE template
-    with open(subckt_template_file, "r") as f:
-        spice_template = f.read()
-
-    # Start building the SPICE subcircuit
-    spice_subcircuit = f"* File created on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    spice_subcircuit += f"* From {circuit_file}\n" + spice_template + "\n"
+    elements = 0
 
     # Iterate over each BUS in the circuit data
     for bus, pins in circuit_data.items():
-        # skip the SBUS (see below) and NODES (different subckt)
-        if bus.startswith('SBUS') or bus.startswith('NODE'):
+        # skip the SBUS (see below), NODES and supplies (different subckt)
+        if not bus.startswith('RBUS'):
             continue
         # Replace RBUS1 with RBUS<1>, RBUS2 with RBUS<2>, etc.
-        bus_with_brackets = bus.replace("RBUS", "RBUS<") + ">"
+        bus_with_brackets = prefix + bus.replace("RBUS", "RBUS<") + ">"
 
-        # Select the first pin from the list of connected pins
-        selected_pin = pins[0]
+        # Select the first connected pin that is a package pin (internal buses are not)
+        selected_pin = next((pin for pin in pins if pin in pin_mapping), None)
+        if selected_pin is None:
+            if pins:
+                warning(f"No pin of {bus} found in pin mapping, {bus} is not connected to a pin", warn)
+            continue
 
         # Get the pin number from the pin mapping
         pin_number = int(pin_mapping[selected_pin])
 
         # Add a comment indicating the connection
-        spice_subcircuit += f"* {bus} connected to {selected_pin} (pin<{pin_number}>)\n"
+        yield f"* {bus} connected to {selected_pin} (pin<{pin_number}>)\n"
 
         # Add a zero-volt voltage source for the connection
-        spice_subcircuit += f"V{bus}_to_pin{pin_number} {bus_with_brackets} pin<{pin_number}> 0\n"
+        yield dialect.short(f"V{prefix}{bus}_to_pin{pin_number}", bus_with_brackets,
+                            f"{prefix}pin<{pin_number}>")
+        elements += 1
+    profiling.count("elements", elements)
 
+def sbus_connection_lines(pin_mapping, dialect):
+    """
+    Generates the six shorts connecting the SWBUS nodes to their pins, the same for every circuit.
+
+    Args:
+        pin_mapping (dict): Pin name -> package pin number of the chip configuration.
+        dialect (Dialect): Simulator dialect.
+
+    Yields:
+        str: Netlist text, line by line.
+    """
     # Add SBUS connections
     # Add a comment indicating the connection
-    spice_subcircuit += f"* connecting SBUSes\n"
+    yield f"* connecting SBUSes\n"
     # SBUSes are directly connected to pins
     for sbus in range(1, 7):
         if sbus == 6:
@@ -67,29 +74,115 @@ def generate_pins_to_RBUS_SBUS_subckt(circuit_file, output_spice_file):
         pin_number = int(pin_mapping[bus])
 
         # Add a zero-volt voltage source for the connection
-        spice_subcircuit += f"V{bus}_to_pin{pin_number} {bus_with_brackets} pin<{pin_number}> 0\n"
+        yield dialect.short(f"V{bus}_to_pin{pin_number}", bus_with_brackets, f"pin<{pin_number}>")
+    profiling.count("elements", 6)
+
+def pins_to_RBUS_SBUS_subckt_lines(circuit_data, source, chip_config=None, stamp=None, dialect=None, warn=None):
+    """
+    Generates the lines of the PK_pins_to_RBUS_SWBUS subcircuit for a circuit description.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, line by line.
+    """
+    pin_mapping = (chip_config or load_chip_config()).pin_number
+    dialect = get_dialect(dialect)
+
+    # Start the SPICE subcircuit
+    yield header_line(stamp)
+    template = subckt_template(PINS_TO_RBUS_SBUS_TEMPLATE)
+    yield f"* From {source}\n" + dialect.header(template) + "\n"
+
+    yield from rbus_connection_lines(circuit_data, pin_mapping, dialect, warn=warn)
+    yield from sbus_connection_lines(pin_mapping, dialect)
 
     # Close the subcircuit in SPICE
-    spice_subcircuit += ".ENDS\n"
+    yield dialect.footer(template)
 
-    # Write the generated SPICE subcircuit to the output file
-    with open(output_spice_file, "w") as f:
-        f.write(spice_subcircuit)
+def write_pins_to_RBUS_SBUS_subckt(circuit_data, output_file, source, chip_config=None, stamp=None, dialect=None):
+    """
+    Writes the PK_pins_to_RBUS_SWBUS subcircuit for a circuit description.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    write_netlist(output_file, pins_to_RBUS_SBUS_subckt_lines(circuit_data, source, chip_config, stamp, dialect))
 
-    print(f"SPICE subcircuit saved to {output_spice_file}")
+def generate_pins_to_RBUS_SBUS_subckt(circuit_file, output_spice_file, deterministic=False, incremental=False, dialect=None):
+    """
+    Generates a SPICE subcircuit file connecting chip pins to RBUS and SBUS nodes.
 
-def main():
+    Args:
+        circuit_file (str): Path to the circuit JSON file.
+        output_spice_file (str): Path to the output SPICE netlist file.
+        deterministic (bool): Record a build hash instead of the creation time.
+        incremental (bool): Skip the netlist if it was already built from the same inputs.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    with log_redirect(output_spice_file):
+        # Load the shared, pre-indexed chip configuration
+        chip_config = load_chip_config()
+
+        print(f"Using chip config data in: {chip_config.config_dir}")
+        print(f"Looking for template file at: {template_path(PINS_TO_RBUS_SBUS_TEMPLATE)}")
+
+        # Load the circuit JSON file
+        with open(circuit_file, "r") as f, profiling.stage("parse"):
+            circuit_data = json.load(f)
+
+        # Replace the timestamp by the build hash for reproducible output
+        stamp = None
+        if deterministic or incremental:
+            stamp = build_hash(PINS_TO_RBUS_SBUS_TEMPLATE, circuit_data, circuit_file, chip_config,
+                               dialect_options(dialect))
+
+        if incremental and is_up_to_date(output_spice_file, stamp):
+            print(f"SPICE subcircuit {output_spice_file} is up to date")
+        else:
+            # Stream the generated SPICE subcircuit to the output file
+            write_pins_to_RBUS_SBUS_subckt(circuit_data, output_spice_file, circuit_file, chip_config, stamp, dialect)
+            print(f"SPICE subcircuit saved to {output_spice_file}")
+
+def main(argv=None, prog=None):
     import argparse
 
-    parser = argparse.ArgumentParser(description="Generate a SPICE subcircuit connecting pins to RBUS and SBUS.")
+    parser = argparse.ArgumentParser(prog=prog, description="Generate a SPICE subcircuit connecting pins to RBUS and SBUS.")
     parser.add_argument("circuit_file", help="Path to the circuit JSON file.")
-    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file.")
-
-    args = parser.parse_args()
+    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file ('-' for stdout).")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlist (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the netlist if it was already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--revision",
+                        help="Chip revision (e.g. 20250505) or chip configuration directory (default: current).")
+
+    args = parser.parse_args(argv)
+    if args.revision:
+        try:
+            set_default_revision(args.revision)
+        except ValueError as e:
+            parser.error(str(e))
 
     generate_pins_to_RBUS_SBUS_subckt(
         circuit_file=args.circuit_file,
-        output_spice_file=args.output_spice_file
+        output_spice_file=args.output_spice_file,
+        deterministic=args.deterministic,
+        incremental=args.incremental,
+        dialect=args.dialect
     )
 
 if __name__ == "__main__":
@@ -1,95 +1,228 @@
 import json
-import os
-from datetime import datetime
-import importlib.resources
 
-def generate_sizes_probe_subckt(sizes_file, output_spice_file):
+from commandline import profiling
+from commandline.bitstream import DUMP_FORMATS, write_register_dump
+from commandline.chip_config import load_chip_config, set_default_revision
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.incremental import build_hash, header_line, is_up_to_date
+from commandline.netlist_writer import TIE_STYLES, log_redirect, warning, write_netlist
+from commandline.registers import RegisterImage, map_sizes
+from commandline.templates import SIZES_TEMPLATE, subckt_template, template_path
+
+def device_size(sizes, device):
     """
-    Combines the generation of register settings and SPICE netlist into one function.
+    Returns the size of `device` from a parsed sizing JSON.
 
-    Args:
-        sizes_file (str): Path to the JSON file containing device sizes.
-        output_spice_file (str): Path to the output SPICE netlist file.
+    Missing devices and empty size lists default to 0.
     """
-    # Define the path to the chip_config_data directory
-    # Use the package resource path instead of relative paths
-    chip_config_dir = os.path.join(os.path.dirname(__file__), "chip_config_data")
-    registers_file = os.path.join(chip_config_dir, "device_name_to_sizing_registers.json")
+    return (sizes.get(device) or [0])[0]
 
-    # Define the path to the subckt template file
-    subckt_template_file = os.path.join(os.path.dirname(__file__), "subckt_templates/PK_set_sizes_template.cir")
+def size_param(device):
+    """Returns the name of the `.param` holding the size of `device` in parameterized netlists."""
+    return f"size_{device}"
 
-    print(f"Looking for registers file at: {registers_file}")
-    print(f"Looking for template file at: {subckt_template_file}")
+def size_bit_expression(param, weight):
+    """Returns the expression decoding the bit of weight `weight` (0 or 1) from the size parameter `param`."""
+    high = f"2*floor({param}/{2 * weight})"
+    return f"{param}-{high}" if weight == 1 else f"floor({param}/{weight})-{high}"
 
-    # Load sizes and registers
-    with open(sizes_file, "r") as f:
-        sizes = json.load(f)
+@profiling.timed("validate")
+def validated_device_sizes(sizes, chip_config=None, warn=None):
+    """
+    Returns the size of every device in `chip_config.sizing_devices` order.
 
-    with open(registers_file, "r") as f:
-        registers = json.load(f)
+    Sizes that are not 5-bit numbers are reported (printed, or passed to `warn`) and replaced by 0.
+    """
+    device_sizes = []
+    for device in (chip_config or load_chip_config()).sizing_devices:
+        size = device_size(sizes, device)  # Default size to 0 if device is not in sizes.json
+        if not (0 <= size <= 31):  # Validate size is a 5-bit number
+            warning(f"Size {size} for device {device} is not a 5-bit number.", warn)
+            size = 0
+        device_sizes.append(size)
+    return device_sizes
 
-    # Read the entire subckt template file as a string
-    with open(subckt_template_file, "r") as f:
-        subckt_header = f.read()
+def sizes_probe_subckt_lines(sizes, source, chip_config=None, image=None, tie_style="vsource", stamp=None,
+                             probe_params=None, parameterized=False, dialect=None, warn=None):
+    """
+    Generates the lines of the PK_set_sizes_2 subcircuit for a set of device sizes.
 
-    # Initialize the output dictionary for register settings
-    register_settings = {}
+    Args:
+        sizes (dict): Parsed sizing JSON.
+        source (str): Name of the sizing description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Register image receiving the sizing settings;
+            a new image by default.
+        tie_style (str): How bits at VSS are tied off, "vsource" or "connect".
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        probe_params (dict): Register -> parameter name, for bits whose level is selected with
+            `.param` (see commandline.diff).
+        parameterized (bool): Drive every bit from a per-device `.param size_<device>` (the sizes
+            of `sizes` are its default values), so the sizes can be changed without regenerating
+            the netlist; overrides `tie_style` and `probe_params`.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, line by line.
+    """
+    chip_config = chip_config or load_chip_config()
+    dialect = get_dialect(dialect)
+    dialect.check_tie_style(tie_style)
+    registers = chip_config.sizing_registers
+    params = probe_params or {}
+
+    # Map the sizes into the chip register image
+    device_sizes = validated_device_sizes(sizes, chip_config, warn)
+    image = map_sizes(device_sizes, chip_config, image)
+
+    # Write the SPICE header
+    yield header_line(stamp)
+    yield f"* From {source}\n"
+
+    # Write the subckt header from the template file
+    template = subckt_template(SIZES_TEMPLATE)
+    yield dialect.header(template)
+
+    # Iterate through each device, sorted by device name
+    for device in sorted(registers.keys()):
+        yield f"* Device: {device} Size: {device_size(sizes, device)}\n"  # Add a comment for the device
+        if parameterized:
+            # The bit follows the size parameter: PROBE = VSS + bit * (VDD - VSS)
+            for bit, register in registers[device]:
+                yield dialect.probe(f"V_{device}_{register}", register, None,
+                                    expression=size_bit_expression(size_param(device), bit))
+            yield "\n"
+            continue
+        for bit, register in registers[device]:
+            if image.values[register]:
+                yield dialect.probe(f"V_{device}_{register}", register, "VDD", tie_style, params.get(register))
+            else:
+                yield dialect.probe(f"V_{device}_{register}", register, "VSS", tie_style, params.get(register))
+        yield "\n"  # Add a blank line after each device group
+
+    # Write the SPICE footer
+    yield dialect.footer(template)
+    profiling.count("elements", len(chip_config.sizing_register_index))
+
+    if parameterized:
+        # Default sizes; override these parameters (e.g. in .alter blocks or sweeps) to resize the devices
+        yield "\n* Device sizes (0 to 31)\n"
+        yield dialect.params({size_param(device): size for device, size in zip(chip_config.sizing_devices, device_sizes)})
+
+def write_sizes_probe_subckt(sizes, output_file, source, chip_config=None, image=None, tie_style="vsource", stamp=None,
+                             probe_params=None, parameterized=False, dialect=None):
+    """
+    Writes the PK_set_sizes_2 subcircuit for a set of device sizes.
 
-    # Generate register settings
-    for device, bit_to_register in registers.items():
-        size = sizes.get(device, [0])[0]  # Default size to 0 if device is not in sizes.json
-        if not (0 <= size <= 31):  # Validate size is a 5-bit number
-            print(f"Warning: Size {size} for device {device} is not a 5-bit number.")
-            size = 0
+    Args:
+        sizes (dict): Parsed sizing JSON.
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        source (str): Name of the sizing description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Optional register image receiving the sizing settings.
+        tie_style (str): How bits at VSS are tied off, "vsource" or "connect".
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        probe_params (dict): Register -> parameter name, for bits whose level is selected with `.param`.
+        parameterized (bool): Drive every bit from a per-device `.param size_<device>`.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    write_netlist(output_file, sizes_probe_subckt_lines(sizes, source, chip_config, image, tie_style, stamp, probe_params,
+                                                        parameterized, dialect))
+
+def generate_sizes_probe_subckt(sizes_file, output_spice_file, register_dump=None, dump_format=None, tie_style="vsource",
+                                deterministic=False, incremental=False, parameterized=False, dialect=None):
+    """
+    Combines the generation of register settings and SPICE netlist into one function.
 
-        # Iterate through the registers and set their values based on the size
-        for bit, register in sorted(bit_to_register.items(), key=lambda x: int(x[0])):
-            register_settings[register] = 1 if int(bit) & size else 0
-
-    # Sort the output dictionary by register number
-    sorted_register_settings = dict(sorted(register_settings.items()))
-
-    # Generate SPICE netlist
-    with open(output_spice_file, "w") as f:
-        # Write the SPICE header
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"* File created on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"* From {sizes_file}\n")
-
-        # Write the subckt header from the template file
-        f.write(subckt_header + "\n")
-
-        # Iterate through each device, sorted by device name
-        for device in sorted(registers.keys()):
-            f.write(f"* Device: {device} Size: {sizes.get(device, [0])[0]}\n")  # Add a comment for the device
-            bit_to_register = registers[device]
-            for bit, register in sorted(bit_to_register.items(), key=lambda x: int(x[0])):
-                register_value = sorted_register_settings.get(register, 0)
-                if register_value == 1:
-                    f.write(f"V_{device}_{register} PROBE<{register}> VDD 0\n")
-                else:
-                    f.write(f"V_{device}_{register} PROBE<{register}> VSS 0\n")
-            f.write("\n")  # Add a blank line after each device group
-
-        # Write the SPICE footer
-        f.write(".ENDS\n")
-
-    print(f"SPICE netlist saved to {output_spice_file}")
-
-def main():
+    Args:
+        sizes_file (str): Path to the JSON file containing device sizes.
+        output_spice_file (str): Path to the output SPICE netlist file.
+        register_dump (str): Optional path for a packed dump of the register state.
+        dump_format (str): "bin", "hex" or "json"; defaults to the extension of `register_dump`.
+        tie_style (str): How bits at VSS are tied off, "vsource" or "connect".
+        deterministic (bool): Record a build hash instead of the creation time.
+        incremental (bool): Skip the netlist if it was already built from the same inputs.
+        parameterized (bool): Drive the bits from per-device `.param size_<device>` parameters.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    with log_redirect(output_spice_file):
+        # Load the shared, pre-indexed chip configuration
+        chip_config = load_chip_config()
+
+        print(f"Using chip config data in: {chip_config.config_dir}")
+        print(f"Looking for template file at: {template_path(SIZES_TEMPLATE)}")
+
+        # Load sizes
+        with open(sizes_file, "r") as f, profiling.stage("parse"):
+            sizes = json.load(f)
+
+        # Replace the timestamp by the build hash for reproducible output
+        stamp = None
+        if deterministic or incremental:
+            options = ((tie_style, "parameterized") if parameterized else (tie_style,)) + dialect_options(dialect)
+            stamp = build_hash(SIZES_TEMPLATE, sizes, sizes_file, chip_config, options)
+
+        image = RegisterImage.for_chip(chip_config)
+        if incremental and is_up_to_date(output_spice_file, stamp):
+            print(f"SPICE netlist {output_spice_file} is up to date")
+            if register_dump:
+                map_sizes(validated_device_sizes(sizes, chip_config), chip_config, image)
+        else:
+            # Generate SPICE netlist
+            write_sizes_probe_subckt(sizes, output_spice_file, sizes_file, chip_config, image, tie_style, stamp,
+                                     parameterized=parameterized, dialect=dialect)
+            print(f"SPICE netlist saved to {output_spice_file}")
+
+        if register_dump:
+            write_register_dump(image, register_dump, dump_format)
+            print(f"Register dump saved to {register_dump}")
+
+def main(argv=None, prog=None):
     import argparse
 
-    parser = argparse.ArgumentParser(description="Generate a SPICE subcircuit based on device sizes.")
+    parser = argparse.ArgumentParser(prog=prog, description="Generate a SPICE subcircuit based on device sizes.")
     parser.add_argument("sizes_file", help="Path to the JSON file containing device sizes.")
-    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file.")
-
-    args = parser.parse_args()
+    parser.add_argument("output_spice_file", help="Path to the output SPICE netlist file ('-' for stdout).")
+    parser.add_argument("--register-dump", help="Also write the packed register state to this file.")
+    parser.add_argument("--dump-format", choices=DUMP_FORMATS,
+                        help="Format of the register dump (default: from the file extension, else 'bin').")
+    parser.add_argument("--tie-style", choices=TIE_STYLES, default="vsource",
+                        help="Tie bits at VSS off with zero-volt sources (default) or with .connect node aliases.")
+    parser.add_argument("--parameterized", action="store_true",
+                        help="Decode every bit from a per-device .param size_<device>, so the sizes can be swept "
+                             "without regenerating the netlist.")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlist (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the netlist if it was already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--revision",
+                        help="Chip revision (e.g. 20250505) or chip configuration directory (default: current).")
+
+    args = parser.parse_args(argv)
+    try:
+        get_dialect(args.dialect).check_tie_style(args.tie_style)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.revision:
+        try:
+            set_default_revision(args.revision)
+        except ValueError as e:
+            parser.error(str(e))
 
     generate_sizes_probe_subckt(
         sizes_file=args.sizes_file,
-        output_spice_file=args.output_spice_file
+        output_spice_file=args.output_spice_file,
+        register_dump=args.register_dump,
+        dump_format=args.dump_format,
+        tie_style=args.tie_style,
+        deterministic=args.deterministic,
+        incremental=args.incremental,
+        parameterized=args.parameterized,
+        dialect=args.dialect
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
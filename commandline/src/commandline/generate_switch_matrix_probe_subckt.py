@@ -1,135 +1,176 @@
+import functools
 import json
-import os
-from datetime import datetime
-
-def generate_switch_matrix_probe_subckt(circuit_json_path, output_path):
-    # Define the path to the chip_config_data directory
-    chip_config_dir = os.path.join(os.path.dirname(__file__), "chip_config_data")
-
-    # Load the pin-to-switch matrix mapping JSON
-    pin_map_path = os.path.join(chip_config_dir, "pin_name_to_sw_matrix_pin_number.json")
-    print(f"Looking for pin map file at: {pin_map_path}")
-    with open(pin_map_path, 'r') as pin_map_file:
-        pin_to_sw_matrix = json.load(pin_map_file)
-
-    # Load the switch matrix-to-register mapping JSON
-    register_map_path = os.path.join(chip_config_dir, "switch_matrix_register_map.json")
-    print(f"Looking for register map file at: {register_map_path}")
-    with open(register_map_path, 'r') as register_map_file:
-        sw_matrix_to_register = json.load(register_map_file)
-
-    # Load the SPICE template
-    template_path = os.path.join(os.path.dirname(__file__), "subckt_templates/PK_set_SWMATRIX_template.cir")
-    print(f"Looking for template file at: {template_path}")
-    with open(template_path, 'r') as template_file:
-        spice_header = template_file.readlines()
-
-    # Load the circuit JSON
-    with open(circuit_json_path, 'r') as circuit_file:
-        circuit_data = json.load(circuit_file)
-
-    # Open the output file for writing
-    with open(output_path, 'w') as output_file:
-        # Write the SPICE template header
-        creation_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        output_file.writelines(f"* File created on: {creation_time}\n")
-        output_file.writelines(f"* From {circuit_json_path}\n")
-        output_file.writelines(spice_header)
-
-        # Track connected probes
-        connected_probes = set()
-
-        # Iterate through each connection in the circuit JSON
-        for bus, entries in circuit_data.items():
-            if bus.startswith("RBUS"):
-                # Handle RBUS
-                for pin in entries:
-                    sw_matrix_pin = pin_to_sw_matrix.get(pin, None)
-                    if sw_matrix_pin is None:
-                        print(f"Warning: Pin '{pin}' not found in pin-to-switch matrix mapping")
-                        continue
-                    # Support both numeric and string sw_matrix_pin
-                    if isinstance(sw_matrix_pin, str):
-                        register = sw_matrix_to_register.get(sw_matrix_pin, {}).get(bus, None)
-                    else:
-                        register = sw_matrix_to_register.get(str(int(sw_matrix_pin)), {}).get(bus, None)
-
-                    if register is None:
-                        print(f"Warning: Register not found for sw_matrix_pin '{sw_matrix_pin}' and bus '{bus}'")
-                        continue
-
-                    output_file.write(f"* Connection: {bus}, Pin: {pin}, sw_matrix_pin: {sw_matrix_pin}, Register: {register}\n")
-                    output_file.write(f"V{pin}_to_{bus} PROBE<{int(register)}> VDD 0\n")
-                    connected_probes.add(int(register))
-
-            elif bus.startswith("SBUS"):
-                # Handle SBUS
-                for entry in entries:
-                    terminal = entry["terminal"]
-                    connection = entry["connection"]
-
-                    # Determine SBUSa and SBUSb keys
-                    sbus_a = f"{bus}a"
-                    sbus_b = f"{bus}b"
-                    sw_matrix_pin = pin_to_sw_matrix.get(terminal, None)
-                    if sw_matrix_pin is None:
-                        print(f"Warning: Pin '{terminal}' not found in pin-to-switch matrix mapping")
-                        continue
-                    # Support both numeric and string sw_matrix_pin
-                    if not isinstance(sw_matrix_pin, str):
-                        sw_matrix_pin = str(int(sw_matrix_pin))
-                    register_a = sw_matrix_to_register.get(sw_matrix_pin, {}).get(sbus_a, None)
-                    register_b = sw_matrix_to_register.get(sw_matrix_pin, {}).get(sbus_b, None)
-                    if (register_a is None) or (register_b is None):
-                        print(f"Warning: Register not found for sw_matrix_pin '{sw_matrix_pin}' and buses '{sbus_a} and {sbus_b}'")
-                        continue
-
-                    # Decode the type of connection
-                    if connection == "ON":
-                        sbus_a_connection = "VDD"
-                        sbus_b_connection = "VDD"
-                    elif connection == "PHI1":
-                        sbus_a_connection = "VDD"
-                        sbus_b_connection = "VSS"
-                    elif connection == "PHI2":
-                        sbus_a_connection = "VSS"
-                        sbus_b_connection = "VDD"
-                    else:  # Default to "OFF"
-                        sbus_a_connection = "VSS"
-                        sbus_b_connection = "VSS"
-
-                    # Write SBUSa and SBUSb connections
-                    output_file.write(f"* Connection: {bus}, Terminal: {terminal}, Connection Key: {connection}\n")
-                    output_file.write(f"V{register_a}_to_{terminal} PROBE<{register_a}> {sbus_a_connection} 0\n")
-                    output_file.write(f"V{register_b}_to_{terminal} PROBE<{register_b}> {sbus_b_connection} 0\n")
-
-                    # Mark these probes as connected
-                    connected_probes.add(int(register_a))
-                    connected_probes.add(int(register_b))
-
-        # By default, connect all unused probes to VSS
-        for probe in range(1, 1889):  # Assuming 1888 probes
-            if probe not in connected_probes:
-                output_file.write(f"Vprobe_{probe}_to_VSS PROBE<{probe}> VSS 0\n")
-
-        # Write the SPICE footer
-        output_file.write(".ENDS\n")
-
-        print(f"SPICE netlist saved to {output_path}")
-
-def main():
+
+from commandline import profiling
+from commandline.bitstream import DUMP_FORMATS, write_register_dump
+from commandline.chip_config import load_chip_config, set_default_revision
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.incremental import build_hash, header_line, is_up_to_date
+from commandline.netlist_writer import TIE_STYLES, log_redirect, write_netlist
+from commandline.registers import RegisterImage, map_switch_matrix
+from commandline.templates import SWITCH_MATRIX_TEMPLATE, subckt_template, template_path
+
+@functools.lru_cache(maxsize=None)
+def _unused_probe_lines(num_probes, tie_style, dialect):
+    """Returns the tie-off line of every probe (index 0 unused), rendered once per process."""
+    return ("",) + tuple(dialect.probe(f"Vprobe_{probe}_to_VSS", probe, "VSS", tie_style)
+                         for probe in range(1, num_probes + 1))
+
+def switch_matrix_probe_subckt_lines(circuit_data, source, chip_config=None, image=None, tie_style="vsource", stamp=None,
+                                     probe_params=None, dialect=None, warn=None):
+    """
+    Generates the lines of the PK_set_SWMATRIX subcircuit for a circuit description.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Register image receiving the switch matrix settings;
+            a new image by default.
+        tie_style (str): How probes at VSS are tied off, "vsource" or "connect".
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        probe_params (dict): Register -> parameter name, for probes whose level is selected with
+            `.param` (see commandline.diff).
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Yields:
+        str: Netlist text, a line or a block of lines at a time.
+    """
+    chip_config = chip_config or load_chip_config()
+    dialect = get_dialect(dialect)
+    dialect.check_tie_style(tie_style)
+    template = subckt_template(SWITCH_MATRIX_TEMPLATE)
+
+    # Write the SPICE template header
+    yield header_line(stamp)
+    yield f"* From {source}\n"
+    yield dialect.header(template)
+
+    # Map the RBUS and SBUS connections into the chip register image
+    image, connections = map_switch_matrix(circuit_data, chip_config, image, warn)
+    levels = ("VSS", "VDD")
+    params = probe_params or {}
+
+    for connection in connections:
+        if connection[0] == "RBUS":
+            _, bus, pin, sw_matrix_pin, register = connection
+            yield f"* Connection: {bus}, Pin: {pin}, sw_matrix_pin: {sw_matrix_pin}, Register: {register}\n"
+            yield dialect.probe(f"V{pin}_to_{bus}", register, levels[image.values[register]], tie_style,
+                                params.get(register))
+        else:
+            _, bus, terminal, connection_key, register_a, register_b = connection
+            yield f"* Connection: {bus}, Terminal: {terminal}, Connection Key: {connection_key}\n"
+            yield dialect.probe(f"V{register_a}_to_{terminal}", register_a, levels[image.values[register_a]],
+                                tie_style, params.get(register_a))
+            yield dialect.probe(f"V{register_b}_to_{terminal}", register_b, levels[image.values[register_b]],
+                                tie_style, params.get(register_b))
+
+    # By default, connect all unused probes to VSS
+    unused_lines = _unused_probe_lines(chip_config.num_switch_matrix_probes, tie_style, dialect)
+    unused = image.unassigned(1, chip_config.num_switch_matrix_probes)
+    yield "".join([unused_lines[probe] if probe not in params
+                   else dialect.probe(f"Vprobe_{probe}_to_VSS", probe, "VSS", tie_style, params[probe])
+                   for probe in unused])
+    profiling.count("elements", sum(1 if connection[0] == "RBUS" else 2 for connection in connections) + len(unused))
+    profiling.count("probes_defaulted", len(unused))
+
+    # Write the SPICE footer
+    yield dialect.footer(template)
+
+def write_switch_matrix_probe_subckt(circuit_data, output_file, source, chip_config=None, image=None, tie_style="vsource",
+                                     stamp=None, probe_params=None, dialect=None):
+    """
+    Writes the PK_set_SWMATRIX subcircuit for a circuit description.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        source (str): Name of the circuit description, recorded in the header.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Optional register image receiving the switch matrix settings.
+        tie_style (str): How probes at VSS are tied off, "vsource" or "connect".
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        probe_params (dict): Register -> parameter name, for probes whose level is selected with `.param`.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    write_netlist(output_file, switch_matrix_probe_subckt_lines(circuit_data, source, chip_config, image, tie_style, stamp,
+                                                                probe_params, dialect))
+
+def generate_switch_matrix_probe_subckt(circuit_json_path, output_path, register_dump=None, dump_format=None, tie_style="vsource",
+                                        deterministic=False, incremental=False, dialect=None):
+    with log_redirect(output_path):
+        # Load the shared, pre-indexed chip configuration
+        chip_config = load_chip_config()
+        print(f"Using chip config data in: {chip_config.config_dir}")
+        print(f"Looking for template file at: {template_path(SWITCH_MATRIX_TEMPLATE)}")
+
+        # Load the circuit JSON
+        with open(circuit_json_path, 'r') as circuit_file, profiling.stage("parse"):
+            circuit_data = json.load(circuit_file)
+
+        # Replace the timestamp by the build hash for reproducible output
+        stamp = None
+        if deterministic or incremental:
+            stamp = build_hash(SWITCH_MATRIX_TEMPLATE, circuit_data, circuit_json_path, chip_config,
+                               (tie_style,) + dialect_options(dialect))
+
+        image = RegisterImage.for_chip(chip_config)
+        if incremental and is_up_to_date(output_path, stamp):
+            print(f"SPICE netlist {output_path} is up to date")
+            if register_dump:
+                map_switch_matrix(circuit_data, chip_config, image)
+        else:
+            # Stream the netlist to the output
+            write_switch_matrix_probe_subckt(circuit_data, output_path, circuit_json_path, chip_config, image,
+                                             tie_style, stamp, dialect=dialect)
+            print(f"SPICE netlist saved to {output_path}")
+
+        if register_dump:
+            write_register_dump(image, register_dump, dump_format)
+            print(f"Register dump saved to {register_dump}")
+
+def main(argv=None, prog=None):
     import argparse
 
-    parser = argparse.ArgumentParser(description="Generate a SPICE subcircuit for PROBE connections.")
+    parser = argparse.ArgumentParser(prog=prog, description="Generate a SPICE subcircuit for PROBE connections.")
     parser.add_argument("circuit_json_path", help="Path to the circuit JSON file.")
-    parser.add_argument("output_path", help="Path to the output SPICE file.")
-
-    args = parser.parse_args()
+    parser.add_argument("output_path", help="Path to the output SPICE file ('-' for stdout).")
+    parser.add_argument("--register-dump", help="Also write the packed register state to this file.")
+    parser.add_argument("--dump-format", choices=DUMP_FORMATS,
+                        help="Format of the register dump (default: from the file extension, else 'bin').")
+    parser.add_argument("--tie-style", choices=TIE_STYLES, default="vsource",
+                        help="Tie probes at VSS off with zero-volt sources (default) or with .connect node aliases.")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlist (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the netlist if it was already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--revision",
+                        help="Chip revision (e.g. 20250505) or chip configuration directory (default: current).")
+
+    args = parser.parse_args(argv)
+    try:
+        get_dialect(args.dialect).check_tie_style(args.tie_style)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.revision:
+        try:
+            set_default_revision(args.revision)
+        except ValueError as e:
+            parser.error(str(e))
 
     generate_switch_matrix_probe_subckt(
         circuit_json_path=args.circuit_json_path,
-        output_path=args.output_path
+        output_path=args.output_path,
+        register_dump=args.register_dump,
+        dump_format=args.dump_format,
+        tie_style=args.tie_style,
+        deterministic=args.deterministic,
+        incremental=args.incremental,
+        dialect=args.dialect
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,88 @@
+"""
+Reproducible netlist headers and incremental regeneration.
+
+By default every netlist starts with a `* File created on:` timestamp, so the
+output changes on every run even if nothing else did. In deterministic mode
+the timestamp is replaced by a build hash:
+
+    * Build hash: sha256:<hex digest>
+
+The hash covers everything the netlist depends on: the tool version, the
+generator (its template name and text), the chip configuration data, the
+parsed input JSON, the source name recorded in the header and the generator
+options. Identical inputs therefore give byte-identical netlists, and in
+incremental mode a netlist whose build hash already matches is not rewritten.
+"""
+
+import functools
+import json
+import os
+import time
+
+from commandline.netlist_writer import STDOUT
+from commandline.templates import load_template
+
+BUILD_HASH_PREFIX = "* Build hash: "
+PACKAGE_NAME = "mosbiusv2tools"
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version():
+    """Returns the installed version of the tools, or "unknown" when running from a source tree."""
+    from importlib import metadata
+
+    try:
+        return metadata.version(PACKAGE_NAME)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def build_hash(template, data, source, chip_config, options=()):
+    """
+    Returns the build hash of a netlist.
+
+    Args:
+        template (str): Template name of the generator (e.g. SWITCH_MATRIX_TEMPLATE).
+        data: Parsed input JSON.
+        source (str): Name of the input, recorded in the header.
+        chip_config (ChipConfig): Chip configuration used for the netlist.
+        options (tuple): Generator options that change the output (e.g. the tie style).
+
+    Returns:
+        str: "sha256:" followed by the hex digest.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    # Key order is kept: it determines the order of the netlist lines
+    for part in (tool_version(), template, load_template(template), chip_config.digest,
+                 json.dumps(data, separators=(",", ":")), str(source), repr(tuple(options))):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return f"sha256:{digest.hexdigest()}"
+
+
+def header_line(stamp=None):
+    """Returns the first netlist line: the build hash `stamp` if given, else the creation time."""
+    if stamp is not None:
+        return f"{BUILD_HASH_PREFIX}{stamp}\n"
+    return f"* File created on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+
+
+def read_build_hash(path):
+    """Returns the build hash recorded in the netlist at `path`, or None."""
+    try:
+        with open(path, "r") as f:
+            first_line = f.readline()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if first_line.startswith(BUILD_HASH_PREFIX):
+        return first_line[len(BUILD_HASH_PREFIX):].strip()
+    return None
+
+
+def is_up_to_date(path, stamp):
+    """Returns True if the netlist at `path` exists and was built with the build hash `stamp`."""
+    if path == STDOUT or not isinstance(path, (str, os.PathLike)):
+        return False
+    return read_build_hash(path) == stamp
@@ -0,0 +1,213 @@
+"""
+One NODE and RBUS netlist for a board or array of MOSbius chips: `mosbius multichip`.
+
+PK_NODE_external_connections and PK_pins_to_RBUS_SWBUS describe the pins of
+one chip. A testbench with dozens of chips would include one copy of each per
+chip, with the fixed SWBUS shorts repeated every time. The multi-chip netlist
+instead writes, for a list of per-chip circuit JSONs, one flat netlist:
+
+    PK_SWBUS_pins               the six SWBUS shorts, defined once
+    * U1 from a.json
+    XU1_SWBUS U1_SWBUS<1> ... U1_pin<..> PK_SWBUS_pins
+    VU1_RBUS1_to_pin5 U1_RBUS<1> U1_pin<5> 0
+    VU1_short_NODE_1_OTA_N_OUT U1_NODE<1> U1_pin<42> 0
+    * U2 from b.json
+    ...
+
+Every node and element of a chip is prefixed with its instance name, so the
+testbench connects chip U1 through the nodes U1_pin<n>, U1_RBUS<k>,
+U1_SWBUS<k> and U1_NODE<k>. The simulator preamble is written once as well.
+The circuit JSONs are parsed one at a time while the netlist is streamed, so
+generation time and output size grow linearly with the number of chips.
+
+    mosbius multichip 'board/*.json' -o board_connections.cir
+    mosbius multichip -m board.json -o - --dialect spectre
+
+The manifest is a JSON list of {"name", "circuit"} entries as for `mosbius
+batch`; chips given as files are named after them.
+"""
+
+import json
+import re
+from collections import Counter
+
+from commandline import profiling
+from commandline.batch import designs_from_files, load_manifest
+from commandline.chip_config import load_chip_config, set_default_revision
+from commandline.dialects import DIALECTS, dialect_options, get_dialect
+from commandline.generate_nodes_subckt import node_connection_lines
+from commandline.generate_pins_to_RBUS_SBUS_subckt import rbus_connection_lines, sbus_connection_lines
+from commandline.incremental import build_hash, header_line, is_up_to_date
+from commandline.netlist_writer import log_redirect, write_netlist
+from commandline.templates import PINS_TO_RBUS_SBUS_TEMPLATE, SubcktTemplate
+
+SWBUS_SUBCKT = "PK_SWBUS_pins"
+SBUS_PINS = ("SBUS1", "SBUS2", "SBUS3", "SBUS4", "SBUS5", "DATA_SBUS6")
+
+_INSTANCE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def swbus_template(pin_mapping):
+    """Returns the `SubcktTemplate` of the shared subcircuit shorting the SWBUS nodes to their pins."""
+    ports = tuple(f"SWBUS<{sbus}>" for sbus in range(1, 7))
+    ports += tuple(f"pin<{int(pin_mapping[pin])}>" for pin in SBUS_PINS)
+    preamble = "\nsimulator lang=spice\n\n"
+    return SubcktTemplate(SWBUS_SUBCKT, None, preamble, SWBUS_SUBCKT, ports,
+                          f"{preamble}.SUBCKT {SWBUS_SUBCKT} {' '.join(ports[:6])}\n+ {' '.join(ports[6:])}\n")
+
+
+def instance_name(name):
+    """Returns `name` with the characters not allowed in an instance name replaced by '_'."""
+    name = re.sub(r"\W", "_", name)
+    return name if _INSTANCE_NAME.match(name) else f"U_{name}"
+
+
+def multichip_lines(instances, chip_config=None, stamp=None, dialect=None):
+    """
+    Generates the lines of the multi-chip NODE and RBUS netlist.
+
+    Args:
+        instances: Iterable of (instance name, parsed circuit JSON, source) tuples, consumed
+            while the netlist is generated.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+
+    Yields:
+        str: Netlist text, line by line.
+
+    Raises:
+        ValueError: If an instance name is not a valid node name prefix, or is used twice.
+    """
+    pin_mapping = (chip_config or load_chip_config()).pin_number
+    dialect = get_dialect(dialect)
+    template = swbus_template(pin_mapping)
+
+    yield header_line(stamp)
+    yield "* MOSbius NODE and RBUS connections of multiple chips\n"
+
+    # The SWBUS shorts are the same for every chip: define them once
+    yield dialect.header(template)
+    yield from sbus_connection_lines(pin_mapping, dialect)
+    yield dialect.footer(template)
+
+    names = set()
+    for name, circuit_data, source in instances:
+        if not _INSTANCE_NAME.match(name):
+            raise ValueError(f"Invalid instance name '{name}': use letters, digits and '_'")
+        if name in names:
+            raise ValueError(f"Instance name '{name}' is used twice")
+        names.add(name)
+        prefix = f"{name}_"
+
+        yield f"\n* {name} from {source}\n"
+        yield dialect.instance(f"{prefix}SWBUS", [prefix + port for port in template.ports], template.subckt)
+        yield from rbus_connection_lines(circuit_data, pin_mapping, dialect, prefix)
+        yield from node_connection_lines(circuit_data, pin_mapping, dialect, prefix)
+        profiling.count("elements")
+        profiling.count("instances")
+
+
+def write_multichip_netlist(instances, output_file, chip_config=None, stamp=None, dialect=None):
+    """
+    Writes the multi-chip NODE and RBUS netlist.
+
+    Args:
+        instances: Iterable of (instance name, parsed circuit JSON, source) tuples.
+        output_file: Output path, "-" for stdout, or a writable file-like object.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        stamp (str): Build hash recorded instead of the creation time, for deterministic output.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    write_netlist(output_file, multichip_lines(instances, chip_config, stamp, dialect))
+
+
+def read_instances(designs):
+    """Yields (instance name, parsed circuit JSON, path) for designs with a circuit file, parsing each in turn."""
+    for design in designs:
+        with open(design.circuit, "r") as f, profiling.stage("parse"):
+            circuit_data = json.load(f)
+        yield design.name, circuit_data, design.circuit
+
+
+def generate_multichip_netlist(designs, output_spice_file, deterministic=False, incremental=False, dialect=None):
+    """
+    Generates the multi-chip NODE and RBUS netlist of a list of designs.
+
+    Args:
+        designs (list[Design]): One design with a circuit file per chip (see commandline.batch).
+        output_spice_file (str): Path to the output SPICE netlist file.
+        deterministic (bool): Record a build hash instead of the creation time.
+        incremental (bool): Skip the netlist if it was already built from the same inputs.
+        dialect (str): Simulator dialect (see commandline.dialects); default "spice".
+    """
+    with log_redirect(output_spice_file):
+        chip_config = load_chip_config()
+        print(f"Using chip config data in: {chip_config.config_dir}")
+
+        instances = read_instances(designs)
+        stamp = None
+        if deterministic or incremental:
+            # The build hash needs every circuit up front
+            instances = list(instances)
+            stamp = build_hash(PINS_TO_RBUS_SBUS_TEMPLATE, [[name, data] for name, data, _ in instances],
+                               [source for _, _, source in instances], chip_config,
+                               ("multichip",) + dialect_options(dialect))
+
+        if incremental and is_up_to_date(output_spice_file, stamp):
+            print(f"Multi-chip netlist {output_spice_file} is up to date")
+        else:
+            write_multichip_netlist(instances, output_spice_file, chip_config, stamp, dialect)
+            print(f"Multi-chip netlist of {len(designs)} chips saved to {output_spice_file}")
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate one netlist connecting the pins, NODEs and RBUSes of many chips."
+    )
+    parser.add_argument("inputs", nargs="*", help="Circuit JSON files or glob patterns, one chip per file.")
+    parser.add_argument("-m", "--manifest", help="JSON list of {\"name\", \"circuit\"} entries, one per chip.")
+    parser.add_argument("-o", "--output", required=True, help="Path to the output SPICE netlist file ('-' for stdout).")
+    parser.add_argument("--dialect", choices=list(DIALECTS), default="spice",
+                        help="Simulator syntax of the netlist (default: spice, in a 'simulator lang=spice' section).")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Record a build hash instead of the creation time, so identical inputs give identical files.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the netlist if it was already built from the same inputs (implies --deterministic).")
+    parser.add_argument("--revision",
+                        help="Chip revision (e.g. 20250505) or chip configuration directory (default: current).")
+
+    args = parser.parse_args(argv)
+    if args.revision:
+        try:
+            set_default_revision(args.revision)
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        designs = load_manifest(args.manifest) if args.manifest else []
+    except ValueError as e:
+        parser.error(str(e))
+    designs += designs_from_files(args.inputs, taken=[design.name for design in designs])
+    if not designs:
+        parser.error("no chips given; pass circuit JSON files/patterns or --manifest")
+    missing = [design.name for design in designs if not design.circuit]
+    if missing:
+        parser.error(f"no circuit file for {', '.join(missing)}")
+    for design in designs:
+        design.name = instance_name(design.name)
+    duplicates = sorted(name for name, count in Counter(design.name for design in designs).items() if count > 1)
+    if duplicates:
+        parser.error(f"instance names used twice: {', '.join(duplicates)}")
+
+    generate_multichip_netlist(designs, args.output, deterministic=args.deterministic,
+                               incremental=args.incremental, dialect=args.dialect)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
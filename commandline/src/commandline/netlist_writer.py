@@ -0,0 +1,167 @@
+"""
+Buffered output of generated netlists.
+
+The generators produce their netlists as a stream of text lines. A
+`NetlistWriter` collects the lines and hands them to the target in large
+blocks (by default one write per MiB), instead of building one big string
+with repeated concatenation or issuing one write call per line.
+
+The target is a file path, "-" for stdout, or any object with a `write`
+method, so netlists can be piped straight into a simulator.
+"""
+
+import contextlib
+import os
+import sys
+
+from commandline import profiling
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+STDOUT = "-"
+
+# The stdout netlists go to while log_redirect sends the log output to stderr
+_netlist_stdout = None
+
+
+class NetlistWriter:
+    """
+    Buffered writer for netlist text.
+
+    Use as a context manager. A file path is only opened when the first block
+    is flushed, and a file created by the writer is removed again if the
+    netlist generation raises, so failures never leave partial netlists behind.
+
+    Args:
+        target: Output file path, "-" for stdout, or a writable file-like object.
+        buffer_size (int): Number of characters collected before they are written.
+    """
+
+    def __init__(self, target, buffer_size=DEFAULT_BUFFER_SIZE):
+        if target == STDOUT:
+            target = _netlist_stdout or sys.stdout
+        self.path = target if isinstance(target, (str, os.PathLike)) else None
+        self.file = None if self.path is not None else target
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        """Writes all lines produced by an iterable (each line includes its newline)."""
+        chunks = self._chunks
+        size = self._size
+        buffer_size = self.buffer_size
+        for line in lines:
+            chunks.append(line)
+            size += len(line)
+            if size >= buffer_size:
+                self._size = size
+                self.flush()
+                size = 0
+        self._size = size
+
+    @profiling.timed("write")
+    def flush(self):
+        if self.file is None:
+            self.file = open(self.path, "w")
+        if self._chunks:
+            self.file.write("".join(self._chunks))
+            self._chunks = []
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        if self.path is not None:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def discard(self):
+        """Drops the buffered text and removes the output file if this writer created it."""
+        self._chunks = []
+        self._size = 0
+        if self.path is not None and self.file is not None:
+            self.file.close()
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+def write_netlist(target, lines, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Writes a stream of netlist lines to a path, "-" (stdout) or file-like object."""
+    with NetlistWriter(target, buffer_size) as writer, profiling.stage("render"):
+        writer.write_lines(lines)
+
+
+def log_redirect(target):
+    """
+    Returns a context manager for the log output of a generator writing to `target`.
+
+    While a netlist is streamed to stdout, `print` output is sent to stderr so it
+    does not end up in the netlist.
+    """
+    if target == STDOUT:
+        return _log_to_stderr()
+    return contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _log_to_stderr():
+    global _netlist_stdout
+    previous = _netlist_stdout
+    _netlist_stdout = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        _netlist_stdout = previous
+
+
+def warning(message, warn=None):
+    """
+    Reports a warning of the generators and counts it in the active profile.
+
+    The "Warning: ..." text is passed to `warn` (a callable such as `list.append`) or, by
+    default, printed.
+    """
+    profiling.count("warnings")
+    message = f"Warning: {message}"
+    if warn is None:
+        print(message)
+    else:
+        warn(message)
+
+
+# How PROBE registers at the VSS level are tied off:
+#   vsource: a zero-volt source per probe (default, accepted by every simulator)
+#   connect: `.connect PROBE<n> VSS` node aliasing (HSPICE-compatible syntax),
+#            so only the VDD probes add source branches to the simulator matrix
+TIE_STYLES = ("vsource", "connect")
+
+
+def probe_line(name, probe, level, tie_style="vsource", param=None):
+    """
+    Returns the netlist line setting `PROBE<probe>` to `level` ("VDD" or "VSS").
+
+    With a `param` name the probe is driven by a voltage-controlled source
+    instead, at VSS + param * (VDD - VSS), so `.param <param>=0|1` selects the
+    level; the leading V of `name` becomes an E.
+    """
+    if param is not None:
+        return f"E{name[1:]} PROBE<{probe}> VSS VDD VSS {param}\n"
+    if tie_style == "connect" and level == "VSS":
+        return f".connect PROBE<{probe}> VSS\n"
+    return f"{name} PROBE<{probe}> {level} 0\n"
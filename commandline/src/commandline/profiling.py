@@ -0,0 +1,256 @@
+"""
+Stage timing and counters of the netlist generators.
+
+While a `Profile` is active, the generators record how long each stage of
+their work takes and count what they produce:
+
+    stages      load      chip configuration load (cache read or JSON parse)
+                parse     circuit and sizing JSON parsing
+                validate  checks of the sizing values
+                map       mapping of the connections and sizes into registers
+                render    formatting of the netlist text
+                write     writing of the netlist text to its target
+    counters    elements  sources, shorts and ties written
+                warnings  warnings reported
+                probes_defaulted  switch matrix probes tied to VSS by default
+                designs, failed_designs, store_hits  designs of `mosbius batch`
+                requests  generation requests of `mosbius serve`
+                instances  chips of `mosbius multichip`
+
+Stages are timed exclusively: a stage running inside another one (e.g. the
+register mapping, which runs while the switch matrix netlist is rendered)
+pauses the outer stage, so the stage times add up to the profiled time.
+
+    from commandline import profiling
+
+    with profiling.profiled() as profile:
+        run_batch(designs, "out")
+    print(profile.report())
+    profile.summary()       # {"elapsed": ..., "stages": {...}, "counters": {...}}
+
+Profiles nest: when an inner profile ends, its stages and counters are added
+to the enclosing profile, so e.g. `mosbius --profile serve` aggregates all
+requests while each request can still be profiled on its own. When no
+profile is active, `stage` and `count` do nothing. The active profile is a
+context variable: every thread (and asyncio task) records into its own, and
+a new thread starts with none.
+
+`mosbius --profile` prints the report of a whole run to stderr, and
+`mosbius --profile=<path>` also writes the summary as JSON. With
+MOSBIUS_CPROFILE=<path>, `mosbius` runs the subcommand under cProfile and
+dumps the statistics to <path> (read them with `python -m pstats <path>`).
+
+Environment variables:
+    MOSBIUS_CPROFILE: path receiving the cProfile statistics of a `mosbius` run
+"""
+
+import contextlib
+import contextvars
+import functools
+import os
+import time
+
+CPROFILE_ENV = "MOSBIUS_CPROFILE"
+
+# The profile stages and counters are recorded into, or None
+_active = contextvars.ContextVar("mosbius_profile", default=None)
+_no_stage = contextlib.nullcontext()
+
+
+class Profile:
+    """
+    Time spent per stage and counters of one run.
+
+    Attributes:
+        stages (dict): Stage -> [seconds, calls], in the order the stages first ran.
+        counters (dict): Counter -> value.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._elapsed = 0.0
+        self._started = None  # Start time while the profile is active
+        self._stack = []  # [stage, start time] of the running stages, innermost last
+
+    @property
+    def elapsed(self):
+        """float: Seconds the profile was active, including the current activation."""
+        if self._started is None:
+            return self._elapsed
+        return self._elapsed + time.perf_counter() - self._started
+
+    def _add(self, name, seconds, calls=0):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0.0, 0]
+        entry[0] += seconds
+        entry[1] += calls
+
+    def _enter(self, name):
+        now = time.perf_counter()
+        self._pause(now)
+        self._add(name, 0.0, 1)
+        self._stack.append([name, now])
+
+    def _exit(self):
+        now = time.perf_counter()
+        name, start = self._stack.pop()
+        self._add(name, now - start)
+        self._resume(now)
+
+    def _pause(self, now):
+        if self._stack:
+            running = self._stack[-1]
+            self._add(running[0], now - running[1])
+
+    def _resume(self, now):
+        if self._stack:
+            self._stack[-1][1] = now
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing a stage of this profile."""
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def count(self, name, value=1):
+        """Adds `value` to the counter `name`."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """Adds the stage times and counters of another profile to this one."""
+        for name, (seconds, calls) in other.stages.items():
+            self._add(name, seconds, calls)
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def summary(self):
+        """Returns the profile as a JSON-serializable dict."""
+        return {
+            "elapsed": self.elapsed,
+            "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def report(self):
+        """Returns the profile as a text table."""
+        elapsed = self.elapsed
+        lines = [f"{'stage':<10} {'calls':>7} {'seconds':>10} {'share':>7}"]
+        for name, (seconds, calls) in self.stages.items():
+            share = seconds / elapsed if elapsed > 0 else 0.0
+            lines.append(f"{name:<10} {calls:>7} {seconds:>10.4f} {share:>7.1%}")
+        other = elapsed - sum(seconds for seconds, _ in self.stages.values())
+        lines.append(f"{'(other)':<10} {'':>7} {max(other, 0.0):>10.4f}")
+        lines.append(f"{'total':<10} {'':>7} {elapsed:>10.4f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+def active():
+    """Returns the active `Profile`, or None."""
+    return _active.get()
+
+
+@contextlib.contextmanager
+def profiled(profile=None):
+    """
+    Context manager making `profile` (a new `Profile` by default) the active profile.
+
+    On exit the stages and counters of the profile are added to the profile that was active
+    before, if any.
+
+    Yields:
+        Profile: The active profile.
+    """
+    profile = profile or Profile()
+    outer = _active.get()
+    start = time.perf_counter()
+    if outer is not None:
+        outer._pause(start)
+    token = _active.set(profile)
+    profile._started = start
+    try:
+        yield profile
+    finally:
+        end = time.perf_counter()
+        profile._elapsed += end - start
+        profile._started = None
+        _active.reset(token)
+        if outer is not None:
+            outer._resume(end)
+            outer.merge(profile)
+
+
+@contextlib.contextmanager
+def paused():
+    """Context manager recording no stages or counters while its body runs, e.g. while work is repeated."""
+    token = _active.set(None)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def stage(name):
+    """Returns a context manager timing the stage `name` in the active profile (none: does nothing)."""
+    profile = _active.get()
+    if profile is None:
+        return _no_stage
+    return profile.stage(name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as the stage `name` of the active profile."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _active.get()
+            if profile is None:
+                return function(*args, **kwargs)
+            with profile.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Adds `value` to the counter `name` of the active profile (none: does nothing)."""
+    profile = _active.get()
+    if profile is not None:
+        profile.count(name, value)
+
+
+def write_summary(profile, path):
+    """Writes the summary of `profile` as JSON to `path`."""
+    import json
+
+    with open(path, "w") as f:
+        json.dump(profile.summary(), f, indent=2)
+        f.write("\n")
+
+
+@contextlib.contextmanager
+def cprofiled(path=None):
+    """
+    Context manager running its body under cProfile and dumping the statistics to `path`
+    (default: $MOSBIUS_CPROFILE); does nothing without a path.
+    """
+    path = path or os.environ.get(CPROFILE_ENV)
+    if not path:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,239 @@
+"""
+In-memory register image of the MOSbiusV2 chip.
+
+A `RegisterImage` holds the value of every PROBE register (switch matrix and
+device sizing) in one flat array indexed by register number, together with a
+mask of the registers that a configuration sets explicitly. Configurations are
+mapped into the image with scatter operations over the index tables of
+`ChipConfig`; the SPICE writers render from the image.
+
+Images are `bytearray`s by default. Importing NumPy takes longer than
+generating a single netlist, so processes handling many designs (batch runs,
+sweeps, the server) call `enable_numpy()` to switch new images to NumPy
+arrays with the same interface, if NumPy is installed.
+"""
+
+from commandline import profiling
+from commandline.chip_config import load_chip_config
+from commandline.netlist_writer import warning
+
+np = None  # The numpy module once enable_numpy() succeeded
+
+# Values of the (a, b) register pair of an SBUS connection
+SBUS_CONNECTION_VALUES = {
+    "ON": (1, 1),
+    "PHI1": (1, 0),
+    "PHI2": (0, 1),
+}
+SBUS_OFF_VALUES = (0, 0)
+
+_sizing_arrays = {}
+
+
+def enable_numpy():
+    """
+    Makes new register images use NumPy arrays.
+
+    Returns:
+        bool: True if NumPy is installed and in use.
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - depends on the environment
+            return False
+        np = numpy
+    return True
+
+
+class RegisterImage:
+    """
+    Values of the PROBE registers 1..num_registers (index 0 is unused).
+
+    Attributes:
+        values: uint8 array (or bytearray) of register values, 1 = VDD, 0 = VSS.
+        assigned: uint8 array (or bytearray), 1 where a register was set explicitly.
+        numpy: The numpy module if the arrays are NumPy arrays, else None.
+    """
+
+    def __init__(self, num_registers):
+        self.num_registers = num_registers
+        self.numpy = np
+        if np is not None:
+            self.values = np.zeros(num_registers + 1, dtype=np.uint8)
+            self.assigned = np.zeros(num_registers + 1, dtype=np.uint8)
+        else:
+            self.values = bytearray(num_registers + 1)
+            self.assigned = bytearray(num_registers + 1)
+
+    @classmethod
+    def for_chip(cls, chip_config=None):
+        """Returns an all-VSS image covering every register of the chip."""
+        return cls((chip_config or load_chip_config()).num_registers)
+
+    def scatter(self, registers, values):
+        """Sets `registers[i]` to `values[i]` and marks them as assigned."""
+        if self.numpy is not None:
+            registers = self.numpy.asarray(registers, dtype=self.numpy.intp)
+            self.values[registers] = values
+            self.assigned[registers] = 1
+        else:
+            for register, value in zip(registers, values):
+                self.values[register] = value
+                self.assigned[register] = 1
+
+    def value(self, register):
+        """Returns the value (0 or 1) of `register`."""
+        return int(self.values[register])
+
+    def unassigned(self, first, last):
+        """Returns the registers in [first, last] that were not set explicitly."""
+        if self.numpy is not None:
+            return (self.numpy.flatnonzero(self.assigned[first:last + 1] == 0) + first).tolist()
+        assigned = self.assigned
+        return [register for register in range(first, last + 1) if not assigned[register]]
+
+    def set_registers(self):
+        """Returns the registers with value 1."""
+        if self.numpy is not None:
+            return self.numpy.flatnonzero(self.values).tolist()
+        return [register for register, value in enumerate(self.values) if value]
+
+    def diff(self, other):
+        """Returns the registers whose values differ between this image and `other`."""
+        if self.numpy is not None and other.numpy is not None:
+            return self.numpy.flatnonzero(self.values != other.values).tolist()
+        return [register for register, (a, b) in enumerate(zip(self.values, other.values)) if a != b]
+
+    def copy(self):
+        image = RegisterImage.__new__(RegisterImage)
+        image.num_registers = self.num_registers
+        image.numpy = self.numpy
+        image.values = self.values.copy() if self.numpy is not None else bytearray(self.values)
+        image.assigned = self.assigned.copy() if self.numpy is not None else bytearray(self.assigned)
+        return image
+
+    def __eq__(self, other):
+        if not isinstance(other, RegisterImage):
+            return NotImplemented
+        return bytes(self.values) == bytes(other.values)
+
+
+@profiling.timed("map")
+def map_switch_matrix(circuit_data, chip_config=None, image=None, warn=None):
+    """
+    Maps the RBUS and SBUS connections of a circuit into a register image.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Image to update; a new chip image by default.
+        warn (callable): Receives the warnings instead of printing them (see netlist_writer.warning).
+
+    Returns:
+        tuple: The image and the list of connections in circuit order, each either
+            ("RBUS", bus, pin, sw_matrix_pin, register) or
+            ("SBUS", bus, terminal, connection, register_a, register_b).
+    """
+    chip_config = chip_config or load_chip_config()
+    image = image or RegisterImage.for_chip(chip_config)
+
+    connections = []
+    registers = []
+    values = []
+    for bus, entries in circuit_data.items():
+        if bus.startswith("RBUS"):
+            for pin in entries:
+                sw_matrix_pin = chip_config.sw_matrix_pin(pin)
+                if sw_matrix_pin is None:
+                    warning(f"Pin '{pin}' not found in pin-to-switch matrix mapping", warn)
+                    continue
+                register = chip_config.register(pin, bus)
+                if register is None:
+                    warning(f"Register not found for sw_matrix_pin '{sw_matrix_pin}' and bus '{bus}'", warn)
+                    continue
+                connections.append(("RBUS", bus, pin, sw_matrix_pin, register))
+                registers.append(register)
+                values.append(1)
+
+        elif bus.startswith("SBUS"):
+            sbus_a = f"{bus}a"
+            sbus_b = f"{bus}b"
+            for entry in entries:
+                terminal = entry["terminal"]
+                connection = entry["connection"]
+                sw_matrix_pin = chip_config.sw_matrix_pin(terminal)
+                if sw_matrix_pin is None:
+                    warning(f"Pin '{terminal}' not found in pin-to-switch matrix mapping", warn)
+                    continue
+                register_a = chip_config.register(terminal, sbus_a)
+                register_b = chip_config.register(terminal, sbus_b)
+                if (register_a is None) or (register_b is None):
+                    warning(f"Register not found for sw_matrix_pin '{sw_matrix_pin}' and buses '{sbus_a} and {sbus_b}'", warn)
+                    continue
+                connections.append(("SBUS", bus, terminal, connection, register_a, register_b))
+                registers += (register_a, register_b)
+                values += SBUS_CONNECTION_VALUES.get(connection, SBUS_OFF_VALUES)
+
+    image.scatter(registers, values)
+    return image, connections
+
+
+def _get_sizing_arrays(chip_config):
+    arrays = _sizing_arrays.get(id(chip_config))
+    if arrays is None:
+        arrays = _sizing_arrays[id(chip_config)] = (
+            np.asarray(chip_config.sizing_register_index, dtype=np.intp),
+            np.asarray(chip_config.sizing_bit_weights, dtype=np.int64),
+            np.asarray(chip_config.sizing_register_device, dtype=np.intp),
+        )
+    return arrays
+
+
+@profiling.timed("map")
+def map_sizes(device_sizes, chip_config=None, image=None):
+    """
+    Maps device sizes into a register image.
+
+    Args:
+        device_sizes (list[int]): Size of each device, in `chip_config.sizing_devices` order.
+            Sizes must already be valid 5-bit numbers.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        image (RegisterImage): Image to update; a new chip image by default.
+
+    Returns:
+        RegisterImage: The updated image.
+    """
+    chip_config = chip_config or load_chip_config()
+    image = image or RegisterImage.for_chip(chip_config)
+
+    if image.numpy is not None:
+        registers, weights, devices = _get_sizing_arrays(chip_config)
+        sizes = np.asarray(device_sizes, dtype=np.int64)
+        image.scatter(registers, (sizes[devices] & weights) != 0)
+    else:
+        image.scatter(
+            chip_config.sizing_register_index,
+            [1 if device_sizes[device] & weight else 0
+             for device, weight in zip(chip_config.sizing_register_device, chip_config.sizing_bit_weights)],
+        )
+    return image
+
+
+def build_register_image(circuit_data=None, device_sizes=None, chip_config=None):
+    """
+    Returns the full chip register image of a circuit and/or a set of device sizes.
+
+    Args:
+        circuit_data (dict): Parsed circuit JSON, or None.
+        device_sizes (list[int]): Device sizes in `chip_config.sizing_devices` order, or None.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+    """
+    chip_config = chip_config or load_chip_config()
+    image = RegisterImage.for_chip(chip_config)
+    if circuit_data is not None:
+        map_switch_matrix(circuit_data, chip_config, image)
+    if device_sizes is not None:
+        map_sizes(device_sizes, chip_config, image)
+    return image
@@ -0,0 +1,439 @@
+"""
+A long-running generation server: `mosbius serve`.
+
+The server keeps the chip configuration, the templates and the compiled
+lookup tables in memory and answers netlist requests over a Unix socket (or
+a localhost TCP port), so tools calling the generators in a loop pay neither
+for interpreter startup nor for loading the configuration.
+
+The server has no authentication. The Unix socket is created with mode 0600,
+so only its owner can connect; the TCP port only listens on a loopback
+address, where every local user can reach it. Files are read and written only
+inside the directory given with `--root`.
+
+The protocol is newline-delimited JSON, one request and one reply per line:
+
+    {"id": 1, "netlist": "switch_matrix", "data": {...circuit JSON...}}
+    {"id": 1, "ok": true, "netlist": "* File created on: ...", "warnings": []}
+
+Request fields:
+    netlist: "switch_matrix", "sizes", "nodes" or "rbus"
+    data: the parsed circuit or sizing JSON (or "path" to a JSON file under the root)
+    source: name recorded in the netlist header (default: "path" or "mosbius serve")
+    tie_style: "vsource" (default) or "connect", for switch_matrix and sizes
+    dialect: simulator syntax, "spice" (default), "spectre", "ngspice" or "xyce"
+    revision: chip revision (default: the one the server was started with)
+    deterministic: record a build hash instead of the creation time
+    register_dump: also return the register state as "hex" or "json" text
+    output: write the netlist to this path under the root instead of returning it
+    profile: also return the stage times and counters of the request (see
+        commandline.profiling) as "profile"
+
+Besides generation requests ({"op": "generate"}, the default) the server
+answers {"op": "ping"}, {"op": "shutdown"} (on the Unix socket only; a TCP
+server is stopped with Ctrl-C or SIGTERM), {"op": "profile"}, which returns
+the stage times and counters of all requests since the server started as
+"profile", and {"op": "validate", "kind": "circuit" or "sizes", "data":
+{...}}, which returns "valid" and the "diagnostics" of commandline.validate
+without generating a netlist. Failed requests get
+{"ok": false, "error": "..."} and the connection stays usable.
+
+Netlists are generated off the event loop, so pings and new connections are
+answered while a netlist renders. By default one worker thread generates the
+requests of all clients one at a time; with `--jobs N`, N worker processes
+generate up to N requests in parallel.
+
+`Client` is a small synchronous client for use from Python scripts.
+"""
+
+import asyncio
+import contextlib
+import functools
+import ipaddress
+import json
+import os
+import signal
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict
+
+from commandline import api, profiling, validate
+from commandline.bitstream import format_register_dump
+from commandline.chip_config import load_chip_config
+from commandline.dialects import get_dialect
+from commandline.incremental import tool_version
+from commandline.netlist_writer import TIE_STYLES
+from commandline.registers import enable_numpy
+
+# Netlist name -> (builder of commandline.api, whether the netlist has a register image)
+NETLISTS = {
+    "switch_matrix": (api.build_switch_matrix, True),
+    "sizes": (api.build_sizes, True),
+    "nodes": (api.build_nodes, False),
+    "rbus": (api.build_pins_to_RBUS_SBUS, False),
+}
+TEXT_DUMP_FORMATS = ("hex", "json")
+DEFAULT_SOURCE = "mosbius serve"
+# Longest accepted request line; circuit JSONs are a few kB
+MAX_REQUEST_SIZE = 16 << 20
+
+# Chip configuration of a worker process of `serve(jobs=N)`
+_worker_chip_config = None
+
+
+def default_socket_path():
+    """Returns the default Unix socket path of the server."""
+    import getpass
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"mosbius-{getpass.getuser()}.sock")
+
+
+def warm_caches(chip_config=None):
+    """Loads the chip configuration and templates and renders every netlist once."""
+    chip_config = chip_config or load_chip_config()
+    enable_numpy()
+    for builder, _ in NETLISTS.values():
+        builder({}, DEFAULT_SOURCE, chip_config=chip_config)
+    return chip_config
+
+
+def _root_path(path, root):
+    """Returns the request path `path` resolved inside the directory `root`."""
+    if root is None:
+        raise ValueError("'path' and 'output' need a server started with --root")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"'{path}' is outside the server root directory")
+    return resolved
+
+
+def _request_data(request, root):
+    data = request.get("data")
+    if data is None:
+        if "path" not in request:
+            raise ValueError("Request needs 'data' or 'path'")
+        with open(_root_path(request["path"], root), "r") as f, profiling.stage("parse"):
+            data = json.load(f)
+    return data
+
+
+def handle_request(request, chip_config=None, root=None):
+    """
+    Answers one request of the server protocol.
+
+    Args:
+        request (dict): The decoded request.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        root (str): Directory the "path" and "output" fields are resolved in; without it
+            requests using them are rejected.
+
+    Returns:
+        dict: The reply (without the request "id").
+
+    Raises:
+        ValueError: For malformed requests; errors of the generators propagate.
+    """
+    op = request.get("op", "generate")
+    if op == "ping":
+        return {"ok": True, "version": tool_version()}
+    if op == "profile":
+        return {"ok": True, "profile": (profiling.active() or profiling.Profile()).summary()}
+    if request.get("revision"):
+        # Every revision is compiled once and then kept in memory
+        chip_config = load_chip_config(revision=request["revision"])
+    if op == "validate":
+        kind = request.get("kind", "circuit")
+        if kind not in validate.KINDS:
+            raise ValueError(f"Unknown kind '{kind}'; use one of {', '.join(validate.KINDS)}")
+        diagnostics = validate.validate(_request_data(request, root), kind, chip_config or load_chip_config())
+        return {"ok": True, "valid": not validate.has_errors(diagnostics),
+                "diagnostics": [asdict(diagnostic) for diagnostic in diagnostics]}
+    if op != "generate":
+        raise ValueError(f"Unknown op '{op}'")
+
+    kind = request.get("netlist")
+    if kind not in NETLISTS:
+        raise ValueError(f"Unknown netlist '{kind}'; use one of {', '.join(NETLISTS)}")
+    builder, uses_image = NETLISTS[kind]
+
+    tie_style = request.get("tie_style", "vsource")
+    if tie_style not in TIE_STYLES:
+        raise ValueError(f"Unknown tie_style '{tie_style}'; use one of {', '.join(TIE_STYLES)}")
+    dialect = get_dialect(request.get("dialect"))
+    if uses_image:
+        dialect.check_tie_style(tie_style)
+    dump_format = request.get("register_dump")
+    if dump_format is not None and (not uses_image or dump_format not in TEXT_DUMP_FORMATS):
+        raise ValueError(f"register_dump must be one of {', '.join(TEXT_DUMP_FORMATS)} "
+                         f"for the switch_matrix and sizes netlists")
+
+    start = time.perf_counter()
+    reply = {"ok": True}
+    # Every request is profiled on its own; the profile is added to the one of the server
+    with profiling.profiled() as profile:
+        profiling.count("requests")
+        data = _request_data(request, root)
+        source = request.get("source") or request.get("path") or DEFAULT_SOURCE
+        options = {"tie_style": tie_style} if uses_image else {}
+        netlist = builder(data, source, deterministic=bool(request.get("deterministic")),
+                          chip_config=chip_config or load_chip_config(), dialect=dialect.name, **options)
+        if request.get("output"):
+            netlist.write(_root_path(request["output"], root))
+            reply["output"] = request["output"]
+        else:
+            reply["netlist"] = netlist.text
+    if dump_format is not None:
+        reply["registers"] = format_register_dump(netlist.image, dump_format).decode()
+    reply["warnings"] = netlist.warnings
+    if request.get("profile"):
+        reply["profile"] = profile.summary()
+    reply["elapsed"] = time.perf_counter() - start
+    return reply
+
+
+def _init_worker(config_dir):
+    global _worker_chip_config
+    _worker_chip_config = warm_caches(load_chip_config(revision=config_dir))
+
+
+def _handle_in_worker(request, chip_config, root):
+    # The profile of the request goes back to the event loop with the reply, also when it failed
+    with profiling.profiled() as profile:
+        try:
+            reply = handle_request(request, chip_config or _worker_chip_config, root)
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return reply, profile
+
+
+async def _generate(executor, request, chip_config, root, server_profile):
+    # The worker thread or process has no active profile of its own; the request profile is
+    # added to the server profile here, on the event loop thread that also reads it
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, ProcessPoolExecutor):
+        chip_config = None  # Workers use the configuration they loaded at startup
+    reply, profile = await loop.run_in_executor(executor, _handle_in_worker, request, chip_config, root)
+    server_profile.merge(profile)
+    return reply
+
+
+async def _serve_client(reader, writer, executor, chip_config, root, server_profile, stop, can_shutdown):
+    try:
+        while not stop.is_set():
+            try:
+                line = await reader.readline()
+            except ValueError:
+                writer.write((json.dumps({"ok": False, "error": "Request too long"}) + "\n").encode())
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            request = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+                op = request.get("op")
+                if op == "shutdown":
+                    if not can_shutdown:
+                        raise ValueError("shutdown is only accepted on the Unix socket")
+                    reply = {"ok": True}
+                    stop.set()
+                elif op == "profile":
+                    reply = {"ok": True, "profile": server_profile.summary()}
+                elif op == "ping":
+                    reply = handle_request(request)
+                else:
+                    reply = await _generate(executor, request, chip_config, root, server_profile)
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            if isinstance(request, dict) and "id" in request:
+                reply["id"] = request["id"]
+
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)  # Left behind by a server that did not shut down cleanly
+    else:
+        raise RuntimeError(f"A server is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+async def serve(socket_path=None, host="127.0.0.1", port=None, chip_config=None, root=None, jobs=1):
+    """
+    Runs the server until a shutdown request arrives.
+
+    Args:
+        socket_path (str): Unix socket to listen on (default: `default_socket_path()`).
+        host (str): Loopback address for TCP mode.
+        port (int): Listen on this TCP port instead of a Unix socket.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+        root (str): Directory the "path" and "output" request fields are resolved in
+            (default: none, such requests are rejected).
+        jobs (int): Worker processes generating netlists; 1 generates them one at a time
+            in a worker thread.
+
+    Raises:
+        ValueError: If `host` is not a loopback address.
+    """
+    if port is not None and not _is_loopback(host):
+        raise ValueError(f"Refusing to listen on '{host}': the server has no authentication, use a loopback address")
+    chip_config = warm_caches(chip_config)
+    stop = asyncio.Event()
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    server_profile = profiling.Profile()
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(chip_config.config_dir,))
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    handler = functools.partial(_serve_client, executor=executor, chip_config=chip_config, root=root,
+                                server_profile=server_profile, stop=stop, can_shutdown=port is None)
+
+    try:
+        if port is not None:
+            server = await asyncio.start_server(handler, host, port, limit=MAX_REQUEST_SIZE)
+            address = f"{host}:{port}"
+        else:
+            socket_path = socket_path or default_socket_path()
+            _remove_stale_socket(socket_path)
+            # Only the owner may connect
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(handler, socket_path, limit=MAX_REQUEST_SIZE)
+            finally:
+                os.umask(umask)
+            address = socket_path
+
+        try:
+            async with server:
+                print(f"Serving MOSbiusV2 netlists on {address} (chip config: {chip_config.config_dir})", flush=True)
+                # Collects the profiles of all requests, for {"op": "profile"}
+                with profiling.profiled(server_profile):
+                    await stop.wait()
+        finally:
+            if port is None and os.path.exists(socket_path):
+                os.remove(socket_path)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+class Client:
+    """
+    Synchronous client for `mosbius serve`, keeping one connection open.
+
+    Args:
+        socket_path (str): Unix socket of the server (default: `default_socket_path()`).
+        host (str): Server host in TCP mode.
+        port (int): Server port; connects over TCP when given.
+        timeout (float): Socket timeout in seconds.
+    """
+
+    def __init__(self, socket_path=None, host="127.0.0.1", port=None, timeout=None):
+        if port is not None:
+            self.socket = socket.create_connection((host, port), timeout=timeout)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(socket_path or default_socket_path())
+        self.file = self.socket.makefile("rwb")
+        self._next_id = 0
+
+    def request(self, **request):
+        """Sends one request and returns the decoded reply."""
+        self._next_id += 1
+        request.setdefault("id", self._next_id)
+        self.file.write((json.dumps(request) + "\n").encode())
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    def generate(self, netlist, data, **options):
+        """
+        Returns the text of a netlist.
+
+        Args:
+            netlist (str): "switch_matrix", "sizes", "nodes" or "rbus".
+            data (dict): The parsed circuit or sizing JSON.
+            **options: Other request fields, e.g. tie_style="connect" or deterministic=True.
+
+        Raises:
+            RuntimeError: If the server reports an error.
+        """
+        reply = self.request(netlist=netlist, data=data, **options)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply.get("netlist")
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Serve netlist generation requests with the chip configuration kept in memory."
+    )
+    parser.add_argument("--socket", help=f"Unix socket to listen on (default: {default_socket_path()}).")
+    parser.add_argument("--port", type=int, help="Listen on this localhost TCP port instead of a Unix socket.")
+    parser.add_argument("--root",
+                        help="Directory the 'path' and 'output' request fields are resolved in (default: none, "
+                             "such requests are rejected).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Worker processes generating netlists in parallel (default: 1, one request at a time).")
+
+    args = parser.parse_args(argv)
+    if args.port is None and not hasattr(socket, "AF_UNIX"):
+        parser.error("Unix sockets are not available on this platform; use --port")
+    if args.root is not None and not os.path.isdir(args.root):
+        parser.error(f"--root {args.root} is not a directory")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    try:
+        asyncio.run(serve(args.socket, port=args.port, root=args.root, jobs=args.jobs))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Canonical configuration hashes and a content-addressed store: `mosbius store`.
+
+Candidates of a sweep are often the same configuration written differently:
+pins in another order within an RBUS list, SBUS entries reordered, or "OFF"
+SBUS entries that set nothing. `canonical_config` reduces a circuit and
+sizing pair to what the netlists actually depend on:
+
+    switch_matrix   the switch matrix PROBE registers set to VDD
+    sizes           the size of every device, after validation
+    external        the package pins on every NODE, VDD and VSS, sorted
+
+and `config_digest` hashes that together with the chip configuration, so
+equivalent candidates get the same digest:
+
+    from commandline.store import config_digest
+
+    config_digest(circuit, sizes) == config_digest(reordered_circuit, sizes)
+
+(The PK_pins_to_RBUS_SWBUS netlist probes the first package pin of each
+RBUS list, so reordered candidates may probe the RBUS at another of its
+pins; all pins of an RBUS are on the same net.)
+
+A `ConfigStore` keeps the generated netlists of every configuration, and any
+simulation artifacts added later, in a sharded directory:
+
+    <store>/<key[:2]>/<key>/entry.json          digest, options, tool version, files
+    <store>/<key[:2]>/<key>/<netlist files>
+    <store>/<key[:2]>/<key>/artifacts/<files>
+
+The key combines the config digest, the tool version and the generator
+options, so a cached entry is only served for identical output. Entries are
+written to a temporary directory and renamed into place, so concurrent
+writers never see partial entries. `mosbius batch --store <dir>` serves
+duplicate designs from the store instead of generating them again.
+"""
+
+import json
+import os
+import shutil
+import time
+
+from commandline.chip_config import load_chip_config
+from commandline.generate_sizes_probe_subckt import validated_device_sizes
+from commandline.incremental import tool_version
+from commandline.registers import RegisterImage, map_switch_matrix
+
+ENTRY_FILE = "entry.json"
+ARTIFACTS_DIR = "artifacts"
+KEY_FILE = "store_key.txt"
+SUPPLIES = ("VDD", "VSS")
+
+
+def canonical_config(circuit=None, sizes=None, chip_config=None):
+    """
+    Returns the canonical form of a circuit and/or sizing description.
+
+    Entries the generators ignore (unknown pins, pins without a switch) are left out; the
+    warnings of the generators are not printed.
+
+    Args:
+        circuit (dict): Parsed circuit JSON, or None.
+        sizes (dict): Parsed sizing JSON, or None.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Returns:
+        dict: {"switch_matrix": [registers set], "external": {net: [pins]}, "sizes": [sizes]},
+            with None for the parts of a missing description.
+    """
+    chip_config = chip_config or load_chip_config()
+    canonical = {"switch_matrix": None, "external": None, "sizes": None}
+    ignored = []  # Warnings of the generators
+    if circuit is not None:
+        image, _ = map_switch_matrix(circuit, chip_config, RegisterImage(chip_config.num_switch_matrix_probes),
+                                     ignored.append)
+        canonical["switch_matrix"] = image.set_registers()
+        external = {}
+        for key, pins in circuit.items():
+            if key in SUPPLIES:
+                net = key
+            elif key.startswith("NODE"):
+                try:
+                    net = f"NODE<{int(key.replace('NODE', '').strip('<>'))}>"
+                except ValueError:
+                    continue
+            else:
+                continue
+            pins = {pin for pin in pins if isinstance(pin, str) and pin in chip_config.pin_number}
+            if pins:
+                external[net] = sorted(pins | set(external.get(net, ())))
+        canonical["external"] = external
+    if sizes is not None:
+        canonical["sizes"] = validated_device_sizes(sizes, chip_config, ignored.append)
+    return canonical
+
+
+def config_digest(circuit=None, sizes=None, chip_config=None):
+    """
+    Returns the digest of the canonical form of a circuit and/or sizing description.
+
+    Returns:
+        str: "sha256:" followed by the hex digest; equal for equivalent descriptions.
+    """
+    import hashlib
+
+    chip_config = chip_config or load_chip_config()
+    digest = hashlib.sha256()
+    for part in (chip_config.digest, json.dumps(canonical_config(circuit, sizes, chip_config), sort_keys=True,
+                                                separators=(",", ":"))):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return f"sha256:{digest.hexdigest()}"
+
+
+class ConfigStore:
+    """
+    Content-addressed store of generated netlists and simulation artifacts.
+
+    Args:
+        root (str): Store directory; created on the first write.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def key(digest, options=()):
+        """Returns the store key of a config digest generated with `options` (e.g. the tie style)."""
+        import hashlib
+
+        text = "\0".join((digest, tool_version(), repr(tuple(options))))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        """Returns the directory of the entry `key`."""
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Returns the metadata of the entry `key` (see `put`), or None if it is not stored."""
+        try:
+            with open(os.path.join(self.path(key), ENTRY_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, paths, digest=None, options=()):
+        """
+        Stores copies of the files `paths` under `key`, unless the entry exists already.
+
+        Returns:
+            dict: The metadata of the entry: "key", "digest", "options", "version", "created"
+                and the stored "files".
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        entry = {"key": key, "digest": digest, "options": list(options), "version": tool_version(),
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": [os.path.basename(path) for path in paths]}
+        tmp_dir = os.path.join(self.root, "tmp", f"{key}.{os.getpid()}")
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            for path in paths:
+                shutil.copyfile(path, os.path.join(tmp_dir, os.path.basename(path)))
+            with open(os.path.join(tmp_dir, ENTRY_FILE), "w") as f:
+                json.dump(entry, f, indent=2)
+            os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+            os.rename(tmp_dir, self.path(key))
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            stored = self.get(key)
+            if stored is None:
+                raise
+            return stored
+        return entry
+
+    def export(self, key, output_dir):
+        """
+        Copies the stored files of the entry `key` into `output_dir`.
+
+        Returns:
+            list[str]: Paths of the files written.
+        """
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(f"No entry {key} in {self.root}")
+        os.makedirs(output_dir, exist_ok=True)
+        written = []
+        for name in entry["files"]:
+            output_path = os.path.join(output_dir, name)
+            shutil.copyfile(os.path.join(self.path(key), name), output_path)
+            written.append(output_path)
+        return written
+
+    def add_artifacts(self, key, paths):
+        """Copies simulation results (or any other files) into the `artifacts/` directory of the entry `key`."""
+        if self.get(key) is None:
+            raise KeyError(f"No entry {key} in {self.root}")
+        artifacts_dir = os.path.join(self.path(key), ARTIFACTS_DIR)
+        os.makedirs(artifacts_dir, exist_ok=True)
+        for path in paths:
+            shutil.copyfile(path, os.path.join(artifacts_dir, os.path.basename(path)))
+
+    def artifacts(self, key):
+        """Returns the paths of the artifacts of the entry `key`."""
+        artifacts_dir = os.path.join(self.path(key), ARTIFACTS_DIR)
+        if not os.path.isdir(artifacts_dir):
+            return []
+        return [os.path.join(artifacts_dir, name) for name in sorted(os.listdir(artifacts_dir))]
+
+    def keys(self):
+        """Yields the keys of all stored entries."""
+        if not os.path.isdir(self.root):
+            return
+        for shard in sorted(os.listdir(self.root)):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for key in sorted(os.listdir(shard_dir)):
+                if os.path.isfile(os.path.join(shard_dir, key, ENTRY_FILE)):
+                    yield key
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Query a configuration store and attach simulation artifacts to its entries."
+    )
+    parser.add_argument("store", help="Store directory (see 'mosbius batch --store').")
+    parser.add_argument("-c", "--circuit", help="Print the canonical digest of this circuit JSON.")
+    parser.add_argument("-s", "--sizes", help="Print the canonical digest of this sizing JSON (with --circuit: of the pair).")
+    parser.add_argument("-k", "--key", help="Entry to export or attach artifacts to (default: list all entries).")
+    parser.add_argument("--attach", nargs="+", metavar="FILE", help="Copy these files into the artifacts of the entry.")
+    parser.add_argument("--export", metavar="DIR", help="Copy the files and artifacts of the entry into DIR.")
+
+    args = parser.parse_args(argv)
+    store = ConfigStore(args.store)
+
+    if args.circuit or args.sizes:
+        data = {}
+        for name, path in (("circuit", args.circuit), ("sizes", args.sizes)):
+            if path:
+                with open(path, "r") as f:
+                    data[name] = json.load(f)
+        print(config_digest(data.get("circuit"), data.get("sizes")))
+        return 0
+
+    if args.key is None:
+        if args.attach or args.export:
+            parser.error("--attach and --export need --key")
+        for key in store.keys():
+            entry = store.get(key)
+            print(f"{key}  {' '.join(entry['files'])}  artifacts: {len(store.artifacts(key))}")
+        return 0
+
+    if store.get(args.key) is None:
+        print(f"Error: No entry {args.key} in {args.store}")
+        return 1
+    if args.attach:
+        store.add_artifacts(args.key, args.attach)
+        print(f"Attached {len(args.attach)} artifacts to {args.key}")
+    if args.export:
+        written = store.export(args.key, args.export)
+        for path in store.artifacts(args.key):
+            written.append(os.path.join(args.export, os.path.basename(path)))
+            shutil.copyfile(path, written[-1])
+        print(f"Exported {len(written)} files of {args.key} into {args.export}")
+    if not (args.attach or args.export):
+        print(json.dumps(dict(store.get(args.key), artifacts=store.artifacts(args.key)), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Sweeps over device sizes.
+
+The sizing JSON stores each device size as a list (e.g. "DCC1_N_R": [4]);
+`generate_sizes_probe_subckt` uses the first entry only. In a sweep, every
+list is a sweep axis and the axes are combined either as a cartesian product
+("product") or element-wise ("zip", where single-valued axes are held
+constant). A missing device or an empty list is an axis with the single size 0.
+
+The sweep points are split into contiguous chunks of point indices that are
+rendered on a process pool. The chunking depends only on the number of points
+and the chunk size, so the same sizing file always gives the same files.
+The result is either one PK_set_sizes_2 netlist per point, or a single
+netlist with one `.alter` block per point. A compact `.alter` netlist holds
+the subcircuit of the first point only and sets the size bits of the other
+points with `.param` (see commandline.diff); it is rendered in-process.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from commandline.chip_config import load_chip_config
+from commandline.generate_sizes_probe_subckt import write_sizes_probe_subckt
+from commandline.registers import enable_numpy
+
+SWEEP_MODES = ("product", "zip")
+
+
+@dataclass
+class SweepResult:
+    """Summary of a sweep run"""
+    points: int
+    chunks: int
+    workers: int
+    elapsed: float
+
+
+def sweep_axes(sizes, chip_config=None):
+    """
+    Returns the sweep axes of a sizing JSON.
+
+    Returns:
+        list[tuple[str, list[int]]]: (device, sizes) for every device of the chip, sorted by device name.
+    """
+    devices = (chip_config or load_chip_config()).sizing_registers
+    return [(device, list(sizes.get(device) or [0])) for device in sorted(devices)]
+
+
+def count_points(axes, mode="product"):
+    """Returns the number of sweep points spanned by `axes`."""
+    lengths = [len(values) for _, values in axes]
+    if mode == "product":
+        count = 1
+        for length in lengths:
+            count *= length
+        return count
+    if mode == "zip":
+        swept = {length for length in lengths if length != 1}
+        if len(swept) > 1:
+            raise ValueError(f"Cannot zip size lists of different lengths {sorted(swept)}")
+        return swept.pop() if swept else 1
+    raise ValueError(f"Unknown sweep mode '{mode}'; use one of {', '.join(SWEEP_MODES)}")
+
+
+def sweep_point(axes, index, mode="product"):
+    """
+    Returns the sizing JSON of sweep point `index`.
+
+    In "product" mode the last axis varies fastest, like itertools.product.
+    """
+    point = {}
+    if mode == "product":
+        for device, values in reversed(axes):
+            index, position = divmod(index, len(values))
+            point[device] = [values[position]]
+    else:
+        for device, values in axes:
+            point[device] = [values[index if len(values) > 1 else 0]]
+    return dict(sorted(point.items()))
+
+
+def chunk_ranges(num_points, chunk_size):
+    """Splits the point indices into contiguous (start, stop) ranges of `chunk_size` points."""
+    return [(start, min(start + chunk_size, num_points)) for start in range(0, num_points, chunk_size)]
+
+
+def _point_file_name(prefix, index, num_points):
+    return f"{prefix}_{index:0{len(str(num_points - 1))}d}.cir"
+
+
+def _render_chunk(axes, mode, start, stop, source, output_dir, prefix, num_points):
+    """
+    Renders the sweep points [start, stop).
+
+    With an `output_dir` every point is written to its own file and None is
+    returned; otherwise the `.alter` text of the chunk is returned.
+    """
+    import io
+
+    chip_config = load_chip_config()
+    enable_numpy()
+    alter_text = io.StringIO()
+    for index in range(start, stop):
+        point = sweep_point(axes, index, mode)
+        point_source = f"{source} [sweep point {index}]"
+        if output_dir is not None:
+            output_path = os.path.join(output_dir, _point_file_name(prefix, index, num_points))
+            write_sizes_probe_subckt(point, output_path, point_source, chip_config)
+        else:
+            if index > 0:
+                alter_text.write(f"\n.alter sweep_point_{index}\n")
+            write_sizes_probe_subckt(point, alter_text, point_source, chip_config)
+    return None if output_dir is not None else alter_text.getvalue()
+
+
+def run_sweep(sizes, source, output, mode="product", alter=False, workers=None, chunk_size=None, prefix="PK_set_sizes",
+              compact=False):
+    """
+    Generates the PK_set_sizes_2 netlists of all sweep points.
+
+    Args:
+        sizes (dict): Parsed sizing JSON whose size lists are the sweep axes.
+        source (str): Name of the sizing description, recorded in the headers.
+        output (str): Output directory, or the output file if `alter` is set.
+        mode (str): "product" or "zip".
+        alter (bool): Write a single netlist with one `.alter` block per point.
+        workers (int): Number of worker processes (default: all cores); 1 renders in-process.
+        chunk_size (int): Points per chunk (default: about 4 chunks per worker).
+        prefix (str): File name prefix of the per-point netlists.
+        compact (bool): With `alter`, write the subcircuit once and only the changed size bits per point.
+
+    Returns:
+        SweepResult: Number of points and chunks, workers used and elapsed time.
+    """
+    start_time = time.perf_counter()
+
+    axes = sweep_axes(sizes)
+    num_points = count_points(axes, mode)
+
+    if alter and compact:
+        from commandline.diff import write_diff_netlist
+
+        points = [sweep_point(axes, index, mode) for index in range(num_points)]
+        variants = [(f"{source} [sweep point {index}]", point) for index, point in enumerate(points) if index > 0]
+        write_diff_netlist(points[0], variants, "sizes", output, f"{source} [sweep point 0]")
+        return SweepResult(points=num_points, chunks=1, workers=1, elapsed=time.perf_counter() - start_time)
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunk_size = max(1, chunk_size or -(-num_points // (workers * 4)))
+    chunks = chunk_ranges(num_points, chunk_size)
+    workers = min(workers, len(chunks))
+
+    output_dir = None if alter else output
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        # Record which sizes went into which file
+        with open(os.path.join(output_dir, f"{prefix}_points.jsonl"), "w") as f:
+            for index in range(num_points):
+                f.write(json.dumps({"index": index, "file": _point_file_name(prefix, index, num_points),
+                                    "sizes": sweep_point(axes, index, mode)}) + "\n")
+
+    args = [(axes, mode, start, stop, source, output_dir, prefix, num_points) for start, stop in chunks]
+    if workers == 1:
+        results = [_render_chunk(*chunk_args) for chunk_args in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() returns the results in chunk order, which keeps the .alter file deterministic
+            results = list(executor.map(_render_chunk, *zip(*args)))
+
+    if alter:
+        with open(output, "w") as f:
+            f.writelines(results)
+
+    return SweepResult(points=num_points, chunks=len(chunks), workers=workers,
+                       elapsed=time.perf_counter() - start_time)
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate PK_set_sizes_2 subcircuits for all combinations of the size lists in a sizing JSON."
+    )
+    parser.add_argument("sizes_file", help="Path to the JSON file containing the device size lists.")
+    parser.add_argument("output", help="Output directory (one netlist per point), or output file with --alter.")
+    parser.add_argument("--mode", choices=SWEEP_MODES, default="product",
+                        help="Combine the size lists as a cartesian product (default) or element-wise.")
+    parser.add_argument("--alter", action="store_true", help="Write one netlist with an .alter block per point.")
+    parser.add_argument("--compact", action="store_true",
+                        help="With --alter, write the subcircuit once and only the changed size bits per point.")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: all cores).")
+    parser.add_argument("--chunk-size", type=int, help="Number of sweep points per worker task.")
+    parser.add_argument("--prefix", default="PK_set_sizes", help="File name prefix of the per-point netlists.")
+
+    args = parser.parse_args(argv)
+
+    with open(args.sizes_file, "r") as f:
+        sizes = json.load(f)
+
+    try:
+        result = run_sweep(sizes, args.sizes_file, args.output, mode=args.mode, alter=args.alter,
+                           workers=args.jobs, chunk_size=args.chunk_size, prefix=args.prefix, compact=args.compact)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rate = result.points / result.elapsed if result.elapsed > 0 else float("inf")
+    print(f"Generated {result.points} sweep points in {result.chunks} chunks on {result.workers} workers "
+          f"in {result.elapsed:.2f} s ({rate:.1f} points/s) into {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
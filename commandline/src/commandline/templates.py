@@ -0,0 +1,163 @@
+"""
+Access to the SPICE subckt templates in `subckt_templates/`.
+
+Templates are read once per process, so batch runs do not re-read them for
+every design. Each template is also split once into its preamble and its
+`.SUBCKT` statement, and the header and footer the generators write are
+rendered from that:
+
+    from commandline.templates import SWITCH_MATRIX_TEMPLATE, subckt_template
+
+    template = subckt_template(SWITCH_MATRIX_TEMPLATE)
+    template.subckt         # "PK_set_SWMATRIX"
+    template.ports[-2:]     # ("VDD", "VSS")
+
+Users can replace a template with their own variant, e.g. with a different
+port order, without editing the package:
+
+    register_template(SWITCH_MATRIX_TEMPLATE, "my_PK_set_SWMATRIX.cir")
+
+or by pointing MOSBIUS_TEMPLATE_DIR at a directory with files named like
+the packaged templates. A variant must define the same subcircuit with the
+same ports as the template it replaces, in any order.
+
+Environment variables:
+    MOSBIUS_TEMPLATE_DIR: directory whose templates replace the packaged ones
+        of the same file name (read at the first use of a template)
+"""
+
+import functools
+import os
+from dataclasses import dataclass
+from typing import Tuple
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "subckt_templates")
+TEMPLATE_DIR_ENV = "MOSBIUS_TEMPLATE_DIR"
+
+SWITCH_MATRIX_TEMPLATE = "PK_set_SWMATRIX_template.cir"
+SIZES_TEMPLATE = "PK_set_sizes_template.cir"
+PINS_TO_RBUS_SBUS_TEMPLATE = "PK_pins_to_RBUS_SWBUS_template.cir"
+NODES_TEMPLATE = "PK_NODE_external_connections_template.cir"
+
+# Template name -> path of a user variant (see register_template)
+_registered_templates = {}
+
+
+@dataclass(frozen=True)
+class SubcktTemplate:
+    """A template split into its parts, with the header and footer the generators write"""
+    name: str
+    path: str
+    preamble: str          # Comments and simulator options before the .SUBCKT statement
+    subckt: str            # Subcircuit name
+    ports: Tuple[str, ...]
+    header: str            # Template text, always ending with a newline
+    footer: str = ".ENDS\n"
+
+
+def template_path(name):
+    """Returns the path of the template file `name`: the registered variant, else from
+    MOSBIUS_TEMPLATE_DIR, else the packaged file."""
+    if name in _registered_templates:
+        return _registered_templates[name]
+    user_dir = os.environ.get(TEMPLATE_DIR_ENV)
+    if user_dir and os.path.isfile(os.path.join(user_dir, name)):
+        return os.path.join(user_dir, name)
+    return os.path.join(TEMPLATE_DIR, name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name):
+    """Returns the text of the template file `name`."""
+    with open(template_path(name), "r") as f:
+        return f.read()
+
+
+def split_subckt(text):
+    """
+    Splits template text at its `.SUBCKT` statement.
+
+    Returns:
+        tuple: (preamble, subcircuit name, ports), with the ports of the
+            `.SUBCKT` line and its `+` continuation lines.
+
+    Raises:
+        ValueError: If the text has no `.SUBCKT` statement.
+    """
+    lines = text.splitlines(keepends=True)
+    for start, line in enumerate(lines):
+        words = line.split()
+        if words and words[0].upper() == ".SUBCKT":
+            break
+    else:
+        raise ValueError("The template has no .SUBCKT statement")
+
+    statement = words[1:]
+    for line in lines[start + 1:]:
+        stripped = line.strip()
+        if not stripped.startswith("+"):
+            break
+        statement += stripped[1:].split()
+    if not statement:
+        raise ValueError("The .SUBCKT statement of the template has no subcircuit name")
+    return "".join(lines[:start]), statement[0], tuple(statement[1:])
+
+
+def check_variant(name, text, path):
+    """
+    Checks that the template text read from `path` can replace the packaged template `name`.
+
+    Raises:
+        ValueError: If the text does not define the same subcircuit with the same ports.
+    """
+    _, subckt, ports = split_subckt(text)
+    with open(os.path.join(TEMPLATE_DIR, name), "r") as f:
+        _, packaged_subckt, packaged_ports = split_subckt(f.read())
+    if subckt == packaged_subckt and sorted(ports) == sorted(packaged_ports):
+        return
+    missing = sorted(set(packaged_ports) - set(ports))
+    extra = sorted(set(ports) - set(packaged_ports))
+    raise ValueError(
+        f"Template {path} must define {packaged_subckt} with the ports of {name}"
+        + (f"; it defines {subckt}" if subckt != packaged_subckt else "")
+        + (f"; missing {' '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}" if missing else "")
+        + (f"; extra {' '.join(extra[:5])}{' ...' if len(extra) > 5 else ''}" if extra else "")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def subckt_template(name):
+    """
+    Returns the `SubcktTemplate` of the template file `name`, parsed once per process.
+
+    Raises:
+        ValueError: If a variant from MOSBIUS_TEMPLATE_DIR does not match the packaged template.
+    """
+    text = load_template(name)
+    path = template_path(name)
+    if os.path.dirname(path) != TEMPLATE_DIR and name not in _registered_templates:
+        check_variant(name, text, path)
+    preamble, subckt, ports = split_subckt(text)
+    header = text if text.endswith("\n") else text + "\n"
+    return SubcktTemplate(name, path, preamble, subckt, ports, header)
+
+
+def register_template(name, path):
+    """
+    Replaces the template `name` (e.g. SWITCH_MATRIX_TEMPLATE) with the file at `path` for this process.
+
+    Args:
+        name (str): File name of the packaged template.
+        path (str): Path to the variant, or None to restore the packaged template.
+
+    Raises:
+        ValueError: If the variant does not define the same subcircuit with the same ports.
+    """
+    if path is not None:
+        with open(path, "r") as f:
+            check_variant(name, f.read(), path)
+        _registered_templates[name] = os.path.abspath(path)
+    else:
+        _registered_templates.pop(name, None)
+    load_template.cache_clear()
+    subckt_template.cache_clear()
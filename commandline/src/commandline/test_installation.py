@@ -6,13 +6,18 @@ This script verifies the installation and functionality of MOSbiusV2Tools comman
 2. generate_pins_to_RBUS_SBUS_subckt
 3. generate_switch_matrix_probe_subckt
 4. generate_nodes_subckt
+
+The tools are run in-process through their `main()` functions, so the test
+does not pay for one interpreter start per tool.
 """
 
+import io
 import os
 import sys
 import shutil
 import tempfile
-import subprocess
+import contextlib
+import importlib
 from dataclasses import dataclass
 from typing import Dict, List, Optional
 import importlib.util
@@ -46,8 +51,8 @@ class MOSbiusTestConfig:
     REQUIRED_FILES = {test.input_file for test in TESTS}
 
     def __init__(self):
-        self.examples_dir = self._find_examples()
         self.dev_mode = '--dev' in sys.argv
+        self.examples_dir = self._find_examples()
 
     def _find_examples(self) -> Optional[str]:
         """Find the directory containing example files"""
@@ -64,7 +69,7 @@ class MOSbiusTestConfig:
         
         if self.dev_mode:
             # In dev mode, look in repository examples directory
-            paths = [os.path.join(script_dir, '..', '..', '..', '..', 'examples')]
+            paths = [os.path.join(script_dir, '..', '..', '..', 'examples')]
         else:
             # In installed mode, look in mosbiusv2tools_examples
             paths = [os.path.join(sys.prefix, 'mosbiusv2tools_examples')]
@@ -103,28 +108,18 @@ class MOSbiusTestRunner:
         self.results: Dict[str, bool] = {}
 
     def run_command(self, test_case: TestCase, output_file: str) -> bool:
-        """Run a single command and verify its output"""
-        cmd_parts = test_case.command.split('_')
-        
-        if self.config.dev_mode:
-            cmd = [sys.executable, '-m', f'commandline.{".".join(cmd_parts)}']
-        else:
-            if not shutil.which(test_case.command):
-                print(f"✗ Command '{test_case.command}' not found in PATH")
-                return False
-            cmd = [test_case.command]
+        """Run a single command in-process and verify its output"""
+        if not self.config.dev_mode and not shutil.which(test_case.command):
+            print(f"✗ Command '{test_case.command}' not found in PATH")
+            return False
 
         input_path = os.path.join(self.config.examples_dir, test_case.input_file)
-        cmd.extend([input_path, output_file])
+        log = io.StringIO()
 
         try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=True
-            )
+            module = importlib.import_module(f"commandline.{test_case.command}")
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                module.main([input_path, output_file])
             
             if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                 print(f"✓ {test_case.description}: PASS")
@@ -133,9 +128,9 @@ class MOSbiusTestRunner:
                 print(f"✗ {test_case.description}: Output file empty or missing")
                 return False
                 
-        except subprocess.CalledProcessError as e:
+        except SystemExit as e:
             print(f"✗ {test_case.description}: Command failed")
-            print(f"  Error: {e.stderr}")
+            print(f"  Error: {log.getvalue()}")
             return False
         except Exception as e:
             print(f"✗ {test_case.description}: Unexpected error")
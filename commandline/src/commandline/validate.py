@@ -0,0 +1,235 @@
+"""
+Validation of circuit and sizing descriptions: `mosbius validate`.
+
+The generators skip bad entries with a printed warning while they write.
+This module checks a whole description up front, in one pass over its
+entries with constant-time lookups in the `ChipConfig` tables. It returns
+structured diagnostics instead of printing, so automated searches can reject
+invalid candidates before generating any netlist:
+
+    from commandline.validate import has_errors, validate_circuit
+
+    if has_errors(validate_circuit(candidate)):
+        continue
+
+Errors are entries the netlists cannot represent (unknown buses or pins,
+pins without a switch to the bus, a pin on two RBUSes or external nodes,
+conflicting SBUS phases). Warnings are entries that are ignored or look
+unintended.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from commandline.chip_config import RBUSES, SBUSES, load_chip_config
+from commandline.registers import SBUS_CONNECTION_VALUES
+
+ERROR = "error"
+WARNING = "warning"
+KINDS = ("circuit", "sizes")
+SUPPLIES = ("VDD", "VSS")
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """One finding of the validator"""
+    severity: str       # ERROR or WARNING
+    code: str           # e.g. "unknown-pin"
+    message: str
+    bus: Optional[str] = None
+    pin: Optional[str] = None
+
+    def __str__(self):
+        return f"{self.severity}: {self.message} [{self.code}]"
+
+
+def has_errors(diagnostics):
+    """Returns True if any diagnostic is an error."""
+    return any(diagnostic.severity == ERROR for diagnostic in diagnostics)
+
+
+def _node_number(key):
+    """Returns n for a "NODE<n>" key, else None."""
+    if key.startswith("NODE<") and key.endswith(">") and key[5:-1].isdigit():
+        return int(key[5:-1])
+    return None
+
+
+def validate_circuit(circuit, chip_config=None):
+    """
+    Checks a circuit description.
+
+    Args:
+        circuit (dict): Parsed circuit JSON.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Returns:
+        list[Diagnostic]: The findings in circuit order; empty if the circuit is clean.
+    """
+    chip_config = chip_config or load_chip_config()
+    pin_number = chip_config.pin_number
+    diagnostics = []
+
+    def report(severity, code, message, bus=None, pin=None):
+        diagnostics.append(Diagnostic(severity, code, message, bus, pin))
+
+    if not isinstance(circuit, dict):
+        report(ERROR, "not-a-circuit", "A circuit description must be a JSON object")
+        return diagnostics
+
+    # Reverse indexes built during the pass: pin -> static net (RBUS, NODE or supply),
+    # and register -> (bus, pin, value, connection) of the entry that set it
+    pin_net = {}
+    register_owner = {}
+
+    for bus, entries in circuit.items():
+        is_rbus = bus in RBUSES
+        is_sbus = bus in SBUSES
+        if not (is_rbus or is_sbus or bus in SUPPLIES or _node_number(bus) is not None):
+            report(ERROR, "unknown-bus", f"Unknown bus '{bus}'; use RBUS1-8, SBUS1-6, NODE<n>, VDD or VSS", bus)
+            continue
+        if not isinstance(entries, list):
+            report(ERROR, "not-a-list", f"{bus} must be a list", bus)
+            continue
+
+        seen = set()
+        for entry in entries:
+            if is_sbus:
+                if not isinstance(entry, dict) or "terminal" not in entry or "connection" not in entry:
+                    report(ERROR, "bad-sbus-entry", f"{bus} entries need a 'terminal' and a 'connection'", bus)
+                    continue
+                pin, connection = entry["terminal"], entry["connection"]
+            else:
+                pin, connection = entry, None
+            if not isinstance(pin, str):
+                report(ERROR, "unknown-pin", f"Pin {pin!r} on {bus} is not a pin name", bus)
+                continue
+
+            if pin in seen:
+                report(WARNING, "duplicate-pin", f"Pin '{pin}' is listed more than once on {bus}", bus, pin)
+            seen.add(pin)
+
+            # Internal buses (internal_A..D) only exist in the switch matrix, package pins may not
+            sw_matrix_pin = chip_config.sw_matrix_pin(pin)
+            if pin not in pin_number and sw_matrix_pin is None:
+                report(ERROR, "unknown-pin", f"Pin '{pin}' on {bus} not found in pin mapping", bus, pin)
+                continue
+
+            if not is_sbus:
+                net = pin_net.setdefault(pin, bus)
+                if net != bus:
+                    report(ERROR, "multiple-buses", f"Pin '{pin}' is on both {net} and {bus}", bus, pin)
+            if not (is_rbus or is_sbus):
+                if pin not in pin_number:
+                    report(ERROR, "no-package-pin", f"'{pin}' on {bus} is not a package pin", bus, pin)
+                continue
+
+            # Switch-matrix connections: every register must exist and be set consistently
+            if sw_matrix_pin is None:
+                report(ERROR, "no-switch", f"Pin '{pin}' has no switch-matrix connection to {bus}", bus, pin)
+                continue
+            if is_rbus:
+                settings = ((bus, 1),)
+            else:
+                if connection not in SBUS_CONNECTION_VALUES:
+                    report(WARNING, "unknown-connection",
+                           f"Connection '{connection}' of '{pin}' on {bus} is not one of "
+                           f"{', '.join(SBUS_CONNECTION_VALUES)}; the switches stay off", bus, pin)
+                values = SBUS_CONNECTION_VALUES.get(connection, (0, 0))
+                settings = ((f"{bus}a", values[0]), (f"{bus}b", values[1]))
+            for switch_bus, value in settings:
+                register = chip_config.register(pin, switch_bus)
+                if register is None:
+                    report(ERROR, "no-register", f"No register connects '{pin}' to {switch_bus}", bus, pin)
+                    break
+                owner = register_owner.setdefault(register, (bus, pin, value, connection))
+                if owner[2] != value:
+                    report(ERROR, "sbus-conflict",
+                           f"'{pin}' is set to both {owner[3]} and {connection} on {bus}", bus, pin)
+                    break
+
+        # PK_pins_to_RBUS_SWBUS brings an RBUS out on the package pin of its first pin
+        if is_rbus and entries and not any(isinstance(pin, str) and pin in pin_number for pin in entries):
+            report(WARNING, "no-package-pin", f"{bus} has no package pin and is not brought out", bus)
+
+    return diagnostics
+
+
+def validate_sizes(sizes, chip_config=None):
+    """
+    Checks a sizing description.
+
+    Args:
+        sizes (dict): Parsed sizing JSON.
+        chip_config (ChipConfig): Chip configuration; defaults to the packaged one.
+
+    Returns:
+        list[Diagnostic]: The findings in file order; empty if the sizing is clean.
+    """
+    devices = (chip_config or load_chip_config()).sizing_registers
+    diagnostics = []
+    if not isinstance(sizes, dict):
+        return [Diagnostic(ERROR, "not-a-sizing", "A sizing description must be a JSON object")]
+
+    for device, values in sizes.items():
+        if device not in devices:
+            diagnostics.append(Diagnostic(WARNING, "unknown-device", f"Unknown device '{device}' is ignored", device))
+            continue
+        if not isinstance(values, list):
+            diagnostics.append(Diagnostic(ERROR, "not-a-list", f"The size of {device} must be a list", device))
+            continue
+        for size in values:
+            if isinstance(size, bool) or not isinstance(size, int) or not 0 <= size <= 31:
+                diagnostics.append(Diagnostic(ERROR, "bad-size", f"Size {size!r} for device {device} "
+                                              f"is not a 5-bit number", device))
+    return diagnostics
+
+
+def validate(data, kind="circuit", chip_config=None):
+    """Checks a parsed circuit ("circuit") or sizing ("sizes") JSON and returns the diagnostics."""
+    if kind == "circuit":
+        return validate_circuit(data, chip_config)
+    if kind == "sizes":
+        return validate_sizes(data, chip_config)
+    raise ValueError(f"Unknown kind '{kind}'; use one of {', '.join(KINDS)}")
+
+
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Check circuit or sizing JSON files against the chip configuration without generating netlists."
+    )
+    parser.add_argument("files", nargs="+", help="JSON files to check.")
+    parser.add_argument("--kind", choices=KINDS, default="circuit", help="What the files describe (default: circuit).")
+    parser.add_argument("--json", action="store_true", help="Print the diagnostics as JSON lines.")
+    parser.add_argument("--strict", action="store_true", help="Also fail on warnings.")
+
+    args = parser.parse_args(argv)
+
+    chip_config = load_chip_config()
+    failed = False
+    for path in args.files:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            diagnostics = [Diagnostic(ERROR, "unreadable", str(e))]
+        else:
+            diagnostics = validate(data, args.kind, chip_config)
+
+        for diagnostic in diagnostics:
+            if args.json:
+                print(json.dumps(dict(asdict(diagnostic), file=path)))
+            else:
+                print(f"{path}: {diagnostic}")
+        failed |= has_errors(diagnostics) or (args.strict and bool(diagnostics))
+        if not diagnostics and not args.json:
+            print(f"{path}: ok")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())